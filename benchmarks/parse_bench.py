@@ -0,0 +1,344 @@
+"""
+Banc d'essai hors ligne du parsing, sur des pages HTML enregistrées de chaque site.
+
+Pour chaque site, benchmarks/fixtures/<SITE_KEY>/ contient une page de liste
+(listing.html), une page produit (product.html, sauf MTN dont les produits sont décrits
+par leurs cartes) et fixture.json (url racine et catégorie passées aux parseurs). Pour
+chaque parseur HTML installé (html_parsers.BACKENDS), le banc mesure :
+
+- listing : construction du document et `parse_listing_page` (pipeline.parse_listing) ;
+- product : construction du document et `parse_product_details` du premier produit de la
+  page de liste (MTN : `parse_single_product` de chaque carte) ;
+- pages par seconde (médiane des répétitions), pic de mémoire d'une page (tracemalloc) ;
+- temps d'extraction de chaque champ de PRODUCT_FIELDS, isolé (une Spec par champ).
+
+Les pages par seconde sont comparées à benchmarks/baseline.json : une baisse de plus de
+THRESHOLD est une régression, et le script sort avec le code 1. Les mesures dépendent de
+la machine : la référence s'enregistre (--save-baseline) sur la machine qui compare, avec
+son nom d'hôte et sa version de Python, et n'est pas versionnée. Une référence enregistrée
+sur une autre machine, ou avec un autre Python, n'est pas comparée.
+Aucune requête réseau, sauf avec --record, qui remplace les pages d'un site par ses pages
+actuelles.
+
+    python -m benchmarks.parse_bench [--sites mtn iliko] [--backends lxml] [--save-baseline]
+"""
+import argparse
+import datetime as dt
+import importlib.util
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+
+from scrapping_scripts import extraction, html_parsers, http_session, pipeline
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+FIXTURES_DIR = os.path.join(BENCH_DIR, "fixtures")
+BASELINE_PATH = os.path.join(BENCH_DIR, "baseline.json")
+
+# Baisse relative des pages par seconde au-delà de laquelle une mesure est une régression
+THRESHOLD = 0.2
+# Durée minimum des répétitions d'une mesure, en secondes, et nombre minimum de répétitions
+MIN_TIME = 1.0
+MIN_RUNS = 5
+# Répétitions de l'extraction d'un champ isolé
+FIELD_RUNS = 50
+
+# Module installé requis par chaque parseur optionnel
+_REQUIRED_MODULES = {"lxml": "lxml", "selectolax": "selectolax"}
+
+
+def site_modules():
+    """
+    Modules des six sites, par SITE_KEY (importés à la demande : scrapping.py importe tout le crawler).
+    """
+    import scrapping
+
+    return {module.SITE_KEY: module for module in scrapping.SITE_MODULES}
+
+
+def available_backends():
+    """
+    Parseurs HTML installés sur la machine.
+    """
+    return [backend for backend in html_parsers.BACKENDS
+            if backend not in _REQUIRED_MODULES or importlib.util.find_spec(_REQUIRED_MODULES[backend])]
+
+
+def load_fixture(site_key):
+    """
+    Pages enregistrées d'un site.
+
+    return :
+        - fixture (dict) : base_url, category, listing (bytes), product (bytes ou None)
+    """
+    directory = os.path.join(FIXTURES_DIR, site_key)
+    with open(os.path.join(directory, "fixture.json"), encoding="utf-8") as file:
+        fixture = json.load(file)
+    for page in ("listing", "product"):
+        path = os.path.join(directory, f"{page}.html")
+        fixture[page] = None
+        if os.path.exists(path):
+            with open(path, "rb") as file:
+                fixture[page] = file.read()
+    return fixture
+
+
+def _timed(function, min_time=MIN_TIME):
+    """
+    Répète `function` pendant au moins `min_time` secondes.
+
+    return :
+        - seconds (float) : durée médiane d'un appel
+        - result : résultat du dernier appel
+    """
+    durations = []
+    result = None
+    started = time.perf_counter()
+    while len(durations) < MIN_RUNS or time.perf_counter() - started < min_time:
+        start = time.perf_counter()
+        result = function()
+        durations.append(time.perf_counter() - start)
+    return statistics.median(durations), result
+
+
+def _peak_memory(function):
+    tracemalloc.start()
+    try:
+        function()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def _field_times(spec, root):
+    """
+    Temps d'extraction de chaque champ, seul dans sa Spec, en microsecondes.
+    """
+    times = {}
+    for name, field in spec.fields.items():
+        single = extraction.Spec({name: field})
+        durations = []
+        for _ in range(FIELD_RUNS):
+            start = time.perf_counter()
+            try:
+                single.extract(root)
+            except AttributeError:
+                # Champ obligatoire absent de la page : le temps de recherche compte quand même
+                pass
+            durations.append(time.perf_counter() - start)
+        times[name] = round(statistics.median(durations) * 1e6, 1)
+    return times
+
+
+def bench_site(module, fixture, min_time=MIN_TIME):
+    """
+    Mesure le parsing des pages d'un site avec le parseur configuré.
+
+    return :
+        - result (dict) : {"listing", "product"} -> {"pages_per_second", "peak_kb", "items"},
+          et "fields" -> {champ: microsecondes}
+    """
+    base_url, category = fixture["base_url"], fixture["category"]
+
+    def parse_listing():
+        return pipeline.parse_listing(module, fixture["listing"], category, base_url)
+
+    seconds, product_args = _timed(parse_listing, min_time)
+    if not product_args:
+        raise ValueError(f"{module.SITE_KEY} : aucun produit trouvé sur la page de liste enregistrée")
+    result = {"listing": {"pages_per_second": round(1 / seconds, 1),
+                          "peak_kb": round(_peak_memory(parse_listing) / 1e3), "items": len(product_args)}}
+
+    if getattr(module, "DETAIL_PAGES", True):
+        def parse_product():
+            soup = html_parsers.make_soup(fixture["product"], module.SITE_KEY)
+            return [module.parse_product_details(soup, *product_args[0])]
+
+        root = html_parsers.make_soup(fixture["product"], module.SITE_KEY)
+    else:
+        # MTN : les produits sont extraits des cartes de la page de liste déjà parsée
+        cards = [card for _, card in product_args]
+
+        def parse_product():
+            return [module.parse_single_product(card) for card in cards]
+
+        root = cards[0]
+    seconds, products = _timed(parse_product, min_time)
+    if not all(products):
+        raise ValueError(f"{module.SITE_KEY} : l'extraction de la page produit enregistrée a échoué")
+    result["product"] = {"pages_per_second": round(1 / seconds, 1),
+                         "peak_kb": round(_peak_memory(parse_product) / 1e3), "items": len(products)}
+    result["fields"] = _field_times(module.PRODUCT_FIELDS, root)
+    return result
+
+
+def run(sites=None, backends=None, min_time=MIN_TIME):
+    """
+    Mesure tous les sites avec tous les parseurs.
+
+    return :
+        - results (dict) : {parseur: {SITE_KEY: résultat de bench_site}}
+    """
+    modules = site_modules()
+    results = {}
+    for backend in backends or available_backends():
+        html_parsers.configure(backend)
+        for site_key in sites or modules:
+            print(f"{backend} / {site_key}...", file=sys.stderr)
+            results.setdefault(backend, {})[site_key] = bench_site(modules[site_key], load_fixture(site_key), min_time)
+    return results
+
+
+def compare(results, baseline, threshold=THRESHOLD):
+    """
+    Compare les pages par seconde à la référence.
+
+    return :
+        - regressions (list) : (parseur, site, étape, référence, mesure)
+    """
+    regressions = []
+    for backend, sites in results.items():
+        for site_key, result in sites.items():
+            for stage in ("listing", "product"):
+                reference = baseline.get(backend, {}).get(site_key, {}).get(stage)
+                measured = result[stage]["pages_per_second"]
+                if reference and measured < reference * (1 - threshold):
+                    regressions.append((backend, site_key, stage, reference, measured))
+    return regressions
+
+
+def report(results, baseline):
+    """
+    Tableau des mesures, avec la variation par rapport à la référence.
+    """
+    lines = [f"{'backend':<12}{'site':<14}{'stage':<9}{'pages/s':>10}{'vs base':>9}{'peak kB':>9}{'items':>7}"]
+    for backend, sites in results.items():
+        for site_key, result in sites.items():
+            for stage in ("listing", "product"):
+                measure = result[stage]
+                reference = baseline.get(backend, {}).get(site_key, {}).get(stage)
+                change = f"{100 * (measure['pages_per_second'] / reference - 1):+.0f}%" if reference else "-"
+                lines.append(f"{backend:<12}{site_key:<14}{stage:<9}{measure['pages_per_second']:>10}{change:>9}"
+                             f"{measure['peak_kb']:>9}{measure['items']:>7}")
+            slowest = sorted(result["fields"].items(), key=lambda item: -item[1])
+            lines.append(f"{'':<26}fields (µs): " + ", ".join(f"{name} {us}" for name, us in slowest))
+    return "\n".join(lines)
+
+
+def machine():
+    """
+    Machine des mesures : une référence n'est comparable que sur la machine qui l'a enregistrée.
+    """
+    return {"host": platform.node(), "python": platform.python_version()}
+
+
+def load_baseline(path=None):
+    """
+    Pages par seconde de référence ; vide sans référence, ou si elle vient d'une autre machine.
+    """
+    path = path or BASELINE_PATH
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as file:
+        saved = json.load(file)
+    if saved.get("machine") != machine():
+        return {}
+    return saved["pages_per_second"]
+
+
+def save_baseline(results, path=None):
+    """
+    Enregistre les pages par seconde mesurées comme référence de la machine (les autres
+    parseurs et sites de sa référence sont gardés).
+    """
+    path = path or BASELINE_PATH
+    baseline = load_baseline(path)
+    for backend, sites in results.items():
+        for site_key, result in sites.items():
+            baseline.setdefault(backend, {})[site_key] = {
+                stage: result[stage]["pages_per_second"] for stage in ("listing", "product")
+            }
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump({"recorded_at": dt.datetime.now().isoformat(timespec="seconds"), "machine": machine(),
+                   "pages_per_second": baseline}, file, indent=2, sort_keys=True)
+
+
+def record(site_urls):
+    """
+    Remplace les pages enregistrées des sites par leurs pages actuelles (seule étape en ligne) :
+    la première page de liste de la première catégorie et la page de son premier produit.
+    """
+    import scrapping
+
+    for url in site_urls:
+        module = scrapping.site_module(url)
+        if hasattr(module, "get_categories"):
+            category = module.get_categories(url)[0]
+        else:
+            category = {"Nom": None, "URL": url}
+        listing = http_session.fetch(pipeline.listing_url(module, category, 1), "listing")
+        listing.raise_for_status()
+        directory = os.path.join(FIXTURES_DIR, module.SITE_KEY)
+        os.makedirs(directory, exist_ok=True)
+        pages = {"listing": listing.content}
+        if getattr(module, "DETAIL_PAGES", True):
+            product_args = pipeline.parse_listing(module, listing.content, category, url)
+            product = http_session.fetch(product_args[0][0])
+            product.raise_for_status()
+            pages["product"] = product.content
+        for page, content in pages.items():
+            with open(os.path.join(directory, f"{page}.html"), "wb") as file:
+                file.write(content)
+        with open(os.path.join(directory, "fixture.json"), "w", encoding="utf-8") as file:
+            json.dump({"base_url": url, "category": category, "recorded_at": dt.date.today().isoformat()},
+                      file, ensure_ascii=False, indent=2)
+        print(f"{module.SITE_KEY} : pages enregistrées dans {directory}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline benchmark of the listing and product page parsers.")
+    parser.add_argument("--sites", nargs="+", default=None, metavar="SITE",
+                        help="site keys to benchmark (default: every site with fixtures)")
+    parser.add_argument("--backends", nargs="+", default=None, choices=html_parsers.BACKENDS,
+                        help="HTML parsers to benchmark (default: every installed parser)")
+    parser.add_argument("--min-time", type=float, default=MIN_TIME,
+                        help=f"minimum duration of each measure, in seconds (default: {MIN_TIME})")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD,
+                        help=f"relative drop of pages/s reported as a regression (default: {THRESHOLD})")
+    parser.add_argument("--save-baseline", action="store_true",
+                        help=f"save the measures as the new baseline ({os.path.relpath(BASELINE_PATH)})")
+    parser.add_argument("--output", default=None, metavar="JSON",
+                        help="also write the full results (pages/s, peak memory, field times) to this file")
+    parser.add_argument("--record", nargs="*", default=None, metavar="SITE_URL",
+                        help="replace the fixtures with the current pages of these sites (default: every "
+                             "site), then exit; the only step that uses the network")
+    args = parser.parse_args()
+
+    if args.record is not None:
+        import scrapping
+
+        record(args.record or scrapping.SITES_LIST)
+        raise SystemExit(0)
+
+    results = run(args.sites, args.backends, args.min_time)
+    baseline = load_baseline()
+    print(report(results, baseline))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output:
+            json.dump(results, output, ensure_ascii=False, indent=2)
+    if args.save_baseline:
+        save_baseline(results)
+        print(f"Baseline saved to {BASELINE_PATH}")
+        raise SystemExit(0)
+    if not baseline:
+        print(f"No baseline recorded on this machine ({platform.node()}, Python {platform.python_version()}): "
+              f"run with --save-baseline to record one.")
+        raise SystemExit(0)
+    regressions = compare(results, baseline, args.threshold)
+    for backend, site_key, stage, reference, measured in regressions:
+        print(f"REGRESSION {backend} / {site_key} / {stage}: {measured} pages/s, baseline {reference}")
+    raise SystemExit(1 if regressions else 0)
@@ -1,8 +1,19 @@
 # Import the packages
 import os
+import sys
+import glob
 import time
+import shutil
+import subprocess
+import argparse
+import queue
+import multiprocessing as mp
 import pandas as pd
 import datetime as dt
+from scrapping_scripts import archive, host_control, html_parsers, http_cache, http_session, async_engine, fingerprints, frontier, journal, metrics, parquet_store, pipeline, price_history, profiling, schema, shards, sink, url_store
+from scrapping_scripts import (scrapping_script_mtn, scrapping_script_iliko, scrapping_script_carisowo,
+                               scrapping_script_tout_vendu, scrapping_script_coin_afrique,
+                               scrapping_script_bazar_afrique)
 from scrapping_scripts.scrapping_script_mtn import main_mtn
 from scrapping_scripts.scrapping_script_iliko import main_iliko
 from scrapping_scripts.scrapping_script_carisowo import main_carisowo
@@ -13,6 +24,86 @@ from scrapping_scripts.scrapping_script_bazar_afrique import main_bazar_afrique
 SITES_LIST = ["http://carisowo.com", "https://shop.mtn.bj", "https://www.toutvendu.bj",\
               "https://www.iliko.bj", "https://bj.coinafrique.com", "https://bj.bazarafrique.com"]
 
+# Site modules, matched against the site url through their SITE_KEY
+SITE_MODULES = [scrapping_script_carisowo, scrapping_script_mtn, scrapping_script_tout_vendu,
+                scrapping_script_iliko, scrapping_script_coin_afrique, scrapping_script_bazar_afrique]
+
+def site_module(url:str):
+    """
+    Returns the scraping module handling `url`, or None if the site is unknown.
+    """
+    for module in SITE_MODULES:
+        if module.SITE_KEY in url:
+            return module
+    return None
+
+def site_key(url:str) -> str:
+    """
+    Returns the SITE_KEY of the site of `url` (a site or product url), "unknown" if no site matches.
+    """
+    module = site_module(url)
+    return module.SITE_KEY if module else "unknown"
+
+def scrap_site(url:str, engine:str = "threads"):
+    """
+    Scrapes a single site with the chosen engine.
+    
+    Returns:
+        pd.DataFrame: the products of the site (possibly empty), or None if the site is unknown.
+    """
+    module = site_module(url)
+    if module is None:
+        return None
+    if engine == "async":
+        return async_engine.run([(module, url)])[0]
+    if engine == "frontier":
+        return frontier.run([(module, url)])[0]
+    if module is scrapping_script_carisowo:
+        return main_carisowo(url)
+    elif module is scrapping_script_mtn:
+        return main_mtn(url)
+    elif module is scrapping_script_tout_vendu:
+        return main_tout_vendu(url)
+    elif module is scrapping_script_iliko:
+        return main_iliko(url)
+    elif module is scrapping_script_coin_afrique:
+        return main_coin_afrique(url)
+    elif module is scrapping_script_bazar_afrique:
+        return main_bazar_afrique(url)
+
+def _replay_journal(url:str) -> None:
+    """
+    Sends to the streaming sink the products of the site of `url` that an interrupted run
+    committed to the journal but did not get to write.
+    """
+    for product in journal.get_journal(site_key(url)).products(unwritten=True):
+        sink.emit(product)
+
+def _site_worker(url:str, engine:str, results, write_batch=None, batch_size:int = None) -> None:
+    """
+    Entry point of the worker process scraping one site in parallel mode.
+    Sends (url, DataFrame, connection stats, error, streamed products, metrics) back through the `results` queue.
+    With `batch_size`, the worker streams its products to `write_batch` instead of returning them.
+    """
+    # Only the metrics of this site are sent back, not those inherited from the parent process
+    metrics.reset()
+    try:
+        if batch_size:
+            sink.start(write_batch, batch_size)
+            _replay_journal(url)
+        with profiling.profile(site_key(url)):
+            df = scrap_site(url, engine)
+        results.put((url, df, http_session.connection_stats(), None, sink.close(), metrics.snapshot()))
+    except Exception as e:
+        # The batches already written are kept, the last partial batch is flushed too
+        results.put((url, None, http_session.connection_stats(), repr(e), sink.close(), metrics.snapshot()))
+    finally:
+        journal.close_all()
+        url_store.close_all()
+        http_cache.close()
+        fingerprints.close()
+        archive.close()
+
 # Definition of the crawler
 class Crawler:
     """
@@ -20,22 +111,92 @@ class Crawler:
     It maintains:
       - a log file recording important events and actions,
       - a file for storing all URLs encountered or processed,
-      - and a CSV file containing consolidated scraped data.
+      - and a CSV file containing consolidated scraped data, or a Parquet store
+        partitioned by site and scrap date.
     """
     
     # function to initialize the crawler
-    def __init__(self):
+    def __init__(self, store:str = "csv", batch_size:int = None, shard:tuple = None, replay:str = None):
         """
         Initialize the crawler by creating (or overwriting) the necessary log and URL files.
         This method also writes the crawler creation timestamp to the log file.
+        
+        Args:
+            store (str, optional): "csv" (rewrite files/scraped_data.csv) or "parquet"
+                                   (append each run to files/products/). Defaults to "csv".
+            batch_size (int, optional): Stream the products to the store as they are scraped,
+                                        in batches of `batch_size` products, instead of saving
+                                        the whole run at the end. Defaults to None (no streaming).
+            shard (tuple, optional): (index, count): only scrape the product urls of shard `index`
+                                     out of `count` (`scrapping_scripts/shards.py`). The shard keeps
+                                     its state, including its own copy of the seen-urls index, and
+                                     writes its products as pickled DataFrames (whatever the store)
+                                     in files/shards/<index>-of-<count>/, to be merged by `merge_shards`.
+                                     Defaults to None (no sharding).
+            replay (str, optional): Folder of response archives (`--archive`, `scrapping_scripts/archive.py`)
+                                    read by every scraper instead of the network. The replay starts
+                                    from a fresh state, so that every archived page is parsed again,
+                                    and writes its outputs in files/replay/. Defaults to None (network).
         """
+        self.store = store
+        self.batch_size = batch_size
+        files_dir = "./files"
+        # The first time, seed the seen-urls index with the urls of the previous urls file
+        if replay is None and not os.path.exists(url_store.DB_PATH):
+            url_store.import_urls_file("./files/urls_file.txt", [module.SITE_KEY for module in SITE_MODULES])
+        if shard is not None:
+            shards.configure(*shard)
+            files_dir = shards.directory()
+            os.makedirs(files_dir, exist_ok=True)
+            # Each shard records its urls in its own copy of the seen-urls index, merged back by merge_shards
+            shard_urls = os.path.join(files_dir, "urls.sqlite")
+            if not os.path.exists(shard_urls):
+                url_store.import_index(url_store.DB_PATH, shard_urls)
+            url_store.DB_PATH = shard_urls
+            # Typed outputs: a CSV would turn the lists into strings and lose the dtypes before the merge
+            self.store = "pickle"
+            # Shards running side by side must not skip each other's pages
+            journal.DB_PATH = os.path.join(files_dir, "journal.sqlite")
+            http_cache.DB_PATH = os.path.join(files_dir, "http_cache.sqlite")
+            frontier.DB_PATH = os.path.join(files_dir, "frontier.sqlite")
+            # The merged products are added to the main history by merge_shards
+            price_history.DB_PATH = os.path.join(files_dir, "price_history.sqlite")
+        if replay is not None:
+            archive.configure(replay=replay)
+            files_dir = "./files/replay"
+            os.makedirs(files_dir, exist_ok=True)
+            # The seen urls, cache, journal and fingerprints of the live crawl would skip archived pages
+            url_store.DB_PATH = os.path.join(files_dir, "urls.sqlite")
+            journal.DB_PATH = os.path.join(files_dir, "journal.sqlite")
+            http_cache.DB_PATH = os.path.join(files_dir, "http_cache.sqlite")
+            frontier.DB_PATH = os.path.join(files_dir, "frontier.sqlite")
+            fingerprints.DB_PATH = os.path.join(files_dir, "fingerprints.sqlite")
+            price_history.DB_PATH = os.path.join(files_dir, "price_history.sqlite")
+            url_store.reset()
+            journal.reset()
+            http_cache.reset()
+            frontier.reset()
+            fingerprints.reset()
+            price_history.reset()
+        self.log_path = os.path.join(files_dir, "log_file.txt")
+        self.data_path = os.path.join(files_dir, "scraped_data.csv")
+        self.urls_path = os.path.join(files_dir, "urls_file.txt")
+        self.metrics_path = os.path.join(files_dir, "metrics.json")
+        self.prometheus_path = os.path.join(files_dir, "metrics.prom")
+        self.profiles_path = os.path.join(files_dir, "profiles")
+        self.archive_path = archive.DIRECTORY
+        self.products_path = (parquet_store.STORE_PATH if shard is None and replay is None
+                              else os.path.join(files_dir, "products"))
+        # Rows written by the streaming sink, shared with the worker processes;
+        # its lock also serializes the batches appended to the output files
+        self._rows_written = mp.Value("q", 0)
         # Define the date at which the crawler is initialized
         built_date = str(dt.datetime.today())[:-7]
         # Create the log file to store information about the operation executed
-        with open("./files/log_file.txt", "w", encoding="utf-8") as log_file:
+        with open(self.log_path, "w", encoding="utf-8") as log_file:
             log_file.write(f"Crawler created at {built_date}\n\n")
         # The file to store the urls we'll scrap
-        with open ("./files/urls_file.txt", "w", encoding="utf-8") as url_file:
+        with open (self.urls_path, "w", encoding="utf-8") as url_file:
             url_file.write(f"Urls file created at {built_date}\n\n")
 
     # function to reset the state of the crawler
@@ -44,7 +205,9 @@ class Crawler:
         Resets the crawler's state, allowing it to perform fresh scrapes.
         
         This method:
-          - Removes existing log, scraped data, and URL files if they exist.
+          - Removes existing log, scraped data, and URL files if they exist,
+            as well as the seen-urls index, the HTTP cache, the resume journal, the content
+            fingerprints, the price history and the Parquet store.
           - Creates a new log file indicating the reset time.
         Returns:
             None
@@ -52,15 +215,22 @@ class Crawler:
         # Log the reset event
         reset_date = str(dt.datetime.today())[:-7]
         
-        for path in ["./files/log_file.txt", "./files/scraped_data.csv", "./files/urls_file.txt"]:
+        for path in [self.log_path, self.data_path, self.urls_path]:
             if os.path.exists(path):
                 os.remove(path)
+        url_store.reset()
+        http_cache.reset()
+        journal.reset()
+        frontier.reset()
+        fingerprints.reset()
+        price_history.reset()
+        parquet_store.reset(self.products_path)
         
         # Indicate that the file has been reset
-        with open("./files/log_file.txt", "w", encoding="utf-8") as file:
+        with open(self.log_path, "w", encoding="utf-8") as file:
             file.write(f"The crawler has been reset and created on {reset_date}\n")
         
-        with open("./files/urls_file.txt", "w", encoding="utf-8") as uf:
+        with open(self.urls_path, "w", encoding="utf-8") as uf:
             uf.write(f"The url file has been reset and created on {reset_date}\n")
         
         # Return the reset crawler instance
@@ -74,8 +244,12 @@ class Crawler:
         
         This method:
           - Concatenates new scraped data (`new_scraped`) with existing data (`existing_data`) if provided.
-          - Saves the combined dataset to 'scraped_data.csv'.
+          - Saves the combined dataset to 'scraped_data.csv', or with the "parquet" store,
+            appends `new_scraped` only to files/products/ (one file per site and scrap date).
+            A shard writes `new_scraped` to a new pickle file of its products folder instead.
           - Appends newly scraped URLs to 'urls_file.txt'.
+          - Adds the prices and availabilities to the price history
+            (`scrapping_scripts/price_history.py`): a new interval only when they change.
           - Logs the number of new links scraped and the date/time of the scrape.
         
         Args:
@@ -87,92 +261,662 @@ class Crawler:
             None
         """
         
-        # Add the new scraped data to the old scraped data
-        if len(existing_data) == 0:
-            df = new_scraped
+        if self.store == "pickle":
+            self._write_pickle(new_scraped)
+        elif self.store == "parquet":
+            # Append-only: the history already stored is never rewritten
+            parquet_store.append(new_scraped, site_key, self.products_path)
         else:
-            df = pd.concat([existing_data, new_scraped])
-        
-        # Save the new data base
-        df.to_csv("./files/scraped_data.csv")
+            # Add the new scraped data to the old scraped data
+            if len(existing_data) == 0:
+                df = new_scraped
+            else:
+                df = pd.concat([existing_data, new_scraped])
+            
+            # Save the new data base
+            df.to_csv(self.data_path)
         # Modify the urls file to add the new urls scraped
-        with open ("./files/urls_file.txt", "a", encoding="utf-8") as url_file:
+        with open (self.urls_path, "a", encoding="utf-8") as url_file:
             url_file.writelines(new_scraped["Lien_produit"].astype(str) + "\n")
+        changes = price_history.record(new_scraped)
         # Modify the log_file to add the historic of actions
-        with open("./files/log_file.txt", "a") as log_file:
+        with open(self.log_path, "a") as log_file:
             log_file.write(f"{new_scraped['Lien_produit'].count()} new links scraped\n")
+            log_file.write(f"[History] {changes} new price intervals\n")
         
         return None
     
+    # Function to write the products of a shard
+    def _write_pickle(self, df:pd.DataFrame) -> None:
+        """
+        Writes products of a shard to a new pickle file of its products folder, read back
+        with their dtypes and lists by `merge_shards`. The files sort in writing order.
+        
+        Args:
+            df (pd.DataFrame): The products, with the common schema.
+        
+        Returns:
+            None
+        """
+        os.makedirs(self.products_path, exist_ok=True)
+        path = os.path.join(self.products_path, f"{dt.datetime.now():%Y%m%d-%H%M%S-%f}-{os.getpid()}.pkl")
+        # Written under a temporary name: a killed run never leaves a truncated file to merge
+        df.to_pickle(path + ".tmp")
+        os.replace(path + ".tmp", path)
+        return None
+
+    # Function to write one batch of streamed products
+    def _write_batch(self, products:list) -> None:
+        """
+        Writes a batch of products sent by the streaming sink (`scrapping_scripts/sink.py`).
+        
+        The batch gets its "Scrap date" and the common schema, then is appended to
+        'scraped_data.csv' (under the header written by `scrap`), to the Parquet store
+        or, for a shard, to a pickle file; its links are appended to 'urls_file.txt'
+        and its prices to the price history.
+        
+        Args:
+            products (list): The scraped products (dicts) of the batch.
+        
+        Returns:
+            None
+        """
+        batch = pd.DataFrame(products)
+        batch["Scrap date"] = dt.date.today().strftime("%Y-%m-%d")
+        batch = schema.normalize(batch, site_key)
+        with self._rows_written.get_lock():
+            if self.store == "pickle":
+                self._write_pickle(batch)
+            elif self.store == "parquet":
+                parquet_store.append(batch, site_key, self.products_path)
+            else:
+                # Every batch has the columns of the header, and continues its row numbering
+                batch = batch.reindex(columns=list(schema.COLUMNS))
+                batch.index = range(self._rows_written.value, self._rows_written.value + len(batch))
+                batch.to_csv(self.data_path, mode="a", header=False)
+            self._rows_written.value += len(batch)
+            with open (self.urls_path, "a", encoding="utf-8") as url_file:
+                url_file.writelines(batch["Lien_produit"].astype(str) + "\n")
+            price_history.record(batch)
+        # A resumed run must not write these products again
+        for site, urls in batch.groupby("Site", observed=True)["Lien_produit"]:
+            journal.get_journal(site).mark_written(urls)
+        return None
+
+    # Function to scrap all the sites at the same time
+    def _scrap_parallel(self, site_urls:list, engine:str, site_timeout:float = None):
+        """
+        Scrapes every site in its own worker process and merges the results as each site completes.
+        
+        A site that raises, crashes or runs past `site_timeout` is logged and skipped;
+        the other sites keep running.
+        
+        Args:
+            site_urls (list): A list of website URLs to be scraped.
+            engine (str): The crawl engine used inside each worker.
+            site_timeout (float, optional): Seconds after which the remaining sites are stopped.
+        
+        Returns:
+            tuple: the list of non-empty DataFrames, the connection stats per host,
+                   the number of products streamed by the workers and the urls of
+                   the sites that completed.
+        """
+        results = mp.Queue()
+        workers = {}
+        for url in site_urls:
+            if site_module(url) is None:
+                print(f"Skipping unknown site: {url}")
+                continue
+            worker = mp.Process(target=_site_worker, args=(url, engine, results, self._write_batch, self.batch_size),
+                                name=url)
+            worker.start()
+            workers[url] = worker
+
+        data_collected = []
+        connection_stats = {}
+        streamed = 0
+        completed = []
+        start = time.time()
+        while workers:
+            try:
+                url, df, stats, error, written, site_metrics = results.get(timeout=1)
+            except queue.Empty:
+                for url, worker in list(workers.items()):
+                    # A worker that died without sending its result has crashed
+                    if not worker.is_alive() and worker.exitcode != 0:
+                        self._log_site_failure(url, f"worker exited with code {worker.exitcode}")
+                        workers.pop(url)
+                if site_timeout is not None and time.time() - start > site_timeout:
+                    for url, worker in workers.items():
+                        worker.terminate()
+                        worker.join()
+                        self._log_site_failure(url, f"still running after {site_timeout}s, stopped")
+                    workers = {}
+                continue
+
+            workers.pop(url).join()
+            connection_stats.update(stats)
+            metrics.merge(site_metrics)
+            streamed += written
+            if error is not None:
+                self._log_site_failure(url, error)
+                continue
+            completed.append(url)
+            with open(self.log_path, "a", encoding="utf-8") as log_file:
+                count = (0 if df is None else len(df)) + written
+                log_file.write(f"[Scrap] {url} done after {(time.time() - start)/60:.2f} minutes ({count} products)\n")
+            if df is not None and not df.empty:
+                data_collected.append(df)
+        return data_collected, connection_stats, streamed, completed
+
+    # Function to merge the outputs of a sharded crawl
+    def merge_shards(self, count:int) -> None:
+        """
+        Merges the outputs of the `count` shards of a sharded crawl (`--shard i/N`) into the main dataset.
+        
+        This method:
+          - Reads the products of every shard (the pickle files of files/shards/<i>-of-<count>/products/),
+            in shard order, with their dtypes and lists, and drops the duplicates of "Lien_produit".
+          - Adds the seen urls (and listing cards) of every shard's own index to the seen-urls index.
+          - Calls `save_data` to save the merged products, like a single-node run.
+          - Removes the merged shard outputs and the shard's index, so that merging again adds
+            nothing twice and the next run of the shard starts from the updated index.
+        
+        Args:
+            count (int): The number of shards of the crawl.
+        
+        Returns:
+            None
+        """
+        data_collected = []
+        merged = []
+        for index in range(count):
+            shard_dir = shards.directory(index, count)
+            products_path = os.path.join(shard_dir, "products")
+            urls_path = os.path.join(shard_dir, "urls_file.txt")
+            shard_urls = os.path.join(shard_dir, "urls.sqlite")
+            if not os.path.exists(shard_urls):
+                print(f"Shard {index}/{count} has no output, skipped.")
+                with open(self.log_path, "a", encoding="utf-8") as log_file:
+                    log_file.write(f"[Merge] Shard {index}/{count} has no output, skipped\n")
+                continue
+            # One file per save or streamed batch, in writing order
+            frames = [pd.read_pickle(path) for path in sorted(glob.glob(os.path.join(products_path, "*.pkl")))]
+            rows = sum(len(frame) for frame in frames)
+            data_collected.extend(frame for frame in frames if not frame.empty)
+            url_store.import_index(shard_urls)
+            merged.append((index, rows, products_path, urls_path, shard_urls))
+
+        with open(self.log_path, "a", encoding="utf-8") as log_file:
+            for index, rows, *_ in merged:
+                log_file.write(f"[Merge] Shard {index}/{count}: {rows} products\n")
+        if data_collected:
+            final_data = pd.concat(data_collected, ignore_index=True)
+            final_data = final_data.drop_duplicates(subset="Lien_produit", keep="first", ignore_index=True)
+            # Batches with different categories are concatenated as objects: back to the common schema
+            final_data = final_data.astype({column: dtype for column, dtype in schema.COLUMNS.items()
+                                            if column in final_data.columns})
+            self.save_data(final_data)
+        else:
+            print("No data was collected by the shards.")
+            with open(self.log_path, "a", encoding="utf-8") as log_file:
+                log_file.write("No data was collected by the shards.\n")
+        # Only once the data is saved
+        for _, _, products_path, urls_path, shard_urls in merged:
+            shutil.rmtree(products_path, ignore_errors=True)
+            url_store.reset(shard_urls)
+            if os.path.exists(urls_path):
+                os.remove(urls_path)
+        return None
+
+    def enrich(self, urls:list = None) -> None:
+        """
+        Deep pass: scrapes the product pages of products that a shallow run (`--shallow`)
+        only read from their listing card.
+        
+        This method:
+          - Reads, for every site, the card-only urls kept in the seen-urls index with the
+            arguments of their product page (all of them, or only those of `urls`).
+          - Scrapes their product pages (`pipeline.enrich`).
+          - Calls `save_data` to save the complete products, like a regular run; they
+            supersede the card-level rows of the same "Lien_produit".
+          - Forgets the enriched urls, so that the next deep pass skips them.
+        
+        Args:
+            urls (list, optional): The product urls to enrich. Defaults to None (every card-only url).
+        
+        Returns:
+            None
+        """
+        data_collected = []
+        enriched = {}
+        for module in SITE_MODULES:
+            cards = url_store.get_store(module.SITE_KEY).cards(urls)
+            if not cards:
+                continue
+            print(f"Deep pass: {len(cards)} product pages to scrape for {module.SITE_KEY}")
+            products = pipeline.enrich(module, cards)
+            enriched[module.SITE_KEY] = [product["Lien_produit"] for product in products]
+            if products:
+                data_collected.append(pd.DataFrame(products))
+        http_cache.close()
+        with open(self.log_path, "a", encoding="utf-8") as log_file:
+            for site, site_urls in enriched.items():
+                log_file.write(f"[Deep] {site}: {len(site_urls)} products enriched\n")
+        if not data_collected:
+            print("No product was enriched.")
+            url_store.close_all()
+            return None
+        final_data = pd.concat(data_collected, ignore_index=True)
+        final_data["Scrap date"] = dt.date.today().strftime("%Y-%m-%d")
+        final_data = schema.normalize(final_data, site_key)
+        self.save_data(final_data)
+        # Only once the data is saved
+        for site, site_urls in enriched.items():
+            url_store.get_store(site).drop_cards(site_urls)
+        url_store.close_all()
+        return None
+
+    def recrawl(self, sites:list = None) -> None:
+        """
+        Re-crawls the product pages of the products already scraped, to catch their changes
+        (prices...), without re-extracting or re-storing the unchanged ones.
+        
+        This method:
+          - Reads, for every site (or the sites of `sites`), the products whose product-page
+            arguments were kept in the fingerprint store (`scrapping_scripts/fingerprints.py`).
+          - Fetches their product pages and compares the fingerprint of their relevant region
+            (`CONTENT_REGION` of the site module) with the stored one; only the changed pages
+            are parsed (`pipeline.recrawl`).
+          - Calls `save_data` to save the changed products, like a regular run.
+          - Stores the new fingerprints once the changed products are saved.
+        
+        Args:
+            sites (list, optional): SITE_KEYs of the sites to re-crawl. Defaults to None (every site).
+        
+        Returns:
+            None
+        """
+        data_collected = []
+        checked = {}
+        store = fingerprints.get_store()
+        with open(self.log_path, "a", encoding="utf-8") as log_file:
+            log_file.write(f"[Recrawl] {dt.date.today().strftime('%Y-%m-%d')} Re-crawling the known products\n")
+        for module in SITE_MODULES:
+            if not hasattr(module, "CONTENT_REGION") or (sites and module.SITE_KEY not in sites):
+                continue
+            known = store.known(module.SITE_KEY)
+            if not known:
+                continue
+            print(f"Re-crawl: {len(known)} product pages to check for {module.SITE_KEY}")
+            products, digests = pipeline.recrawl(module, known)
+            checked[module.SITE_KEY] = digests
+            if products:
+                data_collected.append(pd.DataFrame(products))
+            with open(self.log_path, "a", encoding="utf-8") as log_file:
+                log_file.write(f"[Recrawl] {module.SITE_KEY}: {len(known)} products, {len(digests)} checked, "
+                               f"{len(products)} changed\n")
+        http_cache.close()
+        if data_collected:
+            final_data = pd.concat(data_collected, ignore_index=True)
+            final_data["Scrap date"] = dt.date.today().strftime("%Y-%m-%d")
+            final_data = schema.normalize(final_data, site_key)
+            self.save_data(final_data)
+        else:
+            print("No product has changed.")
+        # Only once the changed products are saved
+        for site, digests in checked.items():
+            store.update(site, digests)
+        fingerprints.close()
+        return None
+
+    # Function to record a site that could not be scraped
+    def _log_site_failure(self, url:str, reason:str) -> None:
+        print(f"Scrapping of {url} failed: {reason}")
+        with open(self.log_path, "a", encoding="utf-8") as log_file:
+            log_file.write(f"[Scrap] {url} failed: {reason}\n")
+
     # Function to scrap the data
-    def scrap(self, site_urls:list) -> None:
+    def scrap(self, site_urls:list, engine:str = "threads", parallel:bool = False,
+              site_timeout:float = None) -> None:
         """
         Scrapes data from a list of website URLs.
         
         This method:
           - Logs the start time of the scraping process.
           - Iterates through each URL in the `site_urls` list and calls the 
-            appropriate site-specific scraping function.
+            appropriate site-specific scraping function, or runs all sites
+            through the asyncio engine when `engine` is "async", or through the shared
+            crawl frontier and its worker processes when `engine` is "frontier"
+            (`scrapping_scripts/frontier.py`).
+            With `parallel`, every site runs in its own worker process instead.
           - Collects and concatenates all the scraped data into a single DataFrame.
-          - Appends a "Scrap date" column to the final DataFrame.
+          - Appends a "Scrap date" column to the final DataFrame and applies the common
+            typed schema (`scrapping_scripts/schema.py`).
           - Calls `save_data` to save the combined DataFrame.
+            With the crawler's `batch_size`, the products are instead written by batches
+            as they are scraped (`_write_batch`): memory stays bounded, and the products
+            of a batch lost in a crash are written again from the journal by the next run.
+          - Commits every listing page to the resume journal (`scrapping_scripts/journal.py`)
+            once its products are scraped; after an interrupted run, the committed pages
+            are not fetched again and their products are read back from the journal.
+            The journal of a site is cleared once its products are saved.
+          - Records metrics per site and per stage (requests, bytes, status codes, latency and
+            parse time histograms, products, dedup hits, queue depth) and writes them to a JSON
+            run report and a Prometheus text file (`scrapping_scripts/metrics.py`).
+          - With profiling enabled (`--profile`, `scrapping_scripts/profiling.py`), samples
+            the stacks of all threads and traces the memory allocations of each site and of the
+            save stage, and writes their profiles to files/profiles/<run date>/.
           - Logs the outcome of the scraping process, including any errors or empty results.
         
         Args:
             site_urls (list): A list of website URLs to be scraped.
+            engine (str, optional): "threads" (per-page thread pools), "async"
+                                    (one event loop, bounded concurrency per host) or
+                                    "frontier" (SQLite frontier, multi-process workers).
+                                    Defaults to "threads".
+            parallel (bool, optional): Scrape all sites at the same time, one worker
+                                       process per site. Defaults to False.
+            site_timeout (float, optional): In parallel mode, number of seconds after which
+                                            a site still running is stopped. Defaults to None (no limit).
         
         Returns:
             None
         """
         day_date = dt.datetime.today()
-        with open("./files/log_file.txt", "a") as log_file:
+        with open(self.log_path, "a") as log_file:
             log_file.write(f"[Scrap] {day_date.strftime("%Y-%m-%d")} Doing scrapping for {site_urls}\n")
-            log_file.write(f"Scrapping lunched at {day_date.strftime("%H:%M")}\n")
+            log_file.write(f"Scrapping lunched at {day_date.strftime("%H:%M")} with the {engine} engine"
+                           f"{" (full sweep)" if pipeline.FULL else ""}\n")
+            if pipeline.SHALLOW:
+                log_file.write(f"[Scrap] Shallow mode (listing cards only) for {sorted(pipeline.SHALLOW)}\n")
+            if shards.COUNT > 1:
+                log_file.write(f"[Scrap] Shard {shards.INDEX}/{shards.COUNT}: only its product urls are scraped\n")
+            # Sites whose previous run was interrupted: their committed pages are not fetched again
+            resumed = journal.resumed_sites()
+            if resumed:
+                log_file.write(f"[Scrap] Resuming the interrupted run of {resumed}\n")
+            if profiling.ENABLED:
+                # One folder of profiles per run
+                profiling.configure(os.path.join(self.profiles_path, day_date.strftime("%Y-%m-%d_%H-%M-%S")))
+                log_file.write(f"[Profile] CPU and memory profiles are written to {profiling.DIRECTORY}\n")
+            if archive.ENABLED:
+                # One folder of archives per run
+                archive.configure(os.path.join(self.archive_path, day_date.strftime("%Y-%m-%d_%H-%M-%S")))
+                log_file.write(f"[Archive] Raw responses are archived to {archive.DIRECTORY}\n")
+            if archive.REPLAY:
+                log_file.write(f"[Replay] Responses are read from the archives of {archive.REPLAY}, "
+                               f"without network access\n")
 
         data_collected = []  # Will store individual DataFrames from each site
+        completed = []  # Urls of the sites that ran to the end
+        streamed = 0  # Number of products written by the streaming sink
+        if self.batch_size and self.store == "csv":
+            if resumed and os.path.exists(self.data_path):
+                # The batches streamed by the interrupted run are kept, numbering continues after them
+                self._rows_written.value = len(pd.read_csv(self.data_path, usecols=[0]))
+            else:
+                # The header is written once, the batches are then appended to the file
+                pd.DataFrame(columns=list(schema.COLUMNS)).to_csv(self.data_path)
         # The time the scraping started
         start = time.time()
-        for url in site_urls:
-            if "carisowo" in url:
-                df = main_carisowo(url)
-            elif "mtn" in url:
-                df = main_mtn(url)
-            elif "toutvendu" in url:
-                df = main_tout_vendu(url)
-            elif "iliko" in url:
-                df = main_iliko(url)
-            elif "coinafrique" in url:
-                df = main_coin_afrique(url)
-            elif "bazarafrique" in url:
-                df = main_bazar_afrique(url)
-            else:
-                # If none of the conditions match, skip
-                print(f"Skipping unknown site: {url}")
-                continue
+        metrics.reset()
+        if parallel:
+            data_collected, connection_stats, streamed, completed = self._scrap_parallel(site_urls, engine, site_timeout)
+        else:
+            try:
+                if self.batch_size:
+                    sink.start(self._write_batch, self.batch_size)
+                    for url in site_urls:
+                        if site_module(url) is not None:
+                            _replay_journal(url)
+                if engine in ("async", "frontier"):
+                    run_sites = async_engine.run if engine == "async" else frontier.run
+                    sites = []
+                    for url in site_urls:
+                        module = site_module(url)
+                        if module is None:
+                            print(f"Skipping unknown site: {url}")
+                            continue
+                        sites.append((module, url))
+                    # The sites of these engines run together: they are profiled as a whole
+                    with profiling.profile(engine):
+                        dataframes = run_sites(sites)
+                    for (module, url), df in zip(sites, dataframes):
+                        if df is None:
+                            continue
+                        completed.append(url)
+                        if not df.empty:
+                            data_collected.append(df)
+                    connection_stats = http_session.connection_stats()
+                else:
+                    for url in site_urls:
+                        if site_module(url) is None:
+                            # If none of the sites match, skip
+                            print(f"Skipping unknown site: {url}")
+                            continue
+                        # A failing site must not stop the others
+                        try:
+                            with profiling.profile(site_key(url)):
+                                df = scrap_site(url, engine)
+                        except Exception as e:
+                            self._log_site_failure(url, repr(e))
+                            continue
+                        completed.append(url)
             
-            # It's possible that your scraping function returns None or an empty DataFrame;
-            # if you want to skip those, you can do:
-            if df is not None and not df.empty:
-                data_collected.append(df)
+                        # It's possible that your scraping function returns None or an empty DataFrame;
+                        # if you want to skip those, you can do:
+                        if df is not None and not df.empty:
+                            data_collected.append(df)
+                    connection_stats = http_session.connection_stats()
+            finally:
+                # Flush the last partial batch, even if the crawl was interrupted
+                streamed = sink.close()
+        journal.close_all()
+        url_store.close_all()
+        http_cache.close()
+        fingerprints.close()
+        archive.close()
+        duration = time.time() - start
+        run_report = metrics.write(duration, [module.SITE_KEY for module in SITE_MODULES],
+                                   self.metrics_path, self.prometheus_path, engine=engine,
+                                   started_at=day_date.isoformat(timespec="seconds"), site_urls=site_urls)
         # Write in the log file when the scrapping is finished
-        with open("./files/log_file.txt", "a", encoding='utf-8') as lf:
-            lf.write(f"[Scrap] Scrapping finished in {(time.time() - start)/3600:.4f} hours\n")
+        with open(self.log_path, "a", encoding='utf-8') as lf:
+            lf.write(f"[Scrap] Scrapping finished in {duration/3600:.4f} hours\n")
+            # Keep-alive connection reuse per host, and where its adaptive controller ended up
+            for host, stats in connection_stats.items():
+                lf.write(f"[HTTP] {host}: {stats['requests']} requests, "
+                         f"{stats['connections']} connections, {stats['reused']} reused\n")
+                if "limit" in stats:
+                    lf.write(f"[Host] {host}: {stats['limit']} in flight, {stats['rate']} requests/s, "
+                             f"{stats['errors']} errors, {stats['throttled']} throttled, "
+                             f"{stats['retries']} retries, {stats['timeouts']} timeouts, "
+                             f"{stats['breaker_opens']} breaker opens\n")
+            # Per-site summary of the metrics, the details are in the JSON report
+            for site, summary in run_report["sites"].items():
+                lf.write(f"[Metrics] {site}: {summary['requests']} requests, {summary['bytes']/1e6:.1f} MB, "
+                         f"{summary['products']} products ({summary['products_per_second']}/s), "
+                         f"{summary['dedup_hits']} dedup hits, queue depth {summary['queue_depth']}\n")
+            lf.write(f"[Metrics] Report written to {self.metrics_path} and {self.prometheus_path}\n")
+        if self.batch_size:
+            with open(self.log_path, "a") as log_file:
+                log_file.write(f"{streamed} new links scraped\n")
+            # Everything the completed sites scraped is written: their next run starts afresh
+            journal.clear(site_key(url) for url in completed)
+            return
+
         # If no data was collected at all, we can handle that case
         if not data_collected:
             print("No data was collected from the provided URLs.")
-            with open("./files/log_file.txt", "a") as log_file:
+            with open(self.log_path, "a") as log_file:
                 log_file.write(f"No data was collected from the provided URLs.\n")
+            journal.clear(site_key(url) for url in completed)
             return
 
-        # Concatenate all DataFrames in data_collected
-        final_data = pd.concat(data_collected, ignore_index=True)
-        
-        # Add a "Scrap date" column
-        final_data["Scrap date"] = dt.date.today().strftime("%Y-%m-%d")
+        with profiling.profile("save"):
+            # Concatenate all DataFrames in data_collected
+            final_data = pd.concat(data_collected, ignore_index=True)
 
-        # Conclude the scraping by saving the data
-        self.save_data(final_data)
+            # Add a "Scrap date" column
+            final_data["Scrap date"] = dt.date.today().strftime("%Y-%m-%d")
+            # Apply the common typed schema once, to the whole run (integer prices, counts, categories, nulls)
+            final_data = schema.normalize(final_data, site_key)
+
+            # Conclude the scraping by saving the data
+            self.save_data(final_data)
+        # Only once the data is saved: the next run of the completed sites starts afresh
+        journal.clear(site_key(url) for url in completed)
+
+def run_local_shards(count:int, argv:list) -> bool:
+    """
+    Runs the `count` shards of a sharded crawl as `count` local processes (`--shard i/count`,
+    with the other options of `argv`), side by side on this machine.
+    
+    Args:
+        count (int): The number of shards.
+        argv (list): The command-line options given to every shard.
+    
+    Returns:
+        bool: True if every shard ran to the end, so that their outputs can be merged.
+    """
+    # Every shard copies the seen-urls index: it is seeded once, before they start
+    if not os.path.exists(url_store.DB_PATH):
+        url_store.import_urls_file("./files/urls_file.txt", [module.SITE_KEY for module in SITE_MODULES])
+    processes = [subprocess.Popen([sys.executable, os.path.abspath(__file__), *argv, "--shard", f"{index}/{count}"])
+                 for index in range(count)]
+    failed = [index for index, process in enumerate(processes) if process.wait() != 0]
+    for index in failed:
+        print(f"Shard {index}/{count} failed (exit code {processes[index].returncode}).")
+    return not failed
 
 # Run the scraper 
-crawler = Crawler()
-crawler.scrap(SITES_LIST)  # Run the scraper
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scrape the product listings of the configured sites.")
+    parser.add_argument("--engine", choices=["threads", "async", "frontier"], default="threads",
+                        help="crawl engine used for every site (default: threads)")
+    parser.add_argument("--workers", type=int, default=frontier.WORKERS,
+                        help=f"with --engine frontier, number of worker processes (default: {frontier.WORKERS})")
+    parser.add_argument("--frontier-stats", action="store_true",
+                        help="print the number of urls per site and state in the crawl frontier, then exit")
+    parser.add_argument("--parallel-sites", action="store_true",
+                        help="scrape all the sites at the same time, one worker process per site")
+    parser.add_argument("--site-timeout", type=float, default=None,
+                        help="with --parallel-sites, stop the sites still running after this many seconds")
+    parser.add_argument("--parser", action="append", default=[], metavar="[SITE=]BACKEND",
+                        help="HTML parser (html.parser, lxml or selectolax), for every site or for one "
+                             "site key, e.g. --parser lxml --parser mtn=selectolax")
+    parser.add_argument("--host-limits", action="append", default=[], metavar="[SITE=]FLOOR:CEILING[:RATE]",
+                        help="bounds of the adaptive per-host controller: requests in flight (floor and ceiling) "
+                             "and max requests per second, for every host or for one site key, "
+                             "e.g. --host-limits 1:10 --host-limits mtn=2:20:40")
+    parser.add_argument("--full", action="store_true",
+                        help="crawl every listing page of every category (periodic full sweep) instead of "
+                             "stopping a category after --known-pages pages without new products")
+    parser.add_argument("--known-pages", type=int, default=pipeline.KNOWN_PAGES, metavar="K",
+                        help="stop a category after K consecutive listing pages without new products, 0 to never "
+                             f"stop (default: {pipeline.KNOWN_PAGES}; sites may set their own KNOWN_PAGES)")
+    parser.add_argument("--sort", action="append", default=[], metavar="SITE=PARAM=VALUE",
+                        help="query parameter added to the listing pages of a site to list the newest products "
+                             "first, e.g. --sort coinafrique=sort=recent. Can be repeated")
+    parser.add_argument("--shallow", action="append", nargs="?", const="*", default=[], metavar="SITE",
+                        help="build the products of a site (or of every site) from their listing cards only, "
+                             "without fetching the product pages. Can be repeated")
+    parser.add_argument("--deep", nargs="?", const="", default=None, metavar="URLS_FILE",
+                        help="scrape the product pages of the products read from their cards by --shallow runs "
+                             "(all of them, or the urls listed in URLS_FILE, one per line), then exit")
+    parser.add_argument("--recrawl", action="append", nargs="?", const="*", default=None, metavar="SITE",
+                        help="re-crawl the product pages of the known products of a site (or of every site) "
+                             "and save only the changed ones, then exit. Can be repeated")
+    parser.add_argument("--profile", action="store_true",
+                        help="profile the CPU (stack samples of all threads) and the memory allocations of "
+                             "each site and of the save stage; writes collapsed stacks and a summary per "
+                             "stage to files/profiles/<run date>/")
+    parser.add_argument("--archive", action="store_true",
+                        help="archive every raw response (url, status, headers, body) in compressed "
+                             "WARC files under files/archive/<run date>/")
+    parser.add_argument("--replay", default=None, metavar="ARCHIVE_DIR",
+                        help="read every response from the archives of ARCHIVE_DIR instead of the network, "
+                             "parse them again from a fresh state and write the outputs to files/replay/")
+    parser.add_argument("--store", choices=["csv", "parquet"], default="csv",
+                        help="csv: rewrite files/scraped_data.csv; parquet: append the run to files/products/ "
+                             "(default: csv)")
+    parser.add_argument("--stream", action="store_true",
+                        help="write the products to the store by batches as they are scraped, "
+                             "instead of all at the end of the run (bounded memory)")
+    parser.add_argument("--batch-size", type=int, default=sink.BATCH_SIZE,
+                        help=f"with --stream, number of products per batch (default: {sink.BATCH_SIZE})")
+    parser.add_argument("--shard", type=shards.parse, default=None, metavar="i/N",
+                        help="only scrape the product urls of shard i out of N (stable hash of the url); "
+                             "the outputs go to files/shards/<i>-of-<N>/")
+    parser.add_argument("--merge-shards", type=int, default=None, metavar="N",
+                        help="merge the outputs of the N shards into the main dataset, then exit without scraping")
+    parser.add_argument("--local-shards", type=int, default=None, metavar="N",
+                        help="run the N shards as N local processes with the other options, then merge them "
+                             "into the main dataset if they all succeed")
+    parser.add_argument("--compact", action="store_true",
+                        help="merge the files of each partition of the Parquet store, then exit without scraping")
+    args, argv = parser.parse_args(), sys.argv[1:]
+
+    if args.local_shards:
+        # The shards get every option but this one
+        for position, option in enumerate(argv):
+            if option == "--local-shards":
+                argv = argv[:position] + argv[position + 2:]
+                break
+            if option.startswith("--local-shards="):
+                argv = argv[:position] + argv[position + 1:]
+                break
+        if not run_local_shards(args.local_shards, argv):
+            # The outputs are kept: the failed shards resume from their journal when run again
+            raise SystemExit(1)
+        Crawler(store=args.store).merge_shards(args.local_shards)
+        raise SystemExit(0)
+    if args.compact:
+        print(f"{parquet_store.compact()} partition(s) compacted")
+        raise SystemExit(0)
+    if args.frontier_stats:
+        for site, states in frontier.stats().items():
+            print(site, ", ".join(f"{state}: {count}" for state, count in sorted(states.items())))
+        raise SystemExit(0)
+    frontier.configure(workers=args.workers)
+
+    for choice in args.parser:
+        key, _, backend = choice.rpartition("=")
+        html_parsers.configure(backend, key or None)
+    for choice in args.host_limits:
+        key, _, limits = choice.rpartition("=")
+        floor, ceiling, *rate = limits.split(":")
+        host_control.configure(key or None, floor=int(floor), ceiling=int(ceiling),
+                               rate_ceiling=float(rate[0]) if rate else None)
+    pipeline.configure(known_pages=args.known_pages, full=args.full)
+    for choice in args.sort:
+        key, _, param = choice.partition("=")
+        name, _, value = param.partition("=")
+        pipeline.configure(site_key=key, sort_params={name: value})
+    for key in args.shallow:
+        pipeline.configure(shallow=key)
+    if args.profile:
+        profiling.configure()
+    if args.archive:
+        archive.configure()
+
+    if args.merge_shards:
+        Crawler(store=args.store).merge_shards(args.merge_shards)
+        raise SystemExit(0)
+
+    if args.recrawl is not None:
+        Crawler(store=args.store).recrawl(None if "*" in args.recrawl else args.recrawl)
+        raise SystemExit(0)
+    if args.deep is not None:
+        urls = None
+        if args.deep:
+            with open(args.deep, "r", encoding="utf-8") as urls_file:
+                urls = [line.strip() for line in urls_file if line.strip()]
+        Crawler(store=args.store).enrich(urls)
+        raise SystemExit(0)
+
+    crawler = Crawler(store=args.store, batch_size=args.batch_size if args.stream else None, shard=args.shard,
+                      replay=args.replay)
+    crawler.scrap(SITES_LIST, engine=args.engine, parallel=args.parallel_sites,
+                  site_timeout=args.site_timeout)  # Run the scraper
@@ -0,0 +1,211 @@
+"""
+Archive des réponses HTTP brutes (`scrapping.py --archive`) et relecture sans réseau
+(`scrapping.py --replay DOSSIER`).
+
+Archivage : chaque réponse reçue par http_session.fetch ou le moteur async (nouvelles
+tentatives et erreurs HTTP comprises), ou servie par le cache HTTP (page encore fraîche ou
+revalidée par un 304, archivée avec son corps en cache et le statut 200), est ajoutée à une
+archive au format WARC/1.0 : un enregistrement « response » par réponse (URL, date,
+statut, en-têtes et corps), compressé en un membre gzip séparé et écrit aussitôt. Chaque processus écrit son propre
+fichier <date>-<pid>.warc.gz dans DIRECTORY, accompagné d'un index <date>-<pid>.idx
+(une ligne JSON par enregistrement : url, statut, date, position et taille du membre
+gzip) qui évite de décompresser toute l'archive pour retrouver une page.
+Le corps est archivé décodé : Content-Encoding, Transfer-Encoding et Content-Length
+ne sont pas recopiés tels quels (Content-Length est recalculé).
+
+Relecture : `replay(url)` retrouve la réponse d'une URL dans les archives du dossier
+REPLAY (sous-dossiers compris), à la place de la requête. Une URL archivée plusieurs fois
+est relue dans sa dernière version de statut 200, à défaut dans sa dernière version.
+Seules les pages lues par les exécutions archivées sont disponibles : une page produit
+sautée parce que déjà vue n'est pas dans leur archive.
+Une URL absente des archives est relue comme une réponse 404 vide.
+"""
+import datetime as dt
+import gzip
+import http.client
+import json
+import os
+import threading
+import uuid
+
+# Archivage des réponses activé (par `configure`)
+ENABLED = False
+# Dossier des archives écrites
+DIRECTORY = "./files/archive"
+# Dossier des archives relues à la place du réseau (None : pas de relecture)
+REPLAY = None
+
+# En-têtes qui ne décrivent plus le corps archivé (décodé, non découpé)
+SKIPPED_HEADERS = ("content-encoding", "transfer-encoding", "content-length")
+
+_lock = threading.Lock()
+_writer = None
+# Index des archives relues : url -> (clé de choix, fichier, position, taille)
+_index = None
+
+
+def configure(directory=None, replay=None):
+    """
+    Active l'archivage des réponses, ou leur relecture.
+
+    parameters :
+        - directory (str): dossier des archives écrites, par défaut DIRECTORY
+        - replay (str): dossier d'archives à relire ; les scrapers n'accèdent alors plus au réseau
+    """
+    global ENABLED, DIRECTORY, REPLAY, _index
+    if replay is not None:
+        REPLAY = replay
+        _index = None
+    else:
+        ENABLED = True
+    if directory is not None:
+        DIRECTORY = directory
+
+
+def _record_bytes(url, status, headers, body, date):
+    """
+    Enregistrement WARC « response » : en-têtes WARC, puis la réponse HTTP (statut, en-têtes, corps).
+    """
+    lines = [f"HTTP/1.1 {status} {http.client.responses.get(status, '')}".rstrip()]
+    for name, value in headers.items():
+        if name.lower() not in SKIPPED_HEADERS:
+            lines.append(f"{name}: {value}")
+    lines.append(f"Content-Length: {len(body)}")
+    block = ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1", errors="replace") + body
+    warc_headers = (
+        "WARC/1.0\r\n"
+        "WARC-Type: response\r\n"
+        f"WARC-Record-ID: <urn:uuid:{uuid.uuid4()}>\r\n"
+        f"WARC-Date: {date}\r\n"
+        f"WARC-Target-URI: {url}\r\n"
+        "Content-Type: application/http; msgtype=response\r\n"
+        f"Content-Length: {len(block)}\r\n"
+        "\r\n"
+    )
+    return warc_headers.encode("utf-8") + block + b"\r\n\r\n"
+
+
+class ArchiveWriter:
+    """
+    Archive d'un processus : fichier .warc.gz et son index .idx, ouverts en ajout.
+    """
+
+    def __init__(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        name = os.path.join(directory, f"{dt.datetime.now():%Y%m%d-%H%M%S}-{os.getpid()}")
+        self.pid = os.getpid()
+        self.path = name + ".warc.gz"
+        self._lock = threading.Lock()
+        self._file = open(self.path, "ab")
+        self._index = open(name + ".idx", "a", encoding="utf-8")
+
+    def write(self, url, status, headers, body):
+        date = dt.datetime.now(dt.timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+        # Un membre gzip par enregistrement : il se relit seul, à partir de sa position
+        member = gzip.compress(_record_bytes(url, status, headers, body, date))
+        with self._lock:
+            offset = self._file.tell()
+            self._file.write(member)
+            self._file.flush()
+            entry = {"url": url, "status": status, "date": date, "offset": offset, "length": len(member)}
+            self._index.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            self._index.flush()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+            self._index.close()
+
+
+def record(url, status, headers, body):
+    """
+    Ajoute une réponse à l'archive du processus (sans effet si l'archivage n'est pas activé).
+
+    parameters :
+        - url (str): url demandée
+        - status (int): statut HTTP
+        - headers (Mapping): en-têtes de la réponse
+        - body (bytes): corps décodé
+    """
+    global _writer
+    if not ENABLED:
+        return
+    with _lock:
+        # Processus fils (--parallel-sites) : il écrit dans sa propre archive, pas dans celle héritée
+        if _writer is None or _writer.pid != os.getpid():
+            _writer = ArchiveWriter(DIRECTORY)
+        writer = _writer
+    writer.write(url, status, headers, body)
+
+
+def close():
+    """
+    Ferme l'archive ouverte par le processus courant.
+    """
+    global _writer
+    with _lock:
+        if _writer is not None and _writer.pid == os.getpid():
+            _writer.close()
+        _writer = None
+
+
+def _load_index():
+    """
+    Lit les index de toutes les archives de REPLAY, dans l'ordre de leurs dates.
+    """
+    index = {}
+    paths = []
+    for root, _, files in os.walk(REPLAY):
+        paths.extend(os.path.join(root, name) for name in files if name.endswith(".idx"))
+    for path in sorted(paths, key=os.path.basename):
+        archive_path = path[:-len(".idx")] + ".warc.gz"
+        with open(path, "r", encoding="utf-8") as index_file:
+            for line in index_file:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # Dernière ligne d'une exécution interrompue
+                    continue
+                # Une réponse 200 l'emporte sur les autres statuts, puis la plus récente
+                key = (entry["status"] == 200, entry["date"])
+                known = index.get(entry["url"])
+                if known is None or key >= known[0]:
+                    index[entry["url"]] = (key, archive_path, entry["offset"], entry["length"])
+    return index
+
+
+def _parse_record(data):
+    """
+    Statut, en-têtes et corps de la réponse HTTP d'un enregistrement WARC.
+    """
+    warc_headers, _, rest = data.partition(b"\r\n\r\n")
+    length = next(int(line.split(b":", 1)[1]) for line in warc_headers.split(b"\r\n")
+                  if line.lower().startswith(b"content-length:"))
+    http_headers, _, body = rest[:length].partition(b"\r\n\r\n")
+    status_line, *header_lines = http_headers.decode("latin-1").split("\r\n")
+    headers = {}
+    for line in header_lines:
+        name, _, value = line.partition(":")
+        headers[name.strip()] = value.strip()
+    return int(status_line.split()[1]), headers, body
+
+
+def replay(url):
+    """
+    Réponse archivée d'une URL, à la place de la requête.
+
+    return :
+        - response (tuple) : (status, en-têtes, corps) ; (404, {}, b"") si l'URL n'est pas archivée
+    """
+    global _index
+    with _lock:
+        if _index is None:
+            _index = _load_index()
+        entry = _index.get(url)
+    if entry is None:
+        print(f"{url} est absente de l'archive {REPLAY}")
+        return 404, {}, b""
+    _, path, offset, length = entry
+    with open(path, "rb") as archive_file:
+        archive_file.seek(offset)
+        return _parse_record(gzip.decompress(archive_file.read(length)))
@@ -0,0 +1,317 @@
+"""
+Moteur de crawl asyncio, alternative aux ThreadPoolExecutor des scrapers.
+
+Une seule boucle d'événements ; les requêtes vers chaque hôte passent par son contrôleur
+AIMD (host_control.py), partagé avec les threads. Les catégories d'un
+site sont parcourues en même temps ; les pages de liste d'une catégorie sont lues
+l'une après l'autre, mais chaque page produit est lancée dès qu'elle est découverte,
+sans attendre la fin de la page précédente.
+Le parsing réutilise `parse_listing_page` et `parse_product_details` de chaque
+module de site. Chaque page de liste est validée dans le journal dès que ses pages
+produit sont terminées (`pipeline.commit_page`).
+"""
+import asyncio
+import time
+from urllib.parse import urlsplit
+
+import aiohttp
+import pandas as pd
+
+from scrapping_scripts import archive, fingerprints, host_control, html_parsers, http_cache, http_session, journal, metrics, pipeline, sink, url_store
+
+# Nombre maximum de connexions par hôte (le contrôleur de l'hôte fixe les requêtes en cours)
+HOST_CONCURRENCY = 50
+
+# Pages produit en cours de chaque site (clé : SITE_KEY), pour la métrique queue_depth
+_in_flight = {}
+
+
+class AsyncFetcher:
+    """
+    Session aiohttp partagée ; chaque requête attend l'accord du contrôleur de son hôte.
+    """
+
+    def __init__(self, host_concurrency=HOST_CONCURRENCY):
+        self.host_concurrency = host_concurrency
+        self._session = None
+
+    async def __aenter__(self):
+        connector = aiohttp.TCPConnector(limit=0, limit_per_host=self.host_concurrency)
+        connect_timeout, read_timeout = http_session.TIMEOUT
+        timeout = aiohttp.ClientTimeout(total=None, connect=connect_timeout, sock_read=read_timeout)
+        self._session = aiohttp.ClientSession(connector=connector, headers=http_session.DEFAULT_HEADERS,
+                                              timeout=timeout)
+        return self
+
+    async def __aexit__(self, *exc):
+        await self._session.close()
+
+    async def _get(self, url, headers=None, stage="product"):
+        """
+        Requête GET régulée par le contrôleur de l'hôte, avec les mêmes nouvelles tentatives
+        que http_session.fetch. Retourne (status, en-têtes, contenu) ; l'erreur réseau de la
+        dernière tentative est levée. Lève host_control.HostUnavailable si le disjoncteur de
+        l'hôte est ouvert.
+        En mode relecture (--replay), la réponse est lue dans l'archive, sans requête.
+        """
+        host = urlsplit(url).hostname
+        if archive.REPLAY:
+            start = time.monotonic()
+            status, response_headers, content = await asyncio.to_thread(archive.replay, url)
+            http_session.record(host, stage, time.monotonic() - start, status, len(content))
+            return status, response_headers, content
+        controller = host_control.get_controller(host)
+        for attempt in range(http_session.RETRIES + 1):
+            if attempt:
+                controller.retried()
+                await asyncio.sleep(http_session.retry_delay(attempt))
+            await controller.acquire_async()
+            start = time.monotonic()
+            try:
+                async with self._session.get(url, headers=headers) as response:
+                    status, response_headers, content = response.status, response.headers, await response.read()
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                controller.release(time.monotonic() - start, timeout=isinstance(e, asyncio.TimeoutError))
+                http_session.record(host, stage, time.monotonic() - start)
+                if attempt == http_session.RETRIES:
+                    # Comme http_session.fetch : un produit passe en échec (il sera repris),
+                    # une page de liste fait échouer le site
+                    raise
+                print(f"Erreur lors de l'accès à {url} : {e!r}, nouvelle tentative.")
+                continue
+            latency = time.monotonic() - start
+            controller.release(latency, status, response_headers.get("Retry-After"))
+            http_session.record(host, stage, latency, status, len(content))
+            if archive.ENABLED:
+                # Compression et écriture hors de la boucle d'événements
+                await asyncio.to_thread(archive.record, url, status, response_headers, content)
+            if status not in http_session.RETRY_STATUSES or attempt == http_session.RETRIES:
+                return status, response_headers, content
+            print(f"Statut {status} pour {url}, nouvelle tentative.")
+
+    async def fetch(self, url):
+        """
+        Télécharge une page. Retourne (status, contenu) ; lève l'erreur réseau après la dernière tentative.
+        """
+        status, _, content = await self._get(url)
+        return status, content
+
+    async def fetch_cached(self, url, url_class):
+        """
+        Comme `fetch`, en passant par le cache HTTP (voir http_cache.fetch).
+        Retourne une http_cache.CachedResponse.
+        """
+        cache = http_cache.get_cache()
+        entry = await asyncio.to_thread(cache.get, url)
+        if http_cache.is_fresh(entry, url_class):
+            return await asyncio.to_thread(http_cache.cached_response, url, entry)
+
+        status, headers, content = await self._get(url, http_cache.conditional_headers(entry), url_class)
+        if status == 304 and entry is not None:
+            await asyncio.to_thread(cache.touch, url)
+            return await asyncio.to_thread(http_cache.cached_response, url, entry)
+        if status == 200:
+            await asyncio.to_thread(cache.store, url, headers, content)
+        return http_cache.CachedResponse(status, content)
+
+
+def _parse_product(module, content, args):
+    soup = html_parsers.make_soup(content, module.SITE_KEY)
+    return fingerprints.tag(module.parse_product_details(soup, *args), soup, module.CONTENT_REGION)
+
+
+async def scrape_product(fetcher, module, args):
+    """
+    Télécharge puis parse une page produit (le parsing se fait hors de la boucle).
+    """
+    status, content = await fetcher.fetch(args[0])
+    if status != 200:
+        print(f"Erreur lors de l'accès au produit : {args[0]}")
+        return None
+    return await asyncio.to_thread(_parse_product, module, content, args)
+
+
+async def _scrape_and_record(fetcher, module, category, page, position, args):
+    """
+    Scrape une page produit, puis l'enregistre aussitôt dans le journal (voir pipeline.record_product).
+    """
+    product = await scrape_product(fetcher, module, args)
+    if product:
+        await asyncio.to_thread(pipeline.record_product, module.SITE_KEY, category["Nom"], page, position, args,
+                                product, True)
+    return product
+
+
+async def _finish_page(module, category, page, page_args, products, listing_url, listing_count):
+    """
+    Attend les pages produit d'une page de liste, puis valide la page dans le journal
+    (hors de la boucle : écriture SQLite et, en mode streaming, écriture des lots).
+    """
+    results = await asyncio.gather(*products, return_exceptions=True)
+    products = []
+    failed = []
+    for args, result in zip(page_args, results):
+        if isinstance(result, Exception):
+            print(f"Erreur lors du scraping du produit {args[0]} : {result!r}")
+            failed.append(args[0])
+            result = None
+        products.append(result)
+    await asyncio.to_thread(pipeline.commit_page, module.SITE_KEY, category["Nom"], page, page_args, products,
+                            listing_url, listing_count, failed, getattr(module, "DETAIL_PAGES", True))
+
+
+async def crawl_category(fetcher, module, category, base_url, seen_urls):
+    """
+    Parcourt les pages d'une catégorie et lance les pages produit au fil de l'eau.
+    """
+    detail_pages = getattr(module, "DETAIL_PAGES", True)
+    site_journal = journal.get_journal(module.SITE_KEY)
+    if site_journal.category_done(category["Nom"]):
+        print(f"La catégorie {category['Nom']} a déjà été scrappée. Elle sera donc ignorée.")
+        return [] if sink.is_open() else site_journal.products(category["Nom"])
+    pages = []
+    stop_after = pipeline.known_pages_limit(module)
+    known_pages = 0
+    complete = True
+
+    try:
+        for page in range(1, module.MAX_PAGES + 1):
+            if site_journal.page_done(category["Nom"], page):
+                # Page validée par une exécution interrompue : ses produits sont dans le journal
+                print(f"Page {page} de la catégorie '{category['Nom']}' déjà traitée.")
+                continue
+            url = pipeline.listing_url(module, category, page)
+            print(f"Scraping page : {url}")
+            response = await fetcher.fetch_cached(url, "listing")
+            if response.status_code != 200:
+                print(f"Erreur lors de l'accès à la page {page} de la catégorie '{category['Nom']}' : {url}")
+                complete = False
+                break
+
+            if response.not_modified and response.parsed is not None:
+                # Page inchangée depuis le dernier passage : ses produits sont déjà connus
+                if not response.parsed:
+                    print(f"Aucun produit trouvé sur la page {page}. Fin du scraping pour cette catégorie.")
+                    break
+                print(f"Page {page} inchangée depuis le dernier passage.")
+                metrics.inc("listing_pages_total", site=module.SITE_KEY, result="not_modified")
+                known_pages += 1
+                if stop_after and known_pages >= stop_after:
+                    print(f"{known_pages} page(s) de suite sans nouveau produit. "
+                          f"Fin du scraping pour cette catégorie.")
+                    break
+                continue
+
+            product_args = await asyncio.to_thread(pipeline.parse_listing, module, response.content, category, base_url)
+            metrics.inc("listing_pages_total", site=module.SITE_KEY, result="parsed")
+            if not product_args:
+                await asyncio.to_thread(http_cache.get_cache().store_parsed, url, 0)
+                print(f"Aucun produit trouvé sur la page {page}. Fin du scraping pour cette catégorie.")
+                break
+
+            # Exclure les urls qui sont déjà scrappés (ou en cours de scraping dans une autre catégorie)
+            claimed = set(seen_urls.claim_many(args[0] for args in product_args))
+            new_args = [args for args in product_args if args[0] in claimed]
+            # Avec --shard, les nouveaux produits de la page peuvent tous appartenir aux autres shards
+            known = not new_args and all(args[0] in seen_urls for args in product_args)
+            known_pages = known_pages + 1 if known else 0
+            if stop_after and known_pages >= stop_after:
+                await asyncio.to_thread(pipeline.commit_page, module.SITE_KEY, category["Nom"], page, [], [],
+                                        url, len(product_args))
+                print(f"{known_pages} page(s) de suite sans nouveau produit. Fin du scraping pour cette catégorie.")
+                break
+
+            if pipeline.is_shallow(module):
+                await asyncio.to_thread(pipeline.commit_cards, module.SITE_KEY, category["Nom"], page, new_args,
+                                        url, len(product_args))
+                continue
+            if detail_pages:
+                products = [
+                    asyncio.create_task(_scrape_and_record(fetcher, module, category, page, position, args))
+                    for position, args in enumerate(new_args)
+                ]
+                # Pages produit lancées et pas encore terminées, toutes catégories du site confondues
+                in_flight = _in_flight.setdefault(module.SITE_KEY, set())
+                for product in products:
+                    in_flight.add(product)
+                    product.add_done_callback(in_flight.discard)
+                metrics.peak("queue_depth", len(in_flight), site=module.SITE_KEY)
+            else:
+                # MTN : le produit est entièrement décrit par sa carte
+                products = [asyncio.to_thread(module.parse_single_product, args[1]) for args in new_args]
+            # Page validée (et son nombre de produits mis en cache) une fois ses produits terminés
+            pages.append(asyncio.create_task(
+                _finish_page(module, category, page, new_args, products, url, len(product_args))
+            ))
+    except Exception:
+        # Les pages déjà lancées sont terminées et validées avant de propager l'erreur
+        await asyncio.gather(*pages, return_exceptions=True)
+        raise
+
+    await asyncio.gather(*pages)
+    # Toutes les pages sont validées : la catégorie est terminée, sauf arrêt sur une erreur
+    if complete:
+        await asyncio.to_thread(site_journal.commit_category, category["Nom"])
+    return [] if sink.is_open() else await asyncio.to_thread(site_journal.products, category["Nom"])
+
+
+async def crawl_site(fetcher, module, base_url):
+    """
+    Équivalent asynchrone des fonctions `main_*` : retourne un DataFrame des produits du site.
+    """
+    if hasattr(module, "get_categories"):
+        categories = await asyncio.to_thread(module.get_categories, base_url)
+    else:
+        categories = [{"Nom": None, "URL": base_url}]
+    if not categories:
+        print("Aucune catégorie trouvée.")
+        return pd.DataFrame()
+
+    seen_urls = url_store.get_store(module.SITE_KEY)
+
+    async def scrape_category(category):
+        print(f"Scraping produits de la catégorie : {category['Nom']}")
+        products = await crawl_category(fetcher, module, category, base_url, seen_urls)
+        print(f"Nombre de produits scrapés pour la catégorie {category['Nom']} : {len(products)}")
+        return products
+
+    # Toutes les catégories avancent en même temps (le contrôleur de l'hôte borne les requêtes),
+    # gather restitue les résultats dans l'ordre des catégories. Une catégorie en erreur fait
+    # échouer le site, mais seulement une fois les autres terminées : aucune ne continue en
+    # arrière-plan après l'échec du site.
+    tasks = (scrape_category(category) for category in categories)
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+    errors = [result for result in results if isinstance(result, Exception)]
+    if errors:
+        raise errors[0]
+    all_products = []
+    for products in results:
+        all_products.extend(products)
+
+    return pd.DataFrame(all_products)
+
+
+async def _crawl_sites(sites, host_concurrency):
+    dataframes = []
+    async with AsyncFetcher(host_concurrency) as fetcher:
+        for module, base_url in sites:
+            # Une erreur sur un site ne doit pas arrêter les autres
+            try:
+                dataframes.append(await crawl_site(fetcher, module, base_url))
+            except Exception as e:
+                print(f"Erreur lors du scraping du site {base_url} : {e!r}")
+                dataframes.append(None)
+    return dataframes
+
+
+def run(sites, host_concurrency=HOST_CONCURRENCY):
+    """
+    Scrape les sites dans une seule boucle d'événements.
+
+    parameters :
+        - sites (list): liste de couples (module du site, url racine)
+        - host_concurrency (int): connexions simultanées maximum par hôte
+    return :
+        - dataframes (list) : un DataFrame par site, dans l'ordre de `sites` (None si le site a échoué)
+    """
+    return asyncio.run(_crawl_sites(sites, host_concurrency))
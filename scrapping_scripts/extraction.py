@@ -0,0 +1,163 @@
+"""
+Extraction déclarative des champs d'une page produit.
+
+Chaque site décrit ses champs par une `Spec` : nom du champ -> `Field` (sélecteur CSS,
+attribut ou texte, valeur par défaut, post-traitement). Les sélecteurs sont compilés
+une seule fois par soupsieve, à l'import du module du site. L'extraction parcourt
+ensuite le document une seule fois : chaque balise n'est testée que contre les
+sélecteurs des champs pas encore trouvés qui visent son nom de balise, et le parcours
+s'arrête dès que tous les champs simples sont trouvés (s'il n'y a pas de champ multiple).
+"""
+import re
+
+import soupsieve
+from bs4 import Tag
+
+from scrapping_scripts.html_parsers import LexborTag
+
+NOT_AVAILABLE = "Non disponible"
+
+
+def _target_tag(selector):
+    """
+    Nom de la balise visée par le sélecteur (dernier sélecteur composé), None si
+    n'importe quelle balise peut correspondre.
+    """
+    if "," in selector:
+        return None
+    # Retirer les attributs et les arguments des pseudo-classes, qui peuvent contenir des espaces
+    selector = re.sub(r"\[[^\]]*\]|\([^)]*\)", "", selector)
+    last = re.split(r"\s*[>+~]\s*|\s+", selector.strip())[-1]
+    name = re.match(r"[a-zA-Z][\w-]*", last)
+    return name.group(0).lower() if name else None
+
+
+class Field:
+    """
+    Description d'un champ.
+
+    parameters :
+        - selector (str): sélecteur CSS de la balise
+        - attr (str): attribut à lire, None pour le texte de la balise
+        - many (bool): toutes les balises (liste) au lieu de la première
+        - default: valeur si la balise (ou l'attribut) est absente
+        - required (bool): champ obligatoire, son absence lève une AttributeError
+        - separator (str): séparateur passé à get_text
+        - raw (bool): passer la balise elle-même à `post` au lieu de son texte
+        - post (callable): post-traitement de la valeur trouvée (de la liste si many)
+    """
+
+    def __init__(self, selector, attr=None, many=False, default=NOT_AVAILABLE, required=False,
+                 separator="", raw=False, post=None):
+        self.selector = selector
+        self.attr = attr
+        self.many = many
+        self.default = [] if many and default == NOT_AVAILABLE else default
+        self.required = required
+        self.separator = separator
+        self.raw = raw
+        self.post = post
+        # Compilé une seule fois
+        self.compiled = soupsieve.compile(selector)
+        self.tag_name = _target_tag(selector)
+
+    def value_of(self, tag):
+        """
+        Valeur brute d'une balise : la balise, un attribut ou le texte.
+        """
+        if self.raw:
+            return tag
+        if self.attr:
+            return tag.get(self.attr)
+        return tag.get_text(separator=self.separator, strip=True)
+
+    def finish(self, name, tags):
+        """
+        Transforme les balises trouvées en valeur finale du champ.
+        """
+        if self.many:
+            values = [self.value_of(tag) for tag in tags]
+            # Les balises sans l'attribut demandé sont ignorées
+            values = [value for value in values if value] if self.attr else values
+            if self.required and not values:
+                raise AttributeError(f"champ obligatoire absent : {name} ({self.selector})")
+            return self.post(values) if self.post else values
+
+        value = self.value_of(tags[0]) if tags else None
+        if value is None:
+            if self.required:
+                raise AttributeError(f"champ obligatoire absent : {name} ({self.selector})")
+            return self.default
+        return self.post(value) if self.post else value
+
+
+class Spec:
+    """
+    Ensemble des champs d'une page, extraits en un seul parcours du document.
+    """
+
+    def __init__(self, fields):
+        self.fields = fields
+        self._single = [name for name, field in fields.items() if not field.many]
+        self._has_many = any(field.many for field in fields.values())
+        # Champs par nom de balise visée, et champs pouvant viser n'importe quelle balise
+        self._by_tag = {}
+        self._any_tag = []
+        for name, field in fields.items():
+            if field.tag_name:
+                self._by_tag.setdefault(field.tag_name, []).append(name)
+            else:
+                self._any_tag.append(name)
+
+    def _find_tags(self, root):
+        """
+        Un seul parcours de `root` : balises trouvées pour chaque champ, dans l'ordre du document.
+        """
+        found = {name: [] for name in self.fields}
+        done = set()
+        remaining_single = len(self._single)
+        for element in root.descendants:
+            if not isinstance(element, Tag):
+                continue
+            for names in (self._by_tag.get(element.name, ()), self._any_tag):
+                for name in names:
+                    if name in done:
+                        continue
+                    field = self.fields[name]
+                    if not field.compiled.match(element):
+                        continue
+                    found[name].append(element)
+                    if not field.many:
+                        # Seule la première balise compte, comme select_one
+                        done.add(name)
+                        remaining_single -= 1
+            if not remaining_single and not self._has_many:
+                break
+        return found
+
+    def selector(self, exclude=()):
+        """
+        Sélecteur CSS de toutes les balises des champs (sauf ceux de `exclude`), par
+        exemple pour l'empreinte de la région utile d'une page (voir fingerprints.py).
+        """
+        return ", ".join(field.selector for name, field in self.fields.items() if name not in exclude)
+
+    def extract(self, root):
+        """
+        Extrait tous les champs de `root` (la soup d'une page ou une balise).
+
+        return :
+            - values (dict) : nom du champ -> valeur
+        """
+        if isinstance(root, LexborTag):
+            # selectolax : pas de soupsieve, chaque champ est cherché par le moteur CSS de lexbor
+            found = {}
+            for name, field in self.fields.items():
+                if field.many:
+                    found[name] = root.select(field.selector)
+                else:
+                    tag = root.select_one(field.selector)
+                    found[name] = [tag] if tag is not None else []
+        else:
+            found = self._find_tags(root)
+        return {name: field.finish(name, found[name]) for name, field in self.fields.items()}
@@ -0,0 +1,179 @@
+"""
+Empreintes du contenu des pages produit, pour re-crawler les produits connus à moindre coût.
+
+Un lien déjà vu n'est jamais re-scrappé par une exécution normale : un changement de
+prix passe inaperçu. `scrapping.py --recrawl` re-télécharge les pages produit connues,
+mais ne ré-extrait et ne ré-enregistre que celles qui ont changé. L'empreinte d'une page
+est un hash de sa région utile (CONTENT_REGION du module du site : les balises des champs
+du produit, sans les publicités, les compteurs de vues ni les dates relatives), après
+normalisation des espaces : une page dont seule la publicité ou l'horodatage change garde
+la même empreinte, et son extraction est sautée.
+
+La base (files/fingerprints.sqlite) garde, pour chaque produit scrappé depuis sa page, les
+arguments de `scrape_product_details` et l'empreinte de la page, enregistrés à la validation
+de la page de liste : `scrape_product_details` ajoute l'empreinte au produit (`tag`), et
+pipeline.commit_page l'en retire. Un re-crawl met l'empreinte à jour une fois les produits
+modifiés sauvegardés. Un produit sans empreinte est considéré comme modifié.
+"""
+import datetime as dt
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+
+DB_PATH = "./files/fingerprints.sqlite"
+
+# Clé de l'empreinte ajoutée au produit par `tag`, retirée à la validation de sa page
+FIELD = "_fingerprint"
+
+# Attributs qui font partie du contenu (liens des images, images en arrière-plan)
+CONTENT_ATTRS = ("src", "style")
+
+_lock = threading.Lock()
+_store = None
+
+
+def digest(soup, region):
+    """
+    Empreinte de la région utile d'une page déjà parsée.
+
+    parameters :
+        - soup (BeautifulSoup|LexborTag): la page
+        - region (str): sélecteur CSS des balises qui décrivent le produit
+    return :
+        - digest (str) : hash hexadécimal du texte (espaces normalisés) et des CONTENT_ATTRS des balises
+    """
+    hasher = hashlib.blake2b(digest_size=16)
+    for tag in soup.select(region):
+        hasher.update(" ".join(tag.get_text(" ", strip=True).split()).encode("utf-8"))
+        for attr in CONTENT_ATTRS:
+            value = tag.get(attr)
+            if value:
+                hasher.update(f"\x1f{attr}={value}".encode("utf-8"))
+        hasher.update(b"\x1e")
+    return hasher.hexdigest()
+
+
+def tag(product, soup, region):
+    """
+    Ajoute au produit parsé depuis sa page l'empreinte de cette page (sous FIELD).
+
+    return :
+        - product (dict|None) : le produit, None s'il n'a pas pu être extrait
+    """
+    if product:
+        product[FIELD] = digest(soup, region)
+    return product
+
+
+class FingerprintStore:
+    """
+    Arguments et dernière empreinte de chaque produit connu, clé (site, url).
+    """
+
+    def __init__(self, db_path=DB_PATH):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, timeout=60, check_same_thread=False)
+        # WAL : plusieurs processus (un par site) peuvent écrire dans la même base
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS products ("
+            " site TEXT NOT NULL,"
+            " url TEXT NOT NULL,"
+            " args TEXT NOT NULL,"
+            " digest TEXT,"
+            " checked_at TEXT,"
+            " PRIMARY KEY (site, url)"
+            ") WITHOUT ROWID"
+        )
+
+    def remember(self, site_key, products, digests=None):
+        """
+        Enregistre les arguments des produits scrappés et l'empreinte de leur page
+        (sans empreinte, celle déjà connue est gardée).
+
+        parameters :
+            - site_key (str): SITE_KEY du site
+            - products (iterable): (url, arguments de scrape_product_details)
+            - digests (dict): {url: empreinte de la page scrappée}
+        """
+        digests = digests or {}
+        now = dt.datetime.now().isoformat(timespec="seconds")
+        rows = []
+        for url, args in products:
+            value = digests.get(url)
+            rows.append((site_key, url, json.dumps(args, ensure_ascii=False), value, now if value else None))
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT INTO products (site, url, args, digest, checked_at) VALUES (?, ?, ?, ?, ?)"
+                " ON CONFLICT (site, url) DO UPDATE SET args = excluded.args,"
+                " digest = COALESCE(excluded.digest, digest), checked_at = COALESCE(excluded.checked_at, checked_at)",
+                rows,
+            )
+
+    def known(self, site_key):
+        """
+        Produits du site à re-crawler, les moins récemment vérifiés d'abord.
+
+        return :
+            - products (dict) : {url: (arguments de scrape_product_details, empreinte ou None)}
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT url, args, digest FROM products WHERE site = ? ORDER BY checked_at IS NOT NULL, checked_at",
+                (site_key,),
+            ).fetchall()
+        return {url: (json.loads(args), digest) for url, args, digest in rows}
+
+    def update(self, site_key, digests):
+        """
+        Enregistre les empreintes vérifiées (une fois les produits modifiés sauvegardés).
+
+        parameters :
+            - site_key (str): SITE_KEY du site
+            - digests (dict): {url: empreinte}
+        """
+        now = dt.datetime.now().isoformat(timespec="seconds")
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "UPDATE products SET digest = ?, checked_at = ? WHERE site = ? AND url = ?",
+                [(value, now, site_key, url) for url, value in digests.items()],
+            )
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def get_store():
+    """
+    Retourne la base des empreintes du processus, ouverte au premier appel.
+    """
+    global _store
+    with _lock:
+        if _store is None:
+            _store = FingerprintStore(DB_PATH)
+        return _store
+
+
+def close():
+    """
+    Ferme la base ouverte par le processus courant.
+    """
+    global _store
+    with _lock:
+        if _store is not None:
+            _store.close()
+            _store = None
+
+
+def reset(db_path=None):
+    """
+    Supprime la base des empreintes (utilisé par Crawler.reset).
+    """
+    db_path = db_path or DB_PATH
+    close()
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
@@ -0,0 +1,549 @@
+"""
+Frontière de crawl persistante, partagée par plusieurs processus workers.
+
+Le processus principal (coordinateur) parcourt les pages de liste de chaque site
+(`pipeline.produce`) et dépose les produits à scraper dans files/frontier.sqlite, avec
+leur page de liste, une priorité et un état :
+
+    pending -> in_flight (réservé par un worker, pour la durée d'un bail) -> done | failed
+
+Des processus workers réservent des lots d'URLs (`claim`), appellent le scraper de détail
+du site (`scrape_product_details`) avec un pool de threads, et enregistrent le produit.
+Le parsing se fait donc dans plusieurs processus, sans partager le GIL. Le bail d'un
+worker tué expire et ses URLs redeviennent réservables ; une URL qui échoue MAX_ATTEMPTS
+fois passe en failed. Le coordinateur valide dans le journal chaque page de liste dont
+toutes les URLs sont terminées (`pipeline.commit_page`), puis la retire de la frontière.
+
+La progression se consulte pendant l'exécution : `python scrapping.py --frontier-stats`.
+"""
+import importlib
+import json
+import multiprocessing as mp
+import os
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from scrapping_scripts import archive, host_control, html_parsers, http_session, journal, metrics, pipeline, profiling, sink
+
+DB_PATH = "./files/frontier.sqlite"
+
+PENDING = "pending"
+IN_FLIGHT = "in_flight"
+DONE = "done"
+FAILED = "failed"
+
+# Nombre de processus workers
+WORKERS = 4
+# Nombre d'URLs réservées à la fois par un worker
+BATCH_SIZE = 20
+# Durée d'un bail, en secondes : au-delà, les URLs d'un worker silencieux sont reprises
+LEASE = 120
+# Nombre d'essais d'une URL avant de la marquer failed
+MAX_ATTEMPTS = 3
+# Attente entre deux consultations de la frontière, en secondes
+POLL_INTERVAL = 0.2
+# Priorité des URLs d'un site (clé : SITE_KEY), les plus prioritaires sont réservées d'abord
+PRIORITIES = {}
+
+
+def configure(workers=None, batch_size=None, lease=None):
+    """
+    Change le nombre de workers, la taille des lots et la durée des baux.
+    """
+    global WORKERS, BATCH_SIZE, LEASE
+    if workers is not None:
+        WORKERS = workers
+    if batch_size is not None:
+        BATCH_SIZE = batch_size
+    if lease is not None:
+        LEASE = lease
+
+
+class Frontier:
+    """
+    Tables de la frontière : `urls` (une ligne par produit à scraper) et `pages`
+    (pages de liste en attente de validation).
+    """
+
+    def __init__(self, db_path=DB_PATH):
+        self._lock = threading.Lock()
+        # Transactions explicites (BEGIN IMMEDIATE) : une réservation est atomique entre processus
+        self._conn = sqlite3.connect(db_path, timeout=60, check_same_thread=False, isolation_level=None)
+        # WAL : le coordinateur et les workers écrivent dans la même base
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS urls ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " site TEXT NOT NULL,"
+            " url TEXT NOT NULL,"
+            " category TEXT NOT NULL,"
+            " page INTEGER NOT NULL,"
+            " position INTEGER NOT NULL,"
+            " args TEXT NOT NULL,"
+            " priority INTEGER NOT NULL DEFAULT 0,"
+            " state TEXT NOT NULL DEFAULT 'pending',"
+            " lease_until REAL,"
+            " attempts INTEGER NOT NULL DEFAULT 0,"
+            " worker TEXT,"
+            " error TEXT,"
+            " product TEXT,"
+            " UNIQUE (site, url)"
+            ");"
+            "CREATE INDEX IF NOT EXISTS urls_state ON urls (state, priority, page);"
+            "CREATE INDEX IF NOT EXISTS urls_page ON urls (site, category, page);"
+            "CREATE TABLE IF NOT EXISTS pages ("
+            " site TEXT NOT NULL,"
+            " category TEXT NOT NULL,"
+            " page INTEGER NOT NULL,"
+            " listing_url TEXT NOT NULL,"
+            " listing_count INTEGER NOT NULL,"
+            " PRIMARY KEY (site, category, page)"
+            ") WITHOUT ROWID;"
+        )
+
+    def _transaction(self, statements):
+        """
+        Exécute `statements(conn)` dans une transaction qui verrouille la base en écriture.
+        """
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = statements(self._conn)
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+            return result
+
+    def _query(self, query, params=()):
+        with self._lock:
+            return self._conn.execute(query, params).fetchall()
+
+    def push_page(self, site, category, page, page_args, listing_url, listing_count, priority=0):
+        """
+        Ajoute les nouveaux produits d'une page de liste, en une seule transaction.
+        Un produit déjà présent (exécution interrompue) garde son état et son résultat.
+        """
+        category = category or ""
+
+        def statements(conn):
+            conn.execute(
+                "INSERT OR REPLACE INTO pages (site, category, page, listing_url, listing_count) VALUES (?, ?, ?, ?, ?)",
+                (site, category, page, listing_url, listing_count),
+            )
+            conn.executemany(
+                "INSERT INTO urls (site, url, category, page, position, args, priority) VALUES (?, ?, ?, ?, ?, ?, ?)"
+                " ON CONFLICT (site, url) DO UPDATE SET"
+                " category = excluded.category, page = excluded.page, position = excluded.position",
+                [
+                    (site, args[0], category, page, position, json.dumps(args, ensure_ascii=False), priority)
+                    for position, args in enumerate(page_args)
+                ],
+            )
+
+        self._transaction(statements)
+
+    def claim(self, limit, lease, sites, worker=""):
+        """
+        Réserve jusqu'à `limit` URLs pendantes (ou dont le bail a expiré) des sites donnés.
+
+        return :
+            - batch (list) : (id, site, args) des URLs réservées
+        """
+        now = time.time()
+        marks = ", ".join("?" * len(sites))
+
+        def statements(conn):
+            # Bail expiré après le dernier essai : l'URL est abandonnée
+            conn.execute(
+                f"UPDATE urls SET state = ?, error = 'lease expired' WHERE site IN ({marks})"
+                " AND state = ? AND lease_until < ? AND attempts >= ?",
+                (FAILED, *sites, IN_FLIGHT, now, MAX_ATTEMPTS),
+            )
+            rows = conn.execute(
+                f"SELECT id, site, args FROM urls WHERE site IN ({marks})"
+                " AND (state = ? OR (state = ? AND lease_until < ?))"
+                " ORDER BY priority DESC, page, id LIMIT ?",
+                (*sites, PENDING, IN_FLIGHT, now, limit),
+            ).fetchall()
+            conn.executemany(
+                "UPDATE urls SET state = ?, lease_until = ?, attempts = attempts + 1, worker = ? WHERE id = ?",
+                [(IN_FLIGHT, now + lease, worker, row[0]) for row in rows],
+            )
+            return rows
+
+        return [(row_id, site, json.loads(args)) for row_id, site, args in self._transaction(statements)]
+
+    def complete(self, row_id, product):
+        self._transaction(lambda conn: conn.execute(
+            "UPDATE urls SET state = ?, product = ?, lease_until = NULL WHERE id = ?",
+            (DONE, json.dumps(product, ensure_ascii=False) if product else None, row_id),
+        ))
+
+    def fail(self, row_id, error):
+        """
+        L'URL est remise en attente, ou marquée failed après MAX_ATTEMPTS essais.
+        """
+        self._transaction(lambda conn: conn.execute(
+            "UPDATE urls SET state = CASE WHEN attempts >= ? THEN ? ELSE ? END, error = ?, lease_until = NULL"
+            " WHERE id = ?",
+            (MAX_ATTEMPTS, FAILED, PENDING, error, row_id),
+        ))
+
+    def release(self, sites):
+        """
+        Remet en attente les URLs réservées par les workers d'une exécution précédente.
+        """
+        marks = ", ".join("?" * len(sites))
+        self._transaction(lambda conn: conn.execute(
+            f"UPDATE urls SET state = ?, lease_until = NULL WHERE state = ? AND site IN ({marks})",
+            (PENDING, IN_FLIGHT, *sites),
+        ))
+
+    def remaining(self, sites):
+        """
+        Nombre d'URLs pendantes ou réservées des sites donnés.
+        """
+        marks = ", ".join("?" * len(sites))
+        return self._query(
+            f"SELECT COUNT(*) FROM urls WHERE state IN (?, ?) AND site IN ({marks})", (PENDING, IN_FLIGHT, *sites)
+        )[0][0]
+
+    def finished_pages(self, sites):
+        """
+        Pages de liste dont toutes les URLs sont terminées (done ou failed).
+
+        return :
+            - pages (list) : (site, category, page, listing_url, listing_count)
+        """
+        marks = ", ".join("?" * len(sites))
+        return self._query(
+            f"SELECT site, category, page, listing_url, listing_count FROM pages p WHERE site IN ({marks})"
+            " AND NOT EXISTS (SELECT 1 FROM urls u WHERE u.site = p.site AND u.category = p.category"
+            " AND u.page = p.page AND u.state IN (?, ?))",
+            (*sites, PENDING, IN_FLIGHT),
+        )
+
+    def page_results(self, site, category, page):
+        """
+        Arguments, produit (None si échec) et état de chaque URL de la page, dans l'ordre de la page.
+        """
+        rows = self._query(
+            "SELECT args, product, state FROM urls WHERE site = ? AND category = ? AND page = ? ORDER BY position",
+            (site, category, page),
+        )
+        return [(json.loads(args), json.loads(product) if product else None, state) for args, product, state in rows]
+
+    def drop_page(self, site, category, page):
+        """
+        Retire une page validée (et ses URLs) de la frontière.
+        """
+        def statements(conn):
+            conn.execute("DELETE FROM urls WHERE site = ? AND category = ? AND page = ?", (site, category, page))
+            conn.execute("DELETE FROM pages WHERE site = ? AND category = ? AND page = ?", (site, category, page))
+
+        self._transaction(statements)
+
+    def stats(self):
+        """
+        Nombre d'URLs par site et par état.
+
+        return :
+            - stats (dict) : {site: {état: nombre}}
+        """
+        stats = {}
+        for site, state, count in self._query("SELECT site, state, COUNT(*) FROM urls GROUP BY site, state"):
+            stats.setdefault(site, {})[state] = count
+        return stats
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def _scrape(frontier, site_modules, item):
+    row_id, site, args = item
+    try:
+        product = site_modules[site].scrape_product_details(*args)
+    except Exception as e:
+        print(f"Erreur lors du scraping du produit {args[0]} : {e!r}")
+        frontier.fail(row_id, repr(e))
+        return
+    frontier.complete(row_id, product)
+
+
+def _settings():
+    """
+    Réglages du processus coordinateur à reproduire dans les workers (lancés avec "spawn",
+    ils ne partagent ni la session HTTP ni les connexions SQLite du coordinateur).
+    """
+    return {
+        "parser": html_parsers.DEFAULT_BACKEND,
+        "site_parsers": dict(html_parsers.SITE_BACKENDS),
+        "pool_size": http_session.POOL_SIZE,
+        "max_per_host": http_session.MAX_PER_HOST,
+        "host_limits": dict(host_control.LIMITS),
+        "site_host_limits": {site: dict(limits) for site, limits in host_control.SITE_LIMITS.items()},
+        "batch_size": BATCH_SIZE,
+        "lease": LEASE,
+        "db_path": DB_PATH,
+        "profile": profiling.DIRECTORY if profiling.ENABLED else None,
+        "archive": archive.DIRECTORY if archive.ENABLED else None,
+        "replay": archive.REPLAY,
+    }
+
+
+def worker_main(modules, stop, settings, reports):
+    """
+    Boucle d'un processus worker : réserve des lots d'URLs et les scrape jusqu'à ce que
+    `stop` soit levé et que la frontière soit vide.
+
+    parameters :
+        - modules (dict): SITE_KEY -> nom du module du site
+        - stop (multiprocessing.Event): levé par le coordinateur quand tout est validé
+        - settings (dict): réglages du coordinateur (voir `_settings`)
+        - reports (multiprocessing.Queue): reçoit les métriques du worker à sa sortie
+    """
+    html_parsers.configure(settings["parser"])
+    for site, backend in settings["site_parsers"].items():
+        html_parsers.configure(backend, site)
+    http_session.configure(pool_size=settings["pool_size"], max_per_host=settings["max_per_host"])
+    host_control.configure(**settings["host_limits"])
+    for site, limits in settings["site_host_limits"].items():
+        host_control.configure(site, **limits)
+    if settings["profile"]:
+        profiling.configure(settings["profile"])
+    if settings["archive"]:
+        archive.configure(settings["archive"])
+    if settings["replay"]:
+        archive.configure(replay=settings["replay"])
+    site_modules = {site: importlib.import_module(name) for site, name in modules.items()}
+    frontier = Frontier(settings["db_path"])
+    worker = mp.current_process().name
+    coordinator = mp.parent_process()
+    try:
+        with profiling.profile(worker), ThreadPoolExecutor(max_workers=http_session.POOL_SIZE) as executor:
+            # Coordinateur tué : ses URLs réservées seront reprises par la prochaine exécution
+            while coordinator.is_alive():
+                batch = frontier.claim(settings["batch_size"], settings["lease"], list(site_modules), worker)
+                if not batch:
+                    if stop.is_set():
+                        return
+                    time.sleep(POLL_INTERVAL)
+                    continue
+                list(executor.map(lambda item: _scrape(frontier, site_modules, item), batch))
+    finally:
+        frontier.close()
+        archive.close()
+        reports.put(metrics.snapshot())
+
+
+def _collect_reports(reports, processes):
+    """
+    Ajoute aux métriques du coordinateur celles que les workers envoient en sortant.
+    La file est vidée avant les `join` : un worker ne se termine qu'une fois sa file écrite.
+    """
+    while True:
+        try:
+            metrics.merge(reports.get(timeout=POLL_INTERVAL))
+        except queue.Empty:
+            if not any(process.is_alive() for process in processes):
+                break
+    # Les métriques écrites par un worker juste avant sa sortie
+    while True:
+        try:
+            metrics.merge(reports.get(timeout=POLL_INTERVAL))
+        except queue.Empty:
+            return
+
+
+class _Progress:
+    """
+    Pages de liste envoyées à la frontière et pas encore validées, par catégorie.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pages = {}
+        self._listed = set()
+
+    def add(self, site, category):
+        with self._lock:
+            self._pages.setdefault((site, category or ""), set())
+
+    def push(self, site, category, page):
+        with self._lock:
+            self._pages[(site, category or "")].add(page)
+
+    def listed(self, site, category):
+        with self._lock:
+            self._listed.add((site, category or ""))
+
+    def committed(self, site, category, page):
+        with self._lock:
+            # Page poussée par une exécution interrompue : sa catégorie n'est peut-être pas encore relistée
+            self._pages.get((site, category), set()).discard(page)
+
+    def finished_categories(self):
+        """
+        Catégories entièrement parcourues dont toutes les pages sont validées.
+        """
+        with self._lock:
+            finished = [key for key in self._listed if not self._pages.get(key)]
+            for key in finished:
+                self._listed.discard(key)
+                self._pages.pop(key, None)
+            return finished
+
+
+def _list_site(frontier, module, base_url, progress):
+    """
+    Parcourt les pages de liste du site et envoie ses nouveaux produits à la frontière.
+
+    return :
+        - categories (list) : les catégories du site
+    """
+    if hasattr(module, "get_categories"):
+        categories = module.get_categories(base_url)
+    else:
+        categories = [{"Nom": None, "URL": base_url}]
+    if not categories:
+        print("Aucune catégorie trouvée.")
+        return []
+    site_journal = journal.get_journal(module.SITE_KEY)
+    detail_pages = getattr(module, "DETAIL_PAGES", True)
+    priority = PRIORITIES.get(module.SITE_KEY, 0)
+
+    def list_category(category):
+        if site_journal.category_done(category["Nom"]):
+            print(f"La catégorie {category['Nom']} a déjà été scrappée. Elle sera donc ignorée.")
+            return
+        progress.add(module.SITE_KEY, category["Nom"])
+
+        def dispatch(page, new_args, listing_url, listing_count):
+            if not detail_pages:
+                # MTN : le produit est entièrement décrit par sa carte, la page est validée tout de suite
+                products = [module.parse_single_product(args[1]) for args in new_args]
+                pipeline.commit_page(module.SITE_KEY, category["Nom"], page, new_args, products,
+                                     listing_url, listing_count)
+                return
+            progress.push(module.SITE_KEY, category["Nom"], page)
+            frontier.push_page(module.SITE_KEY, category["Nom"], page, new_args, listing_url, listing_count,
+                               priority)
+            metrics.peak("queue_depth", frontier.remaining([module.SITE_KEY]), site=module.SITE_KEY)
+
+        print(f"Scraping produits de la catégorie : {category['Nom']}")
+        # Parcours arrêté sur une erreur : la catégorie n'est pas validée, la reprise la reparcourra
+        if pipeline.produce(module, category, base_url, dispatch):
+            progress.listed(module.SITE_KEY, category["Nom"])
+
+    pipeline.crawl_categories(categories, list_category)
+    return categories
+
+
+def _commit_finished(frontier, site_keys, progress):
+    """
+    Valide dans le journal les pages terminées, puis les catégories terminées.
+    """
+    for site, category, page, listing_url, listing_count in frontier.finished_pages(site_keys):
+        results = frontier.page_results(site, category, page)
+        pipeline.commit_page(site, category or None, page, [args for args, _, _ in results],
+                             [product for _, product, _ in results], listing_url, listing_count,
+                             [args[0] for args, _, state in results if state == FAILED], track=True)
+        frontier.drop_page(site, category, page)
+        progress.committed(site, category, page)
+    for site, category in progress.finished_categories():
+        journal.get_journal(site).commit_category(category or None)
+
+
+def run(sites, workers=None):
+    """
+    Scrape les sites avec la frontière et `workers` processus workers.
+
+    parameters :
+        - sites (list): liste de couples (module du site, url racine)
+        - workers (int): nombre de processus workers, par défaut WORKERS
+    return :
+        - dataframes (list) : un DataFrame par site, dans l'ordre de `sites` (None si le site a échoué)
+    """
+    frontier = Frontier(DB_PATH)
+    site_keys = [module.SITE_KEY for module, _ in sites]
+    # Les URLs réservées par les workers d'une exécution tuée sont reprises
+    frontier.release(site_keys)
+    # "spawn" : des workers neufs, sans les sockets, verrous et connexions hérités du coordinateur
+    context = mp.get_context("spawn")
+    stop = context.Event()
+    reports = context.Queue()
+    modules = {module.SITE_KEY: module.__name__ for module, _ in sites}
+    processes = [
+        context.Process(target=worker_main, args=(modules, stop, _settings(), reports),
+                        name=f"frontier-worker-{index}")
+        for index in range(workers or WORKERS)
+    ]
+    for process in processes:
+        process.start()
+
+    progress = _Progress()
+    try:
+        with ThreadPoolExecutor(max_workers=max(len(sites), 1)) as executor:
+            listings = [executor.submit(_list_site, frontier, module, base_url, progress) for module, base_url in sites]
+            while True:
+                listing_done = all(listing.done() for listing in listings)
+                _commit_finished(frontier, site_keys, progress)
+                if listing_done and not frontier.remaining(site_keys):
+                    # Les dernières pages terminées entre-temps
+                    _commit_finished(frontier, site_keys, progress)
+                    break
+                if not any(process.is_alive() for process in processes):
+                    raise RuntimeError("tous les workers de la frontière se sont arrêtés")
+                time.sleep(POLL_INTERVAL)
+    finally:
+        stop.set()
+        _collect_reports(reports, processes)
+        for process in processes:
+            process.join()
+        frontier.close()
+
+    dataframes = []
+    for (module, base_url), listing in zip(sites, listings):
+        # Une erreur sur un site ne doit pas arrêter les autres
+        if listing.exception() is not None:
+            print(f"Erreur lors du scraping du site {base_url} : {listing.exception()!r}")
+            dataframes.append(None)
+            continue
+        site_journal = journal.get_journal(module.SITE_KEY)
+        products = []
+        if not sink.is_open():
+            for category in listing.result():
+                products.extend(site_journal.products(category["Nom"]))
+        dataframes.append(pd.DataFrame(products))
+    return dataframes
+
+
+def stats(db_path=None):
+    """
+    Nombre d'URLs par site et par état, sans rien modifier (pour --frontier-stats).
+    """
+    db_path = db_path or DB_PATH
+    if not os.path.exists(db_path):
+        return {}
+    frontier = Frontier(db_path)
+    try:
+        return frontier.stats()
+    finally:
+        frontier.close()
+
+
+def reset(db_path=None):
+    """
+    Supprime la frontière (utilisé par Crawler.reset).
+    """
+    db_path = db_path or DB_PATH
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
@@ -0,0 +1,299 @@
+"""
+Contrôle adaptatif de la charge envoyée à chaque hôte (AIMD).
+
+Chaque hôte a son contrôleur, qui borne le nombre de requêtes en cours (`limit`) et
+le débit (`rate`, requêtes par seconde), et les ajuste d'après les réponses :
+
+- augmentation additive : chaque réponse rapide et sans erreur ajoute 1/limit à la
+  limite (+1 requête en cours par « fenêtre » de réponses) et RATE_STEP/limit au débit.
+  Jusqu'à la première diminution (démarrage lent, comme TCP), elle ajoute 1 à la limite :
+  la limite double à chaque fenêtre et atteint vite le plafond d'un hôte en bonne santé ;
+- diminution multiplicative : une erreur réseau, une réponse 429 ou 5xx divise la limite
+  et le débit par 2 (BACKOFF) ; une latence récente plus de LATENCY_FACTOR fois au-dessus
+  de la latence habituelle de l'hôte (moyenne mobile lente) réduit la limite de 10 %
+  (SLOWDOWN). Une seule diminution par aller-retour : les requêtes déjà en cours qui
+  échouent ensemble ne comptent qu'une fois.
+
+Un 429 avec un en-tête Retry-After suspend en plus l'hôte pour la durée demandée.
+
+Disjoncteur : après BREAKER_THRESHOLD échecs consécutifs (erreur réseau, timeout, 5xx),
+l'hôte est considéré en panne et le contrôleur s'ouvre pendant BREAKER_COOLDOWN secondes :
+toute nouvelle requête lève immédiatement `HostUnavailable`, et le site est abandonné
+au lieu de marteler l'hôte. Ensuite une seule requête d'essai est autorisée : si elle
+réussit le contrôleur se referme, sinon il se rouvre.
+La limite reste entre `floor` et `ceiling`, le débit entre RATE_FLOOR et `rate_ceiling` ;
+ces bornes se règlent pour tous les hôtes ou par site (`configure`).
+
+Les contrôleurs sont propres au processus et partagés par les threads (http_session)
+et la boucle asyncio (async_engine).
+"""
+import asyncio
+import threading
+import time
+
+# Bornes par défaut : requêtes en cours, et débit maximum (requêtes par seconde)
+LIMITS = {"floor": 1, "ceiling": 10, "rate_ceiling": 100.0}
+# Bornes d'un site (clé : SITE_KEY, reconnue dans le nom d'hôte), prioritaires sur LIMITS
+SITE_LIMITS = {}
+# Requêtes en cours autorisées au départ (avant toute mesure)
+INITIAL = 4
+# Débit minimum, en requêtes par seconde
+RATE_FLOOR = 0.5
+# Augmentation du débit par fenêtre de réponses réussies, en requêtes par seconde
+RATE_STEP = 1.0
+# Facteurs de diminution : erreur / 429 / 5xx, et latence trop élevée
+BACKOFF = 0.5
+SLOWDOWN = 0.9
+# Une latence récente au-delà de LATENCY_FACTOR fois la latence habituelle est un signe de surcharge
+LATENCY_FACTOR = 3.0
+# Poids d'une nouvelle mesure dans la latence récente et dans la latence habituelle
+EWMA_WEIGHT = 0.2
+BASELINE_WEIGHT = 0.02
+# Nombre de réponses mesurées avant de juger la latence
+WARMUP = 10
+# Statuts qui signalent un serveur surchargé ou un début de blocage
+THROTTLE_STATUSES = (429, 503)
+# Échecs consécutifs qui ouvrent le disjoncteur, et durée d'ouverture en secondes
+BREAKER_THRESHOLD = 8
+BREAKER_COOLDOWN = 60
+
+_lock = threading.Lock()
+_controllers = {}
+
+
+class HostUnavailable(Exception):
+    """
+    Le disjoncteur de l'hôte est ouvert : l'hôte est en panne, la requête n'est pas envoyée.
+    """
+
+
+def configure(site_key=None, floor=None, ceiling=None, rate_ceiling=None):
+    """
+    Change les bornes de tous les hôtes, ou celles d'un site.
+
+    parameters :
+        - site_key (str): SITE_KEY du site, None pour les bornes par défaut
+        - floor (int): requêtes en cours minimum
+        - ceiling (int): requêtes en cours maximum
+        - rate_ceiling (float): débit maximum, en requêtes par seconde
+    """
+    limits = {"floor": floor, "ceiling": ceiling, "rate_ceiling": rate_ceiling}
+    limits = {name: value for name, value in limits.items() if value is not None}
+    if limits.get("floor", 1) < 1 or limits.get("floor", 1) > limits.get("ceiling", float("inf")):
+        raise ValueError(f"Bornes invalides : {limits} (il faut 1 <= floor <= ceiling)")
+    with _lock:
+        if site_key is None:
+            LIMITS.update(limits)
+        else:
+            SITE_LIMITS.setdefault(site_key, {}).update(limits)
+        # Les contrôleurs seront recréés avec les nouvelles bornes
+        _controllers.clear()
+
+
+def limits_for(host):
+    """
+    Bornes appliquées à un hôte : celles de son site, à défaut celles par défaut.
+    """
+    limits = dict(LIMITS)
+    for site_key, site_limits in SITE_LIMITS.items():
+        if site_key in (host or ""):
+            limits.update(site_limits)
+    return limits
+
+
+def max_ceiling():
+    """
+    Plus grand nombre de requêtes en cours autorisé pour un hôte (taille des pools de connexions).
+    """
+    return max([LIMITS["ceiling"]] + [limits.get("ceiling", 0) for limits in SITE_LIMITS.values()])
+
+
+class HostController:
+    """
+    Fenêtre de requêtes en cours et débit d'un hôte, ajustés en AIMD.
+    """
+
+    def __init__(self, host, floor, ceiling, rate_ceiling):
+        self.host = host
+        self.floor = floor
+        self.ceiling = ceiling
+        self.rate_ceiling = rate_ceiling
+        self.limit = float(min(max(INITIAL, floor), ceiling))
+        self.rate = rate_ceiling
+        self.in_flight = 0
+        self.requests = 0
+        self.errors = 0
+        self.throttled = 0
+        self.decreases = 0
+        self.retries = 0
+        self.timeouts = 0
+        self.breaker_opens = 0
+        self._failures = 0
+        self._open_until = None
+        self._probing = False
+        self._latency = None
+        self._baseline = None
+        self._samples = 0
+        self._next_start = 0.0
+        self._paused_until = 0.0
+        self._last_decrease = 0.0
+        self._slow_start = True
+        self._condition = threading.Condition()
+
+    def _try_acquire(self):
+        """
+        Prend une place si la limite et le débit le permettent.
+
+        return :
+            - 0 si la place est prise, sinon le délai à attendre en secondes
+              (None : attendre qu'une requête en cours se termine)
+        """
+        now = time.monotonic()
+        # Disjoncteur ouvert, ou requête d'essai déjà en cours
+        if self._open_until is not None and (now < self._open_until or self._probing):
+            raise HostUnavailable(f"{self.host} est indisponible (disjoncteur ouvert)")
+        if now < self._paused_until:
+            return self._paused_until - now
+        if self.in_flight >= int(self.limit):
+            return None
+        if now < self._next_start:
+            return self._next_start - now
+        # Demi-ouvert : la requête qui prend la place est la requête d'essai
+        self._probing = self._open_until is not None
+        self.in_flight += 1
+        self.requests += 1
+        self._next_start = now + 1 / self.rate
+        return 0
+
+    def acquire(self):
+        """
+        Attend une place (threads).
+        """
+        with self._condition:
+            while True:
+                wait = self._try_acquire()
+                if wait == 0:
+                    return
+                self._condition.wait(wait)
+
+    async def acquire_async(self):
+        """
+        Attend une place sans bloquer la boucle asyncio.
+        """
+        while True:
+            with self._condition:
+                wait = self._try_acquire()
+            if wait == 0:
+                return
+            await asyncio.sleep(0.01 if wait is None else wait)
+
+    def release(self, latency, status=None, retry_after=None, timeout=False):
+        """
+        Libère la place et ajuste la limite et le débit d'après la réponse.
+
+        parameters :
+            - latency (float): durée de la requête, en secondes
+            - status (int): statut HTTP, None en cas d'erreur réseau
+            - retry_after (str): en-tête Retry-After de la réponse
+            - timeout (bool): la requête a expiré
+        """
+        with self._condition:
+            self.in_flight -= 1
+            now = time.monotonic()
+            if timeout:
+                self.timeouts += 1
+            self._trip(now, failed=status is None or status >= 500)
+            if status is None or status in THROTTLE_STATUSES or status >= 500:
+                if status is None or status >= 500:
+                    self.errors += 1
+                if status in THROTTLE_STATUSES:
+                    self.throttled += 1
+                if status == 429 and retry_after and retry_after.isdigit():
+                    self._paused_until = max(self._paused_until, now + int(retry_after))
+                self._decrease(BACKOFF, now)
+            else:
+                # Seules les pages complètes sont mesurées (un 304 ou un 404 répond sans corps)
+                if status == 200:
+                    self._measure(latency)
+                if self._samples >= WARMUP and self._latency > LATENCY_FACTOR * self._baseline:
+                    self._decrease(SLOWDOWN, now, rate=False)
+                else:
+                    self.limit = min(self.ceiling, self.limit + (1 if self._slow_start else 1 / self.limit))
+                    self.rate = min(self.rate_ceiling, self.rate + RATE_STEP / self.limit)
+            self._condition.notify_all()
+
+    def _trip(self, now, failed):
+        """
+        Compte les échecs consécutifs et ouvre ou referme le disjoncteur.
+        """
+        probe, self._probing = self._probing, False
+        if not failed:
+            self._failures = 0
+            self._open_until = None
+            return
+        self._failures += 1
+        if probe or (self._open_until is None and self._failures >= BREAKER_THRESHOLD):
+            self._open_until = now + BREAKER_COOLDOWN
+            self.breaker_opens += 1
+            print(f"{self.host} ne répond plus, abandon pendant {BREAKER_COOLDOWN} s.")
+
+    def retried(self):
+        with self._condition:
+            self.retries += 1
+
+    def _measure(self, latency):
+        self._samples += 1
+        if self._latency is None:
+            self._latency = self._baseline = latency
+            return
+        self._latency = EWMA_WEIGHT * latency + (1 - EWMA_WEIGHT) * self._latency
+        self._baseline = BASELINE_WEIGHT * latency + (1 - BASELINE_WEIGHT) * self._baseline
+
+    def _decrease(self, factor, now, rate=True):
+        # Une seule diminution par aller-retour
+        if now - self._last_decrease < (self._latency or 0):
+            return
+        self._last_decrease = now
+        self._slow_start = False
+        self.decreases += 1
+        self.limit = max(self.floor, self.limit * factor)
+        if rate:
+            self.rate = max(RATE_FLOOR, self.rate * factor)
+
+    def stats(self):
+        with self._condition:
+            return {
+                "limit": int(self.limit),
+                "rate": round(self.rate, 1),
+                "requests": self.requests,
+                "errors": self.errors,
+                "throttled": self.throttled,
+                "decreases": self.decreases,
+                "retries": self.retries,
+                "timeouts": self.timeouts,
+                "breaker_opens": self.breaker_opens,
+            }
+
+
+def get_controller(host):
+    """
+    Retourne le contrôleur de l'hôte, créé au premier appel.
+    """
+    with _lock:
+        if host not in _controllers:
+            limits = limits_for(host)
+            _controllers[host] = HostController(host, limits["floor"], limits["ceiling"], limits["rate_ceiling"])
+        return _controllers[host]
+
+
+def stats():
+    """
+    État des contrôleurs du processus.
+
+    return :
+        - stats (dict) : {hôte: {"limit", "rate", "requests", "errors", "throttled", "decreases",
+                                 "retries", "timeouts", "breaker_opens"}}
+    """
+    with _lock:
+        controllers = list(_controllers.values())
+    return {controller.host: controller.stats() for controller in controllers}
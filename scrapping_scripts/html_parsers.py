@@ -0,0 +1,172 @@
+"""
+Choix du parseur HTML qui construit les `soup` passées aux fonctions d'extraction.
+
+- "html.parser" : BeautifulSoup avec le parseur pur Python (comportement historique)
+- "lxml" : BeautifulSoup avec le tree builder lxml (en C), même API, plus rapide
+- "selectolax" : parseur lexbor (en C), enveloppé dans `LexborTag` qui expose la partie
+  de l'API BeautifulSoup utilisée par les scrapers (select, select_one, find, find_all,
+  get, [], get_text)
+
+Le parseur se choisit par site (`configure`). Pour les pages de liste, `make_soup`
+accepte un sélecteur simple (`LISTING_ONLY` des modules de site, ex. "a.common-ad-card") :
+avec BeautifulSoup, seules ces balises et leur contenu sont construites (SoupStrainer).
+lxml et selectolax sont optionnels (pip install lxml selectolax).
+"""
+import importlib.util
+import time
+
+from bs4 import BeautifulSoup, SoupStrainer
+
+from scrapping_scripts import metrics
+
+BACKENDS = ("html.parser", "lxml", "selectolax")
+# Parseur utilisé par défaut
+DEFAULT_BACKEND = "html.parser"
+# Parseur choisi pour un site (clé : SITE_KEY), prioritaire sur DEFAULT_BACKEND
+SITE_BACKENDS = {}
+
+# Module à installer pour chaque parseur optionnel
+_REQUIRED_MODULES = {"lxml": "lxml", "selectolax": "selectolax"}
+# Balises dont le texte n'est pas rendu par get_text (comme BeautifulSoup)
+_NON_TEXT_TAGS = ("script", "style", "template")
+
+
+def configure(backend, site_key=None):
+    """
+    Choisit le parseur par défaut, ou celui d'un site.
+
+    parameters :
+        - backend (str): "html.parser", "lxml" ou "selectolax"
+        - site_key (str): SITE_KEY du site, None pour changer le parseur par défaut
+    """
+    global DEFAULT_BACKEND
+    if backend not in BACKENDS:
+        raise ValueError(f"Parseur inconnu : {backend} (choix : {', '.join(BACKENDS)})")
+    module = _REQUIRED_MODULES.get(backend)
+    if module and importlib.util.find_spec(module) is None:
+        print(f"Le parseur {backend} n'est pas installé (pip install {module}), html.parser sera utilisé.")
+        backend = "html.parser"
+    if site_key is None:
+        DEFAULT_BACKEND = backend
+    else:
+        SITE_BACKENDS[site_key] = backend
+
+
+def backend_for(site_key):
+    """
+    Retourne le parseur utilisé pour le site.
+    """
+    return SITE_BACKENDS.get(site_key, DEFAULT_BACKEND)
+
+
+def _strainer(selector):
+    """
+    Transforme un sélecteur simple "balise.classe1.classe2" en SoupStrainer.
+    """
+    name, *classes = selector.split(".")
+    if not classes:
+        return SoupStrainer(name or None)
+
+    def has_classes(value):
+        if value is None:
+            return False
+        values = value.split() if isinstance(value, str) else value
+        return set(classes).issubset(values)
+
+    return SoupStrainer(name or None, attrs={"class": has_classes})
+
+
+def make_soup(content, site_key=None, only=None, stage="product"):
+    """
+    Parse une page avec le parseur du site.
+
+    parameters :
+        - content (bytes|str): contenu de la page
+        - site_key (str): SITE_KEY du site
+        - only (str): sélecteur simple "balise.classe" des seules balises à construire
+          (ignoré par selectolax, qui construit toujours le document complet)
+        - stage (str): type de page (listing, categories, product), pour les métriques
+    return :
+        - soup (BeautifulSoup|LexborTag) : document sur lequel appeler select, find...
+    """
+    backend = backend_for(site_key)
+    start = time.perf_counter()
+    if backend == "selectolax":
+        from selectolax.lexbor import LexborHTMLParser
+
+        # Le noeud document : select("html ...") fonctionne comme avec BeautifulSoup
+        soup = LexborTag(LexborHTMLParser(content).root.parent)
+    else:
+        parse_only = _strainer(only) if only else None
+        soup = BeautifulSoup(content, backend, parse_only=parse_only)
+    metrics.observe("parse_seconds", time.perf_counter() - start, site=site_key, stage=stage)
+    return soup
+
+
+def _css(name=None, class_=None):
+    selector = name or "*"
+    if class_:
+        selector += "." + ".".join(class_.split())
+    return selector
+
+
+class LexborTag:
+    """
+    Noeud selectolax présenté avec l'API BeautifulSoup utilisée par les scrapers.
+    """
+
+    __slots__ = ("_node",)
+
+    def __init__(self, node):
+        self._node = node
+
+    def __repr__(self):
+        return self._node.html or ""
+
+    @property
+    def name(self):
+        return self._node.tag
+
+    @property
+    def attrs(self):
+        # Attribut sans valeur (ex. <input checked>) : "" comme BeautifulSoup
+        return {key: "" if value is None else value for key, value in self._node.attributes.items()}
+
+    def get(self, key, default=None):
+        return self.attrs.get(key, default)
+
+    def __getitem__(self, key):
+        return self.attrs[key]
+
+    def select(self, selector):
+        # selectolax inclut le noeud lui-même dans les résultats, BeautifulSoup non
+        return [LexborTag(node) for node in self._node.css(selector) if node != self._node]
+
+    def select_one(self, selector):
+        for node in self._node.css(selector):
+            if node != self._node:
+                return LexborTag(node)
+        return None
+
+    def find(self, name=None, class_=None):
+        return self.select_one(_css(name, class_))
+
+    def find_all(self, name=None, class_=None):
+        return self.select(_css(name, class_))
+
+    def get_text(self, separator="", strip=False):
+        strings = []
+        for node in self._node.traverse(include_text=True):
+            if node.tag != "-text" or node.parent.tag in _NON_TEXT_TAGS:
+                continue
+            text = node.text_content
+            if strip:
+                text = text.strip()
+                if not text:
+                    continue
+            strings.append(text)
+        return separator.join(strings)
+
+    @property
+    def text(self):
+        return self.get_text()
@@ -0,0 +1,220 @@
+"""
+Cache HTTP sur disque avec revalidation conditionnelle (ETag / Last-Modified).
+
+Les pages qui changent peu (page des catégories, pages de liste) sont gardées dans
+files/http_cache.sqlite avec leurs validateurs. Tant qu'une page est plus jeune que la
+durée de vie de sa classe d'URL (TTL), elle n'est pas re-téléchargée. Au-delà, la
+requête est envoyée avec If-None-Match / If-Modified-Since : une réponse 304 ne
+transfère aucun corps et la page n'est pas re-parsée (le résultat du parsing précédent
+est réutilisé quand il a été enregistré).
+
+Avec --archive, une page servie par le cache est aussi ajoutée à l'archive de l'exécution
+(voir archive.py), comme si elle avait été téléchargée : la relecture d'une archive
+(--replay) ne dépend pas du cache de l'exécution qui l'a écrite.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from scrapping_scripts import archive, http_session
+
+DB_PATH = "./files/http_cache.sqlite"
+
+# Durée de vie d'une page en cache, en secondes, par classe d'URL
+TTL = {
+    "categories": 7 * 24 * 3600,  # les catégories ne changent presque jamais
+    "listing": 3600,              # les pages de liste changent à chaque nouvelle annonce
+}
+
+_lock = threading.Lock()
+_cache = None
+
+
+class CachedResponse:
+    """
+    Réponse renvoyée par `fetch`. `not_modified` est vrai quand le contenu vient du
+    cache (page encore fraîche ou réponse 304) : il est alors inutile de le re-parser.
+    """
+
+    def __init__(self, status_code, content, not_modified=False, parsed=None):
+        self.status_code = status_code
+        self.content = content
+        self.not_modified = not_modified
+        self.parsed = parsed
+
+
+class HttpCache:
+    """
+    Table des réponses en cache, clé : l'URL.
+    """
+
+    def __init__(self, db_path=DB_PATH):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, timeout=60, check_same_thread=False)
+        # WAL : plusieurs processus (un par site) peuvent écrire dans la même base
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " url TEXT PRIMARY KEY,"
+            " etag TEXT,"
+            " last_modified TEXT,"
+            " fetched_at REAL NOT NULL,"
+            " body BLOB NOT NULL,"
+            " parsed TEXT"
+            ")"
+        )
+
+    def get(self, url):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT etag, last_modified, fetched_at, body, parsed FROM responses WHERE url = ?", (url,)
+            ).fetchone()
+        if row is None:
+            return None
+        etag, last_modified, fetched_at, body, parsed = row
+        return {
+            "etag": etag,
+            "last_modified": last_modified,
+            "fetched_at": fetched_at,
+            "body": body,
+            "parsed": json.loads(parsed) if parsed is not None else None,
+        }
+
+    def store(self, url, headers, body):
+        """
+        Enregistre une réponse 200 (le résultat de parsing précédent est effacé).
+        """
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (url, etag, last_modified, fetched_at, body, parsed)"
+                " VALUES (?, ?, ?, ?, ?, NULL)",
+                (url, headers.get("ETag"), headers.get("Last-Modified"), time.time(), body),
+            )
+
+    def touch(self, url):
+        """
+        La page a été revalidée (304) : sa durée de vie repart de zéro.
+        """
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE responses SET fetched_at = ? WHERE url = ?", (time.time(), url))
+
+    def store_parsed(self, url, parsed):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE responses SET parsed = ? WHERE url = ?", (json.dumps(parsed, ensure_ascii=False), url)
+            )
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def get_cache():
+    """
+    Retourne le cache du processus, ouvert au premier appel.
+    """
+    global _cache
+    with _lock:
+        if _cache is None:
+            _cache = HttpCache(DB_PATH)
+        return _cache
+
+
+def close():
+    """
+    Ferme le cache ouvert par le processus courant.
+    """
+    global _cache
+    with _lock:
+        if _cache is not None:
+            _cache.close()
+            _cache = None
+
+
+def reset(db_path=None):
+    """
+    Supprime le cache (utilisé par Crawler.reset).
+    """
+    db_path = db_path or DB_PATH
+    close()
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
+
+
+def is_fresh(entry, url_class):
+    """
+    Vrai si la page en cache est plus jeune que la durée de vie de sa classe d'URL.
+    """
+    return entry is not None and time.time() - entry["fetched_at"] < TTL.get(url_class, 0)
+
+
+def conditional_headers(entry):
+    """
+    En-têtes de revalidation à partir des validateurs de la page en cache.
+    """
+    headers = {}
+    if entry is not None:
+        if entry["etag"]:
+            headers["If-None-Match"] = entry["etag"]
+        if entry["last_modified"]:
+            headers["If-Modified-Since"] = entry["last_modified"]
+    return headers
+
+
+def cached_response(url, entry):
+    """
+    Réponse tirée du cache (page encore fraîche ou revalidée par un 304), archivée avec --archive.
+    """
+    if archive.ENABLED:
+        validators = {"ETag": entry["etag"], "Last-Modified": entry["last_modified"]}
+        archive.record(url, 200, {name: value for name, value in validators.items() if value}, entry["body"])
+    return CachedResponse(200, entry["body"], not_modified=True, parsed=entry["parsed"])
+
+
+def fetch(url, url_class):
+    """
+    Télécharge une page en passant par le cache.
+
+    parameters :
+        - url (str): url de la page
+        - url_class (str): classe d'URL, clé de TTL ("categories", "listing")
+    return :
+        - response (CachedResponse) : status_code, content, not_modified, parsed
+    """
+    cache = get_cache()
+    entry = cache.get(url)
+    if is_fresh(entry, url_class):
+        return cached_response(url, entry)
+
+    response = http_session.fetch(url, url_class, headers=conditional_headers(entry))
+    if response.status_code == 304 and entry is not None:
+        cache.touch(url)
+        return cached_response(url, entry)
+    if response.status_code == 200:
+        cache.store(url, response.headers, response.content)
+    return CachedResponse(response.status_code, response.content)
+
+
+def cached_parse(url, url_class, parse):
+    """
+    Télécharge une page via le cache et la parse, sauf si elle n'a pas changé depuis le
+    dernier parsing : le résultat enregistré (JSON) est alors renvoyé tel quel.
+
+    parameters :
+        - url (str): url de la page
+        - url_class (str): classe d'URL, clé de TTL
+        - parse (callable): fonction appelée avec le contenu de la page
+    return :
+        - le résultat de `parse`, ou None si la page n'est pas accessible
+    """
+    response = fetch(url, url_class)
+    if response.status_code != 200:
+        return None
+    if response.not_modified and response.parsed is not None:
+        return response.parsed
+    parsed = parse(response.content)
+    get_cache().store_parsed(url, parsed)
+    return parsed
@@ -0,0 +1,241 @@
+"""
+Couche HTTP partagée par tous les scrapers.
+
+Une seule session `requests` est partagée par tous les threads. Chaque hôte a son
+propre pool de connexions keep-alive : la poignée de main TCP+TLS n'est faite qu'une
+fois par connexion au lieu d'une fois par requête. Le nombre de requêtes en cours et
+le débit vers chaque hôte sont ajustés par son contrôleur AIMD (host_control.py).
+
+Chaque requête a un timeout de connexion et de lecture (TIMEOUT). Une erreur réseau,
+un timeout ou un statut transitoire (RETRY_STATUSES) est retenté jusqu'à RETRIES fois,
+après une attente exponentielle avec une part aléatoire (`retry_delay`).
+
+Avec --archive, chaque réponse reçue est ajoutée à l'archive WARC du processus ; avec
+--replay, les réponses sont lues dans une archive, sans accès au réseau (voir archive.py).
+"""
+import http.client
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+from scrapping_scripts import archive, host_control, metrics
+
+# Nombre de workers qui scrapent les produits d'une catégorie
+POOL_SIZE = 5
+# Nombre maximum de requêtes simultanées vers un même hôte, toutes catégories confondues
+# (plafond par défaut des contrôleurs de host_control, et taille du pool de connexions par hôte)
+MAX_PER_HOST = 10
+# Nombre d'hôtes dont le pool est conservé (on scrape six sites)
+POOL_HOSTS = 10
+
+# Timeouts de connexion et de lecture, en secondes
+TIMEOUT = (10, 30)
+# Nombre de nouvelles tentatives après un échec transitoire
+RETRIES = 3
+# Statuts transitoires qui justifient une nouvelle tentative
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+# Attente avant la première nouvelle tentative, doublée à chaque tentative, et plafond, en secondes
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 30.0
+
+# En-têtes envoyés avec toutes les requêtes
+DEFAULT_HEADERS = {
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+    "Accept-Language": "fr-FR,fr;q=0.9,en;q=0.8",
+    "Connection": "keep-alive",
+}
+
+_lock = threading.Lock()
+_session = None
+# Nombre de sockets réellement ouverts par hôte (poignées de main TCP/TLS)
+_opened = {}
+
+
+def _count_connect(host):
+    with _lock:
+        _opened[host] = _opened.get(host, 0) + 1
+
+
+class _CountingHTTPConnection(HTTPConnection):
+    def connect(self):
+        _count_connect(self.host)
+        super().connect()
+
+
+class _CountingHTTPSConnection(HTTPSConnection):
+    def connect(self):
+        _count_connect(self.host)
+        super().connect()
+
+
+class _CountingHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _CountingHTTPConnection
+
+
+class _CountingHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _CountingHTTPSConnection
+
+
+def _build_session(pool_size):
+    """
+    Crée une session avec un pool de `pool_size` connexions par hôte.
+    """
+    session = requests.Session()
+    session.headers.update(DEFAULT_HEADERS)
+    # Un site peut avoir un plafond de requêtes en cours plus haut que MAX_PER_HOST
+    pool_size = max(pool_size, host_control.max_ceiling())
+    adapter = HTTPAdapter(pool_connections=POOL_HOSTS, pool_maxsize=pool_size, pool_block=True)
+    adapter.poolmanager.pool_classes_by_scheme = {
+        "http": _CountingHTTPConnectionPool,
+        "https": _CountingHTTPSConnectionPool,
+    }
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def configure(pool_size=None, max_per_host=None, headers=None):
+    """
+    Modifie la taille des pools et/ou les en-têtes par défaut.
+    La session existante est fermée et sera recréée au prochain appel.
+
+    parameters :
+        - pool_size (int): nombre de workers par catégorie
+        - max_per_host (int): requêtes simultanées maximum (et connexions) par hôte
+        - headers (dict): en-têtes à ajouter aux en-têtes par défaut
+    """
+    global POOL_SIZE, MAX_PER_HOST, _session
+    with _lock:
+        if pool_size is not None:
+            POOL_SIZE = pool_size
+        if max_per_host is not None:
+            MAX_PER_HOST = max_per_host
+            host_control.configure(ceiling=max_per_host)
+        if headers:
+            DEFAULT_HEADERS.update(headers)
+        if _session is not None:
+            _session.close()
+            _session = None
+
+
+def get_session():
+    """
+    Retourne la session partagée, en la créant au premier appel.
+    """
+    global _session
+    if _session is None:
+        with _lock:
+            if _session is None:
+                _session = _build_session(MAX_PER_HOST)
+    return _session
+
+
+def retry_delay(attempt):
+    """
+    Attente avant la nouvelle tentative numéro `attempt` (1, 2...) : exponentielle, dont
+    une moitié est tirée au hasard pour que les workers ne retentent pas tous en même temps.
+    """
+    delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (attempt - 1))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+def record(host, stage, latency, status=None, size=0):
+    """
+    Enregistre une requête dans les métriques (voir metrics.py) ; status None : erreur réseau.
+    """
+    metrics.inc("http_requests_total", host=host, stage=stage, status=status or "error")
+    metrics.inc("http_response_bytes_total", size, host=host, stage=stage)
+    metrics.observe("http_request_seconds", latency, host=host, stage=stage)
+
+
+def _replayed(url, stage):
+    """
+    Réponse archivée d'une URL (voir archive.replay), sous forme de requests.Response.
+    """
+    start = time.monotonic()
+    status, headers, content = archive.replay(url)
+    record(urlsplit(url).hostname, stage, time.monotonic() - start, status, len(content))
+    response = requests.Response()
+    response.url = url
+    response.status_code = status
+    response.reason = http.client.responses.get(status, "")
+    response.headers = CaseInsensitiveDict(headers)
+    response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+    response._content = content
+    return response
+
+
+def fetch(url, stage="product", **kwargs):
+    """
+    Équivalent de `requests.get` qui passe par les connexions poolées.
+    Bloque tant que le contrôleur de l'hôte n'autorise pas une nouvelle requête, et
+    retente les échecs transitoires (voir RETRIES). Lève host_control.HostUnavailable
+    si le disjoncteur de l'hôte est ouvert. `stage` (listing, categories, product)
+    étiquette la requête dans les métriques.
+    En mode relecture (--replay), la réponse est lue dans l'archive, sans requête.
+    """
+    if archive.REPLAY:
+        return _replayed(url, stage)
+    kwargs.setdefault("timeout", TIMEOUT)
+    host = urlsplit(url).hostname
+    controller = host_control.get_controller(host)
+    for attempt in range(RETRIES + 1):
+        if attempt:
+            controller.retried()
+            time.sleep(retry_delay(attempt))
+        controller.acquire()
+        start = time.monotonic()
+        try:
+            response = get_session().get(url, **kwargs)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            controller.release(time.monotonic() - start, timeout=isinstance(e, requests.Timeout))
+            record(host, stage, time.monotonic() - start)
+            if attempt == RETRIES:
+                raise
+            print(f"Erreur lors de l'accès à {url} : {e!r}, nouvelle tentative.")
+            continue
+        except requests.RequestException:
+            controller.release(time.monotonic() - start)
+            record(host, stage, time.monotonic() - start)
+            raise
+        latency = time.monotonic() - start
+        controller.release(latency, response.status_code, response.headers.get("Retry-After"))
+        record(host, stage, latency, response.status_code, len(response.content))
+        archive.record(url, response.status_code, response.headers, response.content)
+        if response.status_code not in RETRY_STATUSES or attempt == RETRIES:
+            return response
+        print(f"Statut {response.status_code} pour {url}, nouvelle tentative.")
+
+
+def connection_stats():
+    """
+    Statistiques de réutilisation des connexions, par hôte, et état de son contrôleur.
+
+    return :
+        - stats (dict) : {hôte: {"requests", "connections", "reused"} et l'état de son contrôleur
+          (voir host_control.stats)}
+    """
+    stats = {}
+    for host, controller in host_control.stats().items():
+        stats[host] = {**controller, "requests": 0, "connections": 0, "reused": 0}
+    if _session is None:
+        return stats
+    adapter = _session.get_adapter("https://")
+    pools = adapter.poolmanager.pools
+    for key in pools.keys():
+        pool = pools.get(key)
+        if pool is None:
+            continue
+        entry = stats.setdefault(pool.host, {"requests": 0, "connections": 0, "reused": 0})
+        entry["requests"] += pool.num_requests
+    for host, entry in stats.items():
+        entry["connections"] = _opened.get(host, 0)
+        entry["reused"] = max(entry["requests"] - entry["connections"], 0)
+    return stats
@@ -0,0 +1,232 @@
+"""
+Journal de reprise des exécutions interrompues.
+
+Remplace les fichiers Produits_<site>/<catégorie>.jsonl. Le journal (files/journal.sqlite)
+garde, pour l'exécution en cours, les pages de liste terminées, les catégories terminées
+et les produits déjà scrappés. Chaque produit est enregistré dès qu'il est scrappé
+(`record_product`) ; une page est validée en une seule transaction, une fois tous ses
+produits scrappés : ses produits et la page elle-même sont écrits ensemble, puis ses
+liens sont ajoutés à l'index des URLs vues. Un lien n'est donc jamais marqué comme vu
+avant que son produit soit enregistré.
+
+Si l'exécution est tuée (timeout de GitHub Actions...), la suivante saute les catégories
+et les pages déjà validées, sans les re-télécharger, et relit leurs produits depuis le
+journal. Les liens des produits enregistrés sont vus : une page interrompue est re-parsée,
+mais seuls ses produits manquants sont re-téléchargés. Le journal d'un site est vidé
+(`clear`) une fois ses produits sauvegardés.
+"""
+import json
+import os
+import sqlite3
+import threading
+
+from scrapping_scripts import url_store
+
+DB_PATH = "./files/journal.sqlite"
+
+_journals = {}
+_journals_lock = threading.Lock()
+
+
+def _connect(db_path):
+    conn = sqlite3.connect(db_path, timeout=60, check_same_thread=False)
+    # WAL : plusieurs processus (un par site) peuvent écrire dans la même base
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(
+        "CREATE TABLE IF NOT EXISTS pages ("
+        " site TEXT NOT NULL,"
+        " category TEXT NOT NULL,"
+        " page INTEGER NOT NULL,"
+        " PRIMARY KEY (site, category, page)"
+        ") WITHOUT ROWID;"
+        "CREATE TABLE IF NOT EXISTS categories ("
+        " site TEXT NOT NULL,"
+        " category TEXT NOT NULL,"
+        " PRIMARY KEY (site, category)"
+        ") WITHOUT ROWID;"
+        "CREATE TABLE IF NOT EXISTS products ("
+        " site TEXT NOT NULL,"
+        " url TEXT NOT NULL,"
+        " category TEXT NOT NULL,"
+        " page INTEGER NOT NULL,"
+        " position INTEGER NOT NULL,"
+        " data TEXT NOT NULL,"
+        " written INTEGER NOT NULL DEFAULT 0,"
+        " PRIMARY KEY (site, url)"
+        ");"
+    )
+    return conn
+
+
+def _category_key(category):
+    # MTN n'a pas de catégories (Nom = None)
+    return category or ""
+
+
+class Journal:
+    """
+    Progression de l'exécution en cours pour un site.
+    """
+
+    def __init__(self, site_key, db_path=DB_PATH):
+        self.site_key = site_key
+        self._lock = threading.Lock()
+        self._conn = _connect(db_path)
+        self._pages = set(self._conn.execute("SELECT category, page FROM pages WHERE site = ?", (site_key,)))
+        self._categories = {
+            row[0] for row in self._conn.execute("SELECT category FROM categories WHERE site = ?", (site_key,))
+        }
+        # Les liens des produits validés sont vus, même si l'exécution a été tuée
+        # entre la validation d'une page et la mise à jour de l'index
+        urls = [row[0] for row in self._conn.execute("SELECT url FROM products WHERE site = ?", (site_key,))]
+        url_store.get_store(site_key).add_many(urls)
+
+    def page_done(self, category, page):
+        return (_category_key(category), page) in self._pages
+
+    def category_done(self, category):
+        return _category_key(category) in self._categories
+
+    def commit_page(self, category, page, products):
+        """
+        Valide une page et ses produits en une seule transaction.
+
+        parameters :
+            - category (str): nom de la catégorie
+            - page (int): numéro de la page de liste
+            - products (list): (url, produit) des produits scrappés de la page, dans l'ordre de la page
+        """
+        category = _category_key(category)
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO products (site, url, category, page, position, data)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (self.site_key, url, category, page, position, json.dumps(product, ensure_ascii=False))
+                    for position, (url, product) in enumerate(products)
+                ],
+            )
+            self._conn.execute(
+                "INSERT OR IGNORE INTO pages (site, category, page) VALUES (?, ?, ?)", (self.site_key, category, page)
+            )
+            self._pages.add((category, page))
+
+    def record_product(self, category, page, position, url, product):
+        """
+        Enregistre un produit scrappé sans attendre la validation de sa page.
+
+        parameters :
+            - category (str): nom de la catégorie
+            - page (int): numéro de la page de liste
+            - position (int): position du produit parmi les nouveaux produits de la page
+            - url (str): lien du produit
+            - product (dict): produit scrappé
+        """
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO products (site, url, category, page, position, data)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (self.site_key, url, _category_key(category), page, position, json.dumps(product, ensure_ascii=False)),
+            )
+
+    def commit_category(self, category):
+        category = _category_key(category)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO categories (site, category) VALUES (?, ?)", (self.site_key, category)
+            )
+            self._categories.add(category)
+
+    def products(self, category=None, unwritten=False):
+        """
+        Produits validés du site (ou d'une catégorie), dans l'ordre des pages de liste.
+
+        parameters :
+            - category (str): nom de la catégorie, None pour tout le site
+            - unwritten (bool): seulement les produits pas encore écrits par le sink
+        """
+        query = "SELECT data FROM products WHERE site = ?"
+        params = [self.site_key]
+        if category is not None:
+            query += " AND category = ?"
+            params.append(_category_key(category))
+        if unwritten:
+            query += " AND written = 0"
+        query += " ORDER BY category, page, position"
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def mark_written(self, urls):
+        """
+        Les produits ont été écrits dans le fichier de sortie par le sink.
+        """
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "UPDATE products SET written = 1 WHERE site = ? AND url = ?", [(self.site_key, url) for url in urls]
+            )
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def get_journal(site_key):
+    """
+    Retourne le journal du site, chargé au premier appel puis partagé par tous les threads.
+    """
+    with _journals_lock:
+        if site_key not in _journals:
+            _journals[site_key] = Journal(site_key, DB_PATH)
+        return _journals[site_key]
+
+
+def close_all():
+    """
+    Ferme les journaux ouverts par le processus courant.
+    """
+    with _journals_lock:
+        for journal in _journals.values():
+            journal.close()
+        _journals.clear()
+
+
+def clear(site_keys, db_path=None):
+    """
+    Vide le journal des sites dont les produits sont sauvegardés : leur prochaine
+    exécution repart de zéro.
+    """
+    db_path = db_path or DB_PATH
+    site_keys = list(site_keys)
+    if not site_keys or not os.path.exists(db_path):
+        return
+    close_all()
+    conn = _connect(db_path)
+    with conn:
+        for table in ("pages", "categories", "products"):
+            conn.executemany(f"DELETE FROM {table} WHERE site = ?", [(site_key,) for site_key in site_keys])
+    conn.close()
+
+
+def resumed_sites(db_path=None):
+    """
+    Sites dont une exécution précédente a été interrompue (journal non vide).
+    """
+    db_path = db_path or DB_PATH
+    if not os.path.exists(db_path):
+        return []
+    conn = _connect(db_path)
+    rows = conn.execute("SELECT DISTINCT site FROM pages UNION SELECT DISTINCT site FROM categories").fetchall()
+    conn.close()
+    return sorted(row[0] for row in rows)
+
+
+def reset(db_path=None):
+    """
+    Supprime le journal (utilisé par Crawler.reset).
+    """
+    db_path = db_path or DB_PATH
+    close_all()
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
@@ -0,0 +1,283 @@
+"""
+Métriques du crawl, par site et par étape.
+
+Jusqu'ici une exécution ne laissait que sa durée totale dans files/log_file.txt. Les
+modules du crawl enregistrent ici, au fil de l'eau :
+
+- http_requests_total : requêtes HTTP envoyées (nouvelles tentatives comprises), par hôte,
+  étape (listing, categories, product) et statut ("error" : erreur réseau ou timeout) ;
+- http_response_bytes_total : octets reçus, par hôte et étape ;
+- http_request_seconds : histogramme des latences, par hôte et étape ;
+- parse_seconds : histogramme du temps de construction du document HTML, par site et étape ;
+- listing_pages_total : pages de liste parsées ou inchangées (not_modified), par site ;
+- products_total : produits validés dans le journal, par site ;
+- dedup_hits_total : liens d'une page de liste déjà vus ou déjà réservés, par site ;
+- queue_depth : plus grand nombre de produits en attente de scraping, par site.
+
+Le registre est propre au processus et partagé par les threads. Les processus workers
+(--parallel-sites, frontière) renvoient leur `snapshot` au processus principal, qui
+l'ajoute au sien (`merge`). En fin d'exécution, `write` produit un rapport JSON (résumé par
+site et valeurs brutes) et un fichier texte au format Prometheus, à exposer par exemple
+avec le textfile collector de node_exporter.
+"""
+import json
+import os
+import threading
+
+JSON_PATH = "./files/metrics.json"
+PROM_PATH = "./files/metrics.prom"
+
+# Préfixe des noms de métriques au format Prometheus
+PREFIX = "scraper_"
+# Bornes supérieures des intervalles des histogrammes, en secondes
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Type et description de chaque métrique
+METRICS = {
+    "http_requests_total": ("counter", "HTTP requests sent, retries included"),
+    "http_response_bytes_total": ("counter", "Bytes of the HTTP response bodies"),
+    "http_request_seconds": ("histogram", "HTTP request latency in seconds"),
+    "parse_seconds": ("histogram", "Time spent building the HTML document, in seconds"),
+    "listing_pages_total": ("counter", "Listing pages parsed or found unchanged"),
+    "products_total": ("counter", "Products committed to the journal"),
+    "dedup_hits_total": ("counter", "Listing links already seen or already claimed"),
+    "queue_depth": ("gauge", "Largest number of products waiting to be scraped"),
+}
+
+_lock = threading.Lock()
+_counters = {}
+_histograms = {}
+_gauges = {}
+
+
+def _key(name, labels):
+    return name, tuple(sorted((label, str(value)) for label, value in labels.items()))
+
+
+def inc(name, value=1, **labels):
+    """
+    Ajoute `value` au compteur `name` des étiquettes données.
+    """
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def observe(name, value, **labels):
+    """
+    Ajoute une mesure (en secondes) à l'histogramme `name` des étiquettes données.
+    """
+    key = _key(name, labels)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            # Un compteur par intervalle de BUCKETS, plus les mesures au-delà, puis la somme
+            histogram = _histograms[key] = [0] * (len(BUCKETS) + 1) + [0.0]
+        index = next((index for index, bound in enumerate(BUCKETS) if value <= bound), len(BUCKETS))
+        histogram[index] += 1
+        histogram[-1] += value
+
+
+def peak(name, value, **labels):
+    """
+    Garde la plus grande valeur observée de la jauge `name` des étiquettes données.
+    """
+    key = _key(name, labels)
+    with _lock:
+        _gauges[key] = max(_gauges.get(key, value), value)
+
+
+def snapshot():
+    """
+    Copie des métriques du processus, à renvoyer au processus principal (`merge`).
+
+    return :
+        - snapshot (dict) : {"counters", "histograms", "gauges"}, chacun une liste de
+          (nom, étiquettes, valeur)
+    """
+    with _lock:
+        return {
+            "counters": [(name, dict(labels), value) for (name, labels), value in _counters.items()],
+            "histograms": [(name, dict(labels), list(value)) for (name, labels), value in _histograms.items()],
+            "gauges": [(name, dict(labels), value) for (name, labels), value in _gauges.items()],
+        }
+
+
+def merge(other):
+    """
+    Ajoute les métriques d'un processus worker (voir `snapshot`) à celles du processus.
+    """
+    for name, labels, value in other["counters"]:
+        inc(name, value, **labels)
+    for name, labels, value in other["gauges"]:
+        peak(name, value, **labels)
+    with _lock:
+        for name, labels, value in other["histograms"]:
+            key = _key(name, labels)
+            histogram = _histograms.setdefault(key, [0] * (len(BUCKETS) + 1) + [0.0])
+            _histograms[key] = [mine + theirs for mine, theirs in zip(histogram, value)]
+
+
+def reset():
+    """
+    Remet les métriques du processus à zéro (début d'une exécution, processus worker).
+    """
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+        _gauges.clear()
+
+
+def _site(labels, site_keys):
+    # Les métriques HTTP sont relevées par hôte : le site est la SITE_KEY contenue dans le nom d'hôte
+    if "site" in labels:
+        return labels["site"]
+    host = labels.get("host", "")
+    return next((site_key for site_key in site_keys if site_key in host), host)
+
+
+def _quantile(histogram, q):
+    """
+    Borne supérieure de l'intervalle qui contient le quantile `q` (None au-delà de BUCKETS).
+    """
+    count = sum(histogram[:-1])
+    if not count:
+        return None
+    seen = 0
+    for bound, bucket in zip(BUCKETS, histogram):
+        seen += bucket
+        if seen >= q * count:
+            return bound
+    return None
+
+
+def _distribution(histogram):
+    count = sum(histogram[:-1])
+    return {
+        "count": count,
+        "mean": round(histogram[-1] / count, 4) if count else None,
+        "p50": _quantile(histogram, 0.5),
+        "p95": _quantile(histogram, 0.95),
+    }
+
+
+def report(duration, site_keys=(), **run):
+    """
+    Rapport de l'exécution : résumé par site et par étape, et métriques brutes.
+
+    parameters :
+        - duration (float): durée de l'exécution, en secondes (pour les produits par seconde)
+        - site_keys (iterable): SITE_KEY des sites, pour rattacher les hôtes à leur site
+        - run: informations sur l'exécution ajoutées telles quelles au rapport (moteur...)
+    return :
+        - report (dict) : sérialisable en JSON
+    """
+    site_keys = list(site_keys)
+    raw = snapshot()
+    sites = {}
+
+    def entry(labels):
+        return sites.setdefault(_site(labels, site_keys), {
+            "requests": 0, "bytes": 0, "statuses": {}, "latency": {}, "parse": {}, "listing_pages": {},
+            "products": 0, "products_per_second": 0.0, "dedup_hits": 0, "queue_depth": 0,
+        })
+
+    for name, labels, value in raw["counters"]:
+        site = entry(labels)
+        if name == "http_requests_total":
+            site["requests"] += value
+            site["statuses"][labels["status"]] = site["statuses"].get(labels["status"], 0) + value
+        elif name == "http_response_bytes_total":
+            site["bytes"] += value
+        elif name == "listing_pages_total":
+            site["listing_pages"][labels["result"]] = site["listing_pages"].get(labels["result"], 0) + value
+        elif name == "products_total":
+            site["products"] += value
+        elif name == "dedup_hits_total":
+            site["dedup_hits"] += value
+    for name, labels, value in raw["histograms"]:
+        site = entry(labels)
+        field = "latency" if name == "http_request_seconds" else "parse"
+        stages = site[field]
+        if labels["stage"] in stages:
+            # Plusieurs hôtes d'un même site : les histogrammes s'additionnent
+            value = [mine + theirs for mine, theirs in zip(stages[labels["stage"]], value)]
+        stages[labels["stage"]] = value
+    for name, labels, value in raw["gauges"]:
+        site = entry(labels)
+        site["queue_depth"] = max(site["queue_depth"], value)
+    for site in sites.values():
+        site["latency"] = {stage: _distribution(histogram) for stage, histogram in site["latency"].items()}
+        site["parse"] = {stage: _distribution(histogram) for stage, histogram in site["parse"].items()}
+        if duration:
+            site["products_per_second"] = round(site["products"] / duration, 3)
+    return {**run, "duration_seconds": round(duration, 3), "buckets": list(BUCKETS), "sites": sites,
+            "metrics": raw}
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"') for value in labels.values())
+    return "{" + ",".join(f'{label}="{value}"' for label, value in zip(labels, escaped)) + "}"
+
+
+def prometheus(site_keys=()):
+    """
+    Métriques du processus au format texte de Prometheus (les hôtes reçoivent aussi l'étiquette site).
+    """
+    site_keys = list(site_keys)
+    raw = snapshot()
+    series = {}
+    for kind in ("counters", "gauges", "histograms"):
+        for name, labels, value in raw[kind]:
+            if "host" in labels:
+                labels = {"site": _site(labels, site_keys), **labels}
+            series.setdefault(name, []).append((labels, value))
+
+    lines = []
+    for name in sorted(series):
+        kind, description = METRICS.get(name, ("untyped", name))
+        lines.append(f"# HELP {PREFIX}{name} {description}")
+        lines.append(f"# TYPE {PREFIX}{name} {kind}")
+        for labels, value in sorted(series[name], key=lambda item: sorted(item[0].items())):
+            if kind != "histogram":
+                lines.append(f"{PREFIX}{name}{_labels(labels)} {value}")
+                continue
+            cumulative = 0
+            for bound, bucket in zip([*BUCKETS, "+Inf"], value):
+                cumulative += bucket
+                lines.append(f"{PREFIX}{name}_bucket{_labels({**labels, 'le': bound})} {cumulative}")
+            lines.append(f"{PREFIX}{name}_sum{_labels(labels)} {value[-1]:.6f}")
+            lines.append(f"{PREFIX}{name}_count{_labels(labels)} {cumulative}")
+    return "\n".join(lines) + "\n"
+
+
+def _write(path, text):
+    # Fichier temporaire puis remplacement : un collecteur ne lit jamais un fichier à moitié écrit
+    temp_path = path + ".tmp"
+    with open(temp_path, "w", encoding="utf-8") as file:
+        file.write(text)
+    os.replace(temp_path, path)
+
+
+def write(duration, site_keys=(), json_path=None, prom_path=None, **run):
+    """
+    Écrit le rapport JSON de l'exécution et le fichier au format Prometheus.
+
+    parameters :
+        - duration (float): durée de l'exécution, en secondes
+        - site_keys (iterable): SITE_KEY des sites
+        - json_path (str): chemin du rapport JSON
+        - prom_path (str): chemin du fichier Prometheus
+        - run: informations sur l'exécution ajoutées au rapport (voir `report`)
+    return :
+        - report (dict) : le rapport écrit
+    """
+    json_path = json_path or JSON_PATH
+    prom_path = prom_path or PROM_PATH
+    site_keys = list(site_keys)
+    run_report = report(duration, site_keys, **run)
+    _write(json_path, json.dumps(run_report, ensure_ascii=False, indent=2))
+    _write(prom_path, prometheus(site_keys))
+    return run_report
@@ -0,0 +1,238 @@
+"""
+Stockage Parquet des produits scrappés, en ajout seul.
+
+Chaque exécution ajoute ses produits dans files/products/, partitionnés par site et
+par date de scrap (files/products/site=<SITE_KEY>/scrap_date=<AAAA-MM-JJ>/*.parquet) :
+le coût d'une écriture ne dépend plus de la taille de l'historique. Les colonnes
+imbriquées (images, caractéristiques, numéros) gardent un vrai type liste/struct au
+lieu d'être converties en chaînes.
+
+`load` ne lit que les partitions demandées (site, dates), et `compact` fusionne les
+petits fichiers d'une partition en un seul. Le fichier fusionné est d'abord écrit sous un
+nom ignoré par les lectures (.compact-<id>.tmp), avec un manifeste (.compact-<id>.json)
+des fichiers qu'il remplace ; ceux-ci sont supprimés avant qu'il ne devienne visible.
+Une compaction interrompue par un crash est terminée par la lecture ou la compaction
+suivante : une lecture ne voit jamais à la fois les fichiers remplacés et le fichier fusionné.
+"""
+import glob
+import json
+import os
+import shutil
+import uuid
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from scrapping_scripts import schema
+
+STORE_PATH = "./files/products"
+DATE_COLUMN = "Scrap date"
+SITE_COLUMN = "Site"
+
+_PAIR = pa.struct([("nom", pa.string()), ("valeur", pa.string())])
+# Colonnes imbriquées et leur type, les autres colonnes sont des chaînes
+LIST_COLUMNS = {
+    "Liens_images": pa.list_(pa.string()),
+    "Fournisseur_numeros_tel": pa.list_(pa.string()),
+    "Caractéristiques": pa.list_(_PAIR),
+    "Voiture_caracteristiques": pa.list_(_PAIR),
+}
+# Types Arrow relus avec les types nullables de pandas (voir schema.COLUMNS)
+_NULLABLE_TYPES = {
+    pa.int64(): pd.Int64Dtype(),
+    pa.float64(): pd.Float64Dtype(),
+    pa.string(): pd.StringDtype(),
+    pa.large_string(): pd.StringDtype(),
+}
+PARTITIONING = ds.partitioning(pa.schema([("site", pa.string()), ("scrap_date", pa.string())]), flavor="hive")
+
+
+def _is_missing(value):
+    # None, NaN, mais aussi pd.NA et NaT (colonnes du schéma commun) ; une liste n'est jamais absente
+    return value is None or (pd.api.types.is_scalar(value) and pd.isna(value))
+
+
+def _to_list(value, value_type):
+    """
+    Normalise une valeur de colonne imbriquée : une image seule devient une liste d'une image,
+    une paire (nom, valeur) devient un struct.
+    """
+    if _is_missing(value):
+        return None
+    if not isinstance(value, (list, tuple)):
+        value = [value]
+    if pa.types.is_struct(value_type.value_type):
+        return [{"nom": str(pair[0]), "valeur": str(pair[1])} for pair in value]
+    return [str(item) for item in value]
+
+
+def _to_string(value):
+    return None if _is_missing(value) else str(value)
+
+
+def _to_table(df):
+    """
+    Convertit les produits d'un site en table Arrow typée (sans le site et la date, qui sont des partitions).
+    """
+    columns, fields = [], []
+    for column in df.columns:
+        if column in (DATE_COLUMN, SITE_COLUMN):
+            continue
+        if column in LIST_COLUMNS:
+            value_type = LIST_COLUMNS[column]
+            values = [_to_list(value, value_type) for value in df[column]]
+        elif pd.api.types.is_integer_dtype(df[column]) or pd.api.types.is_float_dtype(df[column]):
+            # Colonnes numériques du schéma commun (prix, compteurs) : int64 / double avec nulls
+            array = pa.Array.from_pandas(df[column])
+            columns.append(array)
+            fields.append(pa.field(column, array.type))
+            continue
+        else:
+            value_type = pa.string()
+            values = [_to_string(value) for value in df[column]]
+        columns.append(pa.array(values, type=value_type))
+        fields.append(pa.field(column, value_type))
+    return pa.Table.from_arrays(columns, schema=pa.schema(fields))
+
+
+def append(df, site_of, path=STORE_PATH):
+    """
+    Ajoute les produits d'une exécution, un fichier par site et par date de scrap.
+
+    parameters :
+        - df (DataFrame): produits scrappés, avec la colonne "Scrap date"
+        - site_of (callable): SITE_KEY du site d'une URL produit (si df n'a pas de colonne "Site")
+        - path (str): dossier du stockage
+    return :
+        - files (list) : les fichiers écrits
+    """
+    files = []
+    if SITE_COLUMN in df.columns:
+        sites = df[SITE_COLUMN].astype(str)
+    else:
+        sites = df["Lien_produit"].astype(str).map(site_of)
+    for (site, scrap_date), group in df.groupby([sites, df[DATE_COLUMN]], sort=True):
+        # Les colonnes entièrement vides appartiennent aux autres sites
+        group = group.dropna(axis=1, how="all")
+        partition = os.path.join(path, f"site={site}", f"scrap_date={scrap_date}")
+        os.makedirs(partition, exist_ok=True)
+        file_path = os.path.join(partition, f"part-{uuid.uuid4().hex}.parquet")
+        pq.write_table(_to_table(group), file_path)
+        files.append(file_path)
+    return files
+
+
+def _finish_compaction(manifest_path):
+    """
+    Termine la compaction d'une partition : supprime les fichiers remplacés, puis rend le
+    fichier fusionné visible, puis supprime le manifeste.
+    """
+    partition = os.path.dirname(manifest_path)
+    with open(manifest_path, encoding="utf-8") as file:
+        manifest = json.load(file)
+    for name in manifest["replaced"]:
+        if os.path.exists(os.path.join(partition, name)):
+            os.remove(os.path.join(partition, name))
+    tmp_path = os.path.join(partition, manifest["tmp"])
+    if os.path.exists(tmp_path):
+        os.replace(tmp_path, os.path.join(partition, manifest["target"]))
+    os.remove(manifest_path)
+
+
+def _recover(path):
+    """
+    Termine les compactions interrompues (manifeste présent) et supprime les fichiers fusionnés
+    dont l'écriture n'a pas abouti (sans manifeste).
+    """
+    for manifest_path in glob.glob(os.path.join(path, "*", "*", ".compact-*.json")):
+        _finish_compaction(manifest_path)
+    for tmp_path in glob.glob(os.path.join(path, "*", "*", ".compact-*.tmp")):
+        os.remove(tmp_path)
+
+
+def load(sites=None, dates=None, columns=None, path=STORE_PATH):
+    """
+    Lit les produits stockés. Seules les partitions des sites et dates demandés sont lues.
+
+    parameters :
+        - sites (list): SITE_KEY des sites à lire, None pour tous
+        - dates (list): dates de scrap ("AAAA-MM-JJ") à lire, None pour toutes
+        - columns (list): colonnes à lire, None pour toutes
+        - path (str): dossier du stockage
+    return :
+        - df (DataFrame) : les produits, avec les colonnes "Site" et "Scrap date"
+    """
+    if not os.path.isdir(path):
+        return pd.DataFrame()
+    _recover(path)
+    predicate = None
+    if sites is not None:
+        predicate = ds.field("site").isin(list(sites))
+    if dates is not None:
+        date_filter = ds.field("scrap_date").isin(list(dates))
+        predicate = date_filter if predicate is None else predicate & date_filter
+    # Seuls les fichiers des partitions retenues sont ouverts (lecture de leur pied de page)
+    fragments = list(ds.dataset(path, format="parquet", partitioning=PARTITIONING).get_fragments(filter=predicate))
+    if not fragments:
+        return pd.DataFrame()
+    # Chaque site a ses propres colonnes : schéma commun à tous les fichiers lus
+    unified = pa.unify_schemas([fragment.physical_schema for fragment in fragments] + [PARTITIONING.schema])
+    dataset = ds.dataset([fragment.path for fragment in fragments], schema=unified, format="parquet",
+                         partitioning=PARTITIONING, partition_base_dir=path)
+    if columns is not None:
+        columns = [column for column in columns if column in unified.names] + ["site", "scrap_date"]
+    # Types nullables du schéma commun : entiers Int64 (et non float64), vraies valeurs manquantes
+    df = dataset.to_table(columns=columns, filter=predicate).to_pandas(types_mapper=_NULLABLE_TYPES.get)
+    df = df.rename(columns={"site": SITE_COLUMN, "scrap_date": DATE_COLUMN})
+    for column in df.columns:
+        if schema.COLUMNS.get(column) == "category":
+            df[column] = df[column].astype("category")
+    return df
+
+
+def compact(path=STORE_PATH):
+    """
+    Fusionne les fichiers de chaque partition (site, date) en un seul fichier.
+
+    return :
+        - compacted (int) : nombre de partitions compactées
+    """
+    if not os.path.isdir(path):
+        return 0
+    _recover(path)
+    compacted = 0
+    for site_dir in sorted(os.listdir(path)):
+        site_path = os.path.join(path, site_dir)
+        if not os.path.isdir(site_path):
+            continue
+        for date_dir in sorted(os.listdir(site_path)):
+            partition = os.path.join(site_path, date_dir)
+            files = sorted(name for name in os.listdir(partition) if name.endswith(".parquet"))
+            if len(files) < 2:
+                continue
+            # Les schémas peuvent différer d'un fichier à l'autre (colonnes vides non écrites)
+            table = pa.concat_tables(
+                [pq.read_table(os.path.join(partition, name)) for name in files], promote_options="permissive"
+            )
+            # Fichier fusionné sous un nom ignoré par les lectures, puis manifeste (écrit en une
+            # fois) : à partir de là, un crash est rattrapé par `_recover`, sinon rien n'a changé
+            compaction_id = uuid.uuid4().hex
+            tmp_name = f".compact-{compaction_id}.tmp"
+            pq.write_table(table, os.path.join(partition, tmp_name))
+            manifest_path = os.path.join(partition, f".compact-{compaction_id}.json")
+            with open(manifest_path + ".tmp", "w", encoding="utf-8") as file:
+                json.dump({"tmp": tmp_name, "target": f"part-{compaction_id}.parquet", "replaced": files}, file)
+            os.replace(manifest_path + ".tmp", manifest_path)
+            _finish_compaction(manifest_path)
+            compacted += 1
+    return compacted
+
+
+def reset(path=STORE_PATH):
+    """
+    Supprime le stockage (utilisé par Crawler.reset).
+    """
+    if os.path.isdir(path):
+        shutil.rmtree(path)
@@ -0,0 +1,459 @@
+"""
+Pipeline producteur/consommateur pour les scrapers paginés.
+
+Le thread appelant parcourt les pages de liste d'une catégorie et dépose les arguments
+de `scrape_product_details` dans une file bornée. Un pool de workers, qui vit aussi
+longtemps que la catégorie, vide cette file en continu : la page suivante est
+téléchargée pendant que les produits de la page courante sont scrappés.
+
+Plusieurs catégories d'un même site peuvent aussi être parcourues en même temps
+(`crawl_categories`) ; le nombre de requêtes par hôte reste plafonné par http_session.
+Un produit listé dans plusieurs catégories n'est scrappé qu'une fois, par la première
+catégorie qui le réserve (`UrlStore.claim_many`) : sa Catégorie dépend alors de l'ordre
+d'arrivée des pages, et non plus de l'ordre des catégories.
+
+Une page de liste est validée dans le journal (`commit_page`) dès que tous ses produits
+sont scrappés ; les pages et catégories déjà validées par une exécution interrompue
+ne sont pas re-téléchargées.
+
+Pagination incrémentale : les pages de liste sont triées du plus récent au plus ancien
+(tri par défaut des sites, ou paramètres SORT_PARAMS du site ajoutés à l'URL par
+`listing_url`). Dès que KNOWN_PAGES pages de suite ne contiennent que des produits déjà
+vus, les pages suivantes sont plus anciennes encore et la catégorie s'arrête. `--full`
+(FULL) désactive l'arrêt, pour un passage complet périodique.
+
+Mode superficiel (`--shallow`, sites SHALLOW) : pour les sites qui savent lire leurs cartes
+produit (`parse_cards`), le produit est construit à partir de sa carte sur la page de liste,
+sans télécharger sa page produit. Les arguments de sa page produit sont gardés dans l'index
+des URLs (`UrlStore.add_cards`) : un passage approfondi (`enrich`, `--deep`) peut ensuite
+compléter seulement les produits choisis.
+
+Les arguments des produits scrappés depuis leur page sont gardés dans la base des
+empreintes (fingerprints.py) ; `recrawl` (`--recrawl`) re-télécharge ces pages et
+n'extrait que celles dont le contenu a changé.
+"""
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from scrapping_scripts import fingerprints, html_parsers, http_cache, http_session, journal, metrics, sink, url_store
+
+# Taille de la file des produits en attente, en nombre de produits par worker
+QUEUE_FACTOR = 4
+# Nombre de catégories d'un même site parcourues en même temps
+CATEGORY_WORKERS = 4
+
+# Pages de suite sans nouveau produit après lesquelles une catégorie s'arrête (0 : jamais) ;
+# un site peut fixer sa propre valeur (attribut KNOWN_PAGES du module)
+KNOWN_PAGES = 2
+# Parcourir toutes les pages de toutes les catégories, sans arrêt anticipé
+FULL = False
+# Paramètres de tri d'un site (clé : SITE_KEY), prioritaires sur l'attribut SORT_PARAMS du module
+SITE_SORT_PARAMS = {}
+# Sites (SITE_KEY) scrappés en mode superficiel, "*" pour tous
+SHALLOW = set()
+
+# Marque de fin envoyée à chaque worker
+_DONE = object()
+
+
+def configure(known_pages=None, full=None, site_key=None, sort_params=None, shallow=None):
+    """
+    Règle l'arrêt anticipé de la pagination, les paramètres de tri d'un site et le mode superficiel.
+
+    parameters :
+        - known_pages (int): pages de suite sans nouveau produit avant l'arrêt (0 : jamais)
+        - full (bool): parcourir toutes les pages (passage complet)
+        - site_key (str): SITE_KEY du site dont on change le tri
+        - sort_params (dict): paramètres de requête ajoutés aux pages de liste du site
+        - shallow (str): SITE_KEY d'un site à scraper en mode superficiel, "*" pour tous
+    """
+    global KNOWN_PAGES, FULL
+    if known_pages is not None:
+        if known_pages < 0:
+            raise ValueError(f"Nombre de pages invalide : {known_pages}")
+        KNOWN_PAGES = known_pages
+    if full is not None:
+        FULL = full
+    if sort_params is not None:
+        SITE_SORT_PARAMS.setdefault(site_key, {}).update(sort_params)
+    if shallow is not None:
+        SHALLOW.add(shallow)
+
+
+def is_shallow(site):
+    """
+    Vrai si les produits du site sont construits à partir de leur carte (mode superficiel).
+    """
+    return hasattr(site, "parse_cards") and ("*" in SHALLOW or site.SITE_KEY in SHALLOW)
+
+
+def parse_listing(site, content, category, base_url):
+    """
+    Parse une page de liste.
+
+    return :
+        - product_args (list) : arguments de `scrape_product_details` de chaque produit, ou en
+          mode superficiel [url, arguments de scrape_product_details, produit lu sur sa carte]
+    """
+    if is_shallow(site):
+        only = getattr(site, "CARD_ONLY", getattr(site, "LISTING_ONLY", None))
+        soup = html_parsers.make_soup(content, site.SITE_KEY, only=only, stage="listing")
+        return [[args[0], args, card] for args, card in site.parse_cards(soup, category, base_url)]
+    soup = html_parsers.make_soup(content, site.SITE_KEY, only=getattr(site, "LISTING_ONLY", None), stage="listing")
+    return site.parse_listing_page(soup, category, base_url)
+
+
+def commit_cards(site_key, category_name, page, new_args, listing_url, listing_count):
+    """
+    Mode superficiel : valide une page de liste avec les produits lus sur leurs cartes, et
+    garde les arguments de leurs pages produit pour un passage approfondi (`enrich`).
+    """
+    url_store.get_store(site_key).add_cards((url, args) for url, args, _ in new_args)
+    commit_page(site_key, category_name, page, new_args, [card for _, _, card in new_args],
+                listing_url, listing_count)
+
+
+def enrich(site, cards, workers=None):
+    """
+    Passage approfondi : scrape la page produit de produits connus par leur carte.
+
+    parameters :
+        - site (module): module du site
+        - cards (dict): {url: arguments de scrape_product_details} (voir UrlStore.cards)
+        - workers (int): nombre de pages produit téléchargées en même temps
+    return :
+        - products (list) : les produits complets (ceux dont le scraping a échoué sont absents)
+    """
+    def scrape(args):
+        try:
+            product = site.scrape_product_details(*args)
+            if product:
+                product.pop(fingerprints.FIELD, None)
+            return product
+        except Exception as e:
+            print(f"Erreur lors du scraping du produit {args[0]} : {e!r}")
+            return None
+
+    with ThreadPoolExecutor(max_workers=workers or http_session.POOL_SIZE) as executor:
+        return [product for product in executor.map(scrape, cards.values()) if product]
+
+
+def recrawl(site, known, workers=None):
+    """
+    Re-télécharge les pages produit connues ; seules celles dont l'empreinte de la région
+    utile (CONTENT_REGION) a changé sont extraites.
+
+    parameters :
+        - site (module): module du site (CONTENT_REGION, parse_product_details)
+        - known (dict): {url: (arguments de scrape_product_details, empreinte ou None)}
+          (voir FingerprintStore.known)
+        - workers (int): nombre de pages produit téléchargées en même temps
+    return :
+        - products (list) : les produits modifiés
+        - digests (dict) : {url: empreinte} des pages vérifiées, modifiées ou non
+    """
+    def check(item):
+        url, (args, previous) = item
+        try:
+            response = http_session.fetch(url)
+            if response.status_code != 200:
+                print(f"Erreur lors de l'accès au produit : {url}")
+                return url, None, None
+            soup = html_parsers.make_soup(response.content, site.SITE_KEY)
+            digest = fingerprints.digest(soup, site.CONTENT_REGION)
+            if digest == previous:
+                # Page inchangée : ni extraction ni enregistrement
+                return url, None, digest
+            return url, site.parse_product_details(soup, *args), digest
+        except Exception as e:
+            print(f"Erreur lors du re-crawl du produit {url} : {e!r}")
+            return url, None, None
+
+    products = []
+    digests = {}
+    with ThreadPoolExecutor(max_workers=workers or http_session.POOL_SIZE) as executor:
+        for url, product, digest in executor.map(check, known.items()):
+            if digest is None:
+                continue
+            if product:
+                products.append(product)
+            elif digest != known[url][1]:
+                # Page modifiée mais illisible : elle sera de nouveau vérifiée au prochain re-crawl
+                continue
+            digests[url] = digest
+    return products, digests
+
+
+def known_pages_limit(site):
+    """
+    Pages de suite sans nouveau produit après lesquelles les catégories du site s'arrêtent (0 : jamais).
+    """
+    if FULL:
+        return 0
+    return getattr(site, "KNOWN_PAGES", KNOWN_PAGES)
+
+
+def listing_url(site, category, page):
+    """
+    URL de la page de liste `page` d'une catégorie, avec les paramètres de tri du site.
+    """
+    url = site.category_page_url(category, page)
+    params = {**getattr(site, "SORT_PARAMS", {}), **SITE_SORT_PARAMS.get(site.SITE_KEY, {})}
+    if not params:
+        return url
+    parts = urlsplit(url)
+    query = [(name, value) for name, value in parse_qsl(parts.query, keep_blank_values=True) if name not in params]
+    return urlunsplit(parts._replace(query=urlencode(query + list(params.items()))))
+
+
+def commit_page(site_key, category_name, page, page_args, products, listing_url=None, listing_count=0, failed=(),
+                track=False):
+    """
+    Valide une page de liste une fois tous ses produits scrappés : les produits sont
+    enregistrés dans le journal, puis leurs liens marqués comme vus, puis le nombre de
+    produits de la page est enregistré dans le cache HTTP (une page inchangée ne sera plus
+    re-parsée), puis, en mode streaming, les produits sont envoyés au sink.
+
+    parameters :
+        - site_key (str): SITE_KEY du site
+        - category_name (str): nom de la catégorie
+        - page (int): numéro de la page de liste
+        - page_args (list): arguments des nouveaux produits de la page (args[0] = url)
+        - products (list): produit scrappé pour chaque élément de page_args (None en cas d'échec)
+        - listing_url (str): url de la page de liste
+        - listing_count (int): nombre de produits de la page de liste (nouveaux ou non)
+        - failed (list): liens dont le scraping a levé une erreur (réseau, timeout, hôte
+          indisponible) : ils ne sont pas marqués comme vus, la prochaine exécution les retentera
+        - track (bool): page_args sont les arguments de `scrape_product_details` : ils sont gardés
+          dans la base des empreintes avec l'empreinte de leur page, pour les re-crawls (`recrawl`)
+    """
+    scraped = [(args[0], product) for args, product in zip(page_args, products) if product]
+    # L'empreinte ajoutée par fingerprints.tag ne fait pas partie du produit
+    digests = {url: product.pop(fingerprints.FIELD, None) for url, product in scraped}
+    journal.get_journal(site_key).commit_page(category_name, page, scraped)
+    metrics.inc("products_total", len(scraped), site=site_key)
+    if track:
+        fingerprints.get_store().remember(
+            site_key, [(args[0], args) for args, product in zip(page_args, products) if product], digests
+        )
+    failed = set(failed)
+    url_store.get_store(site_key).add_many(args[0] for args in page_args if args[0] not in failed)
+    if failed:
+        # La page sera re-parsée à la prochaine exécution, pour retrouver ces liens
+        listing_url = None
+    if listing_url is not None:
+        http_cache.get_cache().store_parsed(listing_url, listing_count)
+    for _, product in scraped:
+        sink.emit(product)
+
+
+def record_product(site_key, category_name, page, position, args, product, track=False):
+    """
+    Enregistre un produit dans le journal dès qu'il est scrappé : si l'exécution est tuée
+    avant la validation de sa page, la reprise ne le re-télécharge pas.
+
+    parameters :
+        - site_key (str): SITE_KEY du site
+        - category_name (str): nom de la catégorie
+        - page (int): numéro de la page de liste
+        - position (int): position du produit parmi les nouveaux produits de la page
+        - args (tuple): arguments de `scrape_product_details` (args[0] = url)
+        - product (dict): produit scrappé, laissé intact pour `commit_page`
+        - track (bool): garder ses arguments et son empreinte dans la base des empreintes (voir `commit_page`)
+    """
+    product = dict(product)
+    digest = product.pop(fingerprints.FIELD, None)
+    journal.get_journal(site_key).record_product(category_name, page, position, args[0], product)
+    if track:
+        fingerprints.get_store().remember(site_key, [(args[0], args)], {args[0]: digest})
+
+
+class _PendingPage:
+    """
+    Produits d'une page de liste en cours de scraping ; le dernier produit terminé valide la page.
+    """
+
+    def __init__(self, site_key, category_name, page, page_args, listing_url, listing_count):
+        self.site_key = site_key
+        self.category_name = category_name
+        self.page = page
+        self.page_args = page_args
+        self.listing_url = listing_url
+        self.listing_count = listing_count
+        self.products = [None] * len(page_args)
+        self.failed = []
+        self._remaining = len(page_args)
+        self._lock = threading.Lock()
+
+    def done(self, index, product, failed=False):
+        if product:
+            record_product(self.site_key, self.category_name, self.page, index, self.page_args[index], product,
+                           track=True)
+        with self._lock:
+            self.products[index] = product
+            if failed:
+                self.failed.append(self.page_args[index][0])
+            self._remaining -= 1
+            if self._remaining:
+                return
+        commit_page(self.site_key, self.category_name, self.page, self.page_args, self.products,
+                    self.listing_url, self.listing_count, self.failed, track=True)
+
+
+def _detail_worker(scrape, tasks):
+    """
+    Scrape les produits de la file jusqu'à recevoir la marque de fin.
+    """
+    while True:
+        task = tasks.get()
+        if task is _DONE:
+            return
+        pending, index = task
+        args = pending.page_args[index]
+        product = None
+        failed = False
+        try:
+            product = scrape(*args)
+        except Exception as e:
+            print(f"Erreur lors du scraping du produit {args[0]} : {e!r}")
+            failed = True
+        pending.done(index, product, failed)
+
+
+def produce(site, category, base_url, dispatch):
+    """
+    Parcourt les pages de liste d'une catégorie et confie les nouveaux produits de chaque
+    page à `dispatch(page, new_args, listing_url, listing_count)`, qui doit faire valider
+    la page (`commit_page`) une fois ses produits scrappés.
+
+    return :
+        - complete (bool) : False si le parcours s'est arrêté sur une page de liste en erreur ;
+          la catégorie ne doit alors pas être validée dans le journal, la reprise la reparcourra
+    """
+    category_name = category["Nom"]
+    seen_urls = url_store.get_store(site.SITE_KEY)
+    site_journal = journal.get_journal(site.SITE_KEY)
+    stop_after = known_pages_limit(site)
+    known_pages = 0
+
+    for page in range(1, site.MAX_PAGES + 1):
+        if site_journal.page_done(category_name, page):
+            # Page validée par une exécution interrompue : ses produits sont dans le journal
+            print(f"Page {page} de la catégorie '{category_name}' déjà traitée.")
+            continue
+        url = listing_url(site, category, page)
+        print(f"Scraping page : {url}")
+        response = http_cache.fetch(url, "listing")
+
+        if response.status_code != 200:
+            print(f"Erreur lors de l'accès à la page {page} de la catégorie '{category_name}' : {url}")
+            return False
+
+        if response.not_modified and response.parsed is not None:
+            # Page inchangée depuis le dernier passage : ses produits sont déjà connus,
+            # inutile de la re-parser (on a seulement gardé son nombre de produits)
+            if not response.parsed:
+                print(f"Aucun produit trouvé sur la page {page}. Fin du scraping pour cette catégorie.")
+                break
+            print(f"Page {page} inchangée depuis le dernier passage.")
+            metrics.inc("listing_pages_total", site=site.SITE_KEY, result="not_modified")
+            known_pages += 1
+            if stop_after and known_pages >= stop_after:
+                print(f"{known_pages} page(s) de suite sans nouveau produit. Fin du scraping pour cette catégorie.")
+                break
+            continue
+
+        product_args = parse_listing(site, response.content, category, base_url)
+        metrics.inc("listing_pages_total", site=site.SITE_KEY, result="parsed")
+        if not product_args:
+            http_cache.get_cache().store_parsed(url, 0)
+            print(f"Aucun produit trouvé sur la page {page}. Fin du scraping pour cette catégorie.")
+            break
+
+        # Exclure les urls qui sont déjà scrappés (ou en cours de scraping dans une autre catégorie)
+        claimed = set(seen_urls.claim_many(args[0] for args in product_args))
+        new_args = [args for args in product_args if args[0] in claimed]
+        # Avec --shard, les nouveaux produits de la page peuvent tous appartenir aux autres shards
+        known = not new_args and all(args[0] in seen_urls for args in product_args)
+        known_pages = known_pages + 1 if known else 0
+        if not new_args:
+            commit_page(site.SITE_KEY, category_name, page, [], [], url, len(product_args))
+            if stop_after and known_pages >= stop_after:
+                print(f"{known_pages} page(s) de suite sans nouveau produit. Fin du scraping pour cette catégorie.")
+                break
+            continue
+
+        if is_shallow(site):
+            commit_cards(site.SITE_KEY, category_name, page, new_args, url, len(product_args))
+            continue
+        # Le nombre de produits de la page n'est mis en cache qu'à sa validation : si l'exécution
+        # est tuée avant, la page sera re-parsée à la reprise
+        dispatch(page, new_args, url, len(product_args))
+    return True
+
+
+def crawl_category(site, category, base_url, workers=None):
+    """
+    Récupère les détails de tous les produits d'une catégorie paginée.
+
+    parameters :
+        - site (module): module du site (SITE_KEY, MAX_PAGES, category_page_url,
+          parse_listing_page, scrape_product_details)
+        - category (dict): {"Nom", "URL"}
+        - base_url (str): url racine du site
+        - workers (int): nombre de workers, par défaut la taille du pool HTTP
+    return :
+        - products (list) : les produits de la catégorie (y compris ceux validés par une
+          exécution interrompue), dans l'ordre des pages de liste ; vide si un sink est
+          ouvert : les produits lui ont été envoyés au fil de l'eau
+    """
+    site_journal = journal.get_journal(site.SITE_KEY)
+    if site_journal.category_done(category["Nom"]):
+        print(f"La catégorie {category['Nom']} a déjà été scrappée. Elle sera donc ignorée.")
+    else:
+        workers = workers or http_session.POOL_SIZE
+        tasks = queue.Queue(maxsize=QUEUE_FACTOR * workers)
+        threads = [
+            threading.Thread(target=_detail_worker, args=(site.scrape_product_details, tasks), daemon=True)
+            for _ in range(workers)
+        ]
+        for thread in threads:
+            thread.start()
+
+        def dispatch(page, new_args, listing_url, listing_count):
+            # Bloque seulement si les workers ont déjà trop de produits en attente
+            pending = _PendingPage(site.SITE_KEY, category["Nom"], page, new_args, listing_url, listing_count)
+            for index in range(len(new_args)):
+                tasks.put((pending, index))
+            metrics.peak("queue_depth", tasks.qsize(), site=site.SITE_KEY)
+
+        try:
+            complete = produce(site, category, base_url, dispatch)
+        finally:
+            for _ in threads:
+                tasks.put(_DONE)
+            for thread in threads:
+                thread.join()
+        # Toutes les pages sont validées : la catégorie est terminée, sauf arrêt sur une erreur
+        if complete:
+            site_journal.commit_category(category["Nom"])
+    return [] if sink.is_open() else site_journal.products(category["Nom"])
+
+
+def crawl_categories(categories, scrape_category, workers=None):
+    """
+    Applique `scrape_category` à plusieurs catégories en même temps.
+
+    parameters :
+        - categories (list): catégories du site
+        - scrape_category (callable): fonction appelée pour chaque catégorie
+        - workers (int): nombre de catégories traitées en même temps
+    return :
+        - results (list) : le résultat de chaque catégorie, dans l'ordre de `categories` ; un
+          produit commun à plusieurs catégories n'est que dans celle qui l'a réservé la première
+    """
+    workers = workers or CATEGORY_WORKERS
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(scrape_category, categories))
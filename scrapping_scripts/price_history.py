@@ -0,0 +1,201 @@
+"""
+Historique des prix et de la disponibilité de chaque produit (dimension à variation lente).
+
+files/scraped_data.csv et le stockage Parquet empilent une ligne par produit et par
+exécution : suivre le prix d'une annonce demande de relire et de regrouper tout
+l'historique. files/price_history.sqlite garde à la place :
+
+- products : une ligne courante par Lien_produit (site, catégorie, titre, prix et
+  disponibilité actuels, première et dernière observation) ;
+- intervals : les intervalles [valid_from, valid_to) pendant lesquels le prix et la
+  disponibilité d'un produit n'ont pas changé (valid_to vide : intervalle en cours).
+
+Un nouvel intervalle n'est écrit que lorsqu'une valeur change ; une observation
+identique ne fait qu'avancer last_seen. Une valeur vide (carte sans prix d'un passage
+superficiel...) n'est pas un changement : la valeur connue est gardée, et une valeur qui
+manquait complète l'intervalle en cours au lieu d'en ouvrir un nouveau.
+Les intervalles sont rangés par (url, valid_from) et les produits indexés par (site,
+catégorie) : la série d'un produit ou d'une catégorie est une recherche par index, sans
+parcourir l'historique.
+"""
+import os
+import sqlite3
+
+import pandas as pd
+
+DB_PATH = "./files/price_history.sqlite"
+
+# Colonnes du schéma commun lues pour chaque observation
+COLUMNS = ["Lien_produit", "Site", "Catégorie", "Titre", "Prix_normal", "Disponibilité", "Scrap date"]
+# Nombre d'URLs par requête de lecture des lignes courantes
+CHUNK_SIZE = 500
+
+
+def _connect(db_path):
+    conn = sqlite3.connect(db_path, timeout=60, check_same_thread=False)
+    # WAL : plusieurs processus (un par site) peuvent écrire dans la même base
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(
+        "CREATE TABLE IF NOT EXISTS products ("
+        " url TEXT PRIMARY KEY,"
+        " site TEXT,"
+        " category TEXT,"
+        " title TEXT,"
+        " price INTEGER,"
+        " availability TEXT,"
+        " since TEXT NOT NULL,"
+        " first_seen TEXT NOT NULL,"
+        " last_seen TEXT NOT NULL"
+        ");"
+        "CREATE INDEX IF NOT EXISTS products_site_category ON products (site, category);"
+        "CREATE TABLE IF NOT EXISTS intervals ("
+        " url TEXT NOT NULL,"
+        " valid_from TEXT NOT NULL,"
+        " valid_to TEXT,"
+        " price INTEGER,"
+        " availability TEXT,"
+        " PRIMARY KEY (url, valid_from)"
+        ") WITHOUT ROWID;"
+    )
+    return conn
+
+
+def _value(value):
+    # <NA> de pandas -> NULL, entiers numpy -> int
+    if value is None or value is pd.NA or (isinstance(value, float) and pd.isna(value)):
+        return None
+    return value.item() if hasattr(value, "item") else value
+
+
+def record(df, db_path=None):
+    """
+    Ajoute les observations d'une exécution (produits au schéma commun) à l'historique.
+
+    parameters :
+        - df (DataFrame): produits normalisés (voir schema.normalize), avec "Scrap date"
+        - db_path (str): base de l'historique
+    return :
+        - changes (int) : nombre de nouveaux intervalles (produits nouveaux ou modifiés)
+    """
+    db_path = db_path or DB_PATH
+    if df.empty:
+        return 0
+    observations = df.reindex(columns=COLUMNS).dropna(subset=["Lien_produit", "Scrap date"])
+    observations = observations.drop_duplicates(subset="Lien_produit", keep="last")
+    rows = [tuple(_value(value) for value in row) for row in observations.itertuples(index=False)]
+    urls = [row[0] for row in rows]
+
+    conn = _connect(db_path)
+    current = {}
+    for start in range(0, len(urls), CHUNK_SIZE):
+        chunk = urls[start:start + CHUNK_SIZE]
+        query = (f"SELECT url, price, availability, since, last_seen FROM products"
+                 f" WHERE url IN ({', '.join('?' * len(chunk))})")
+        for url, price, availability, since, last_seen in conn.execute(query, chunk):
+            current[url] = (price, availability, since, last_seen)
+
+    changes = 0
+    with conn:
+        for url, site, category, title, price, availability, date in rows:
+            known = current.get(url)
+            if known is None:
+                conn.execute(
+                    "INSERT INTO products (url, site, category, title, price, availability, since, first_seen, last_seen)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (url, site, category, title, price, availability, date, date, date),
+                )
+                conn.execute(
+                    "INSERT INTO intervals (url, valid_from, price, availability) VALUES (?, ?, ?, ?)",
+                    (url, date, price, availability),
+                )
+                changes += 1
+                continue
+            known_price, known_availability, since, last_seen = known
+            if date < last_seen:
+                # Observation plus ancienne que la ligne courante (fusion de shards en retard...)
+                continue
+            # Valeur vide : la valeur connue est gardée
+            price = known_price if price is None else price
+            availability = known_availability if availability is None else availability
+            filled = (known_price is None and price is not None,
+                      known_availability is None and availability is not None)
+            if any(filled):
+                # La valeur manquait : elle complète l'intervalle en cours, ce n'est pas un changement
+                conn.execute(
+                    "UPDATE intervals SET price = COALESCE(price, ?), availability = COALESCE(availability, ?)"
+                    " WHERE url = ? AND valid_from = ?",
+                    (price, availability, url, since),
+                )
+                known_price = price if known_price is None else known_price
+                known_availability = availability if known_availability is None else known_availability
+            if (price, availability) != (known_price, known_availability):
+                if date == since:
+                    # Deux observations le même jour : la dernière remplace l'intervalle du jour
+                    conn.execute(
+                        "UPDATE intervals SET price = ?, availability = ? WHERE url = ? AND valid_from = ?",
+                        (price, availability, url, since),
+                    )
+                else:
+                    conn.execute(
+                        "UPDATE intervals SET valid_to = ? WHERE url = ? AND valid_from = ?", (date, url, since)
+                    )
+                    conn.execute(
+                        "INSERT INTO intervals (url, valid_from, price, availability) VALUES (?, ?, ?, ?)",
+                        (url, date, price, availability),
+                    )
+                    since = date
+                changes += 1
+            conn.execute(
+                "UPDATE products SET site = ?, category = ?, title = ?, price = ?, availability = ?,"
+                " since = ?, last_seen = ? WHERE url = ?",
+                (site, category, title, price, availability, since, date, url),
+            )
+    conn.close()
+    return changes
+
+
+def history(url, db_path=None):
+    """
+    Série des prix et disponibilités d'un produit.
+
+    return :
+        - intervals (DataFrame) : valid_from, valid_to (vide : en cours), price, availability
+    """
+    db_path = db_path or DB_PATH
+    conn = _connect(db_path)
+    df = pd.read_sql_query(
+        "SELECT valid_from, valid_to, price, availability FROM intervals WHERE url = ? ORDER BY valid_from",
+        conn, params=(url,),
+    )
+    conn.close()
+    return df
+
+
+def category_history(site, category=None, db_path=None):
+    """
+    Séries des prix et disponibilités des produits d'un site, ou d'une de ses catégories.
+
+    return :
+        - intervals (DataFrame) : url, title, category, valid_from, valid_to, price, availability
+    """
+    db_path = db_path or DB_PATH
+    query = ("SELECT p.url, p.title, p.category, i.valid_from, i.valid_to, i.price, i.availability"
+             " FROM products p JOIN intervals i ON i.url = p.url WHERE p.site = ?")
+    params = [site]
+    if category is not None:
+        query += " AND p.category = ?"
+        params.append(category)
+    conn = _connect(db_path)
+    df = pd.read_sql_query(query + " ORDER BY p.url, i.valid_from", conn, params=params)
+    conn.close()
+    return df
+
+
+def reset(db_path=None):
+    """
+    Supprime l'historique (utilisé par Crawler.reset).
+    """
+    db_path = db_path or DB_PATH
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
@@ -0,0 +1,169 @@
+"""
+Profilage CPU et mémoire d'une exécution (`scrapping.py --profile`).
+
+`profile(label)` entoure une étape (le scraping d'un site, la sauvegarde) :
+
+- CPU : un thread échantillonne toutes les SAMPLE_INTERVAL secondes la pile de chaque
+  thread du processus (sys._current_frames), les workers des pools comme le thread
+  principal. Les piles sont écrites au format « collapsed » (une ligne par pile, cadres
+  séparés par des « ; », puis le nombre d'échantillons), lu par flamegraph.pl ou
+  speedscope. La racine de chaque pile est le nom du thread (chiffres remplacés par N).
+  L'échantillonnage mesure le temps écoulé : un worker qui attend le réseau apparaît
+  dans socket/ssl, un worker inactif dans queue.get ;
+- mémoire : tracemalloc suit les allocations de tous les threads pendant l'étape ; le
+  pic et les lignes qui ont le plus alloué (mémoire allouée pendant l'étape et encore
+  allouée à sa fin) sont écrits dans le résumé.
+
+Pour chaque étape, DIRECTORY reçoit <label>.collapsed et <label>.txt (durée, pic mémoire,
+fonctions les plus présentes dans les échantillons, principales allocations).
+Sans `configure`, `profile` ne fait rien.
+"""
+import collections
+import os
+import re
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+# Profilage activé (par `configure`)
+ENABLED = False
+# Dossier des fichiers de profil de l'exécution
+DIRECTORY = "./files/profiles"
+# Intervalle entre deux échantillons des piles, en secondes
+SAMPLE_INTERVAL = 0.005
+# Nombre de cadres gardés pour chaque allocation suivie par tracemalloc (1 : la ligne qui alloue)
+TRACE_FRAMES = 1
+# Nombre de fonctions et de lignes d'allocation listées dans le résumé
+TOP = 30
+
+_lock = threading.Lock()
+
+
+def configure(directory=None):
+    """
+    Active le profilage.
+
+    parameters :
+        - directory (str): dossier des fichiers de profil, par défaut DIRECTORY
+    """
+    global ENABLED, DIRECTORY
+    ENABLED = True
+    if directory is not None:
+        DIRECTORY = directory
+
+
+def _frame_name(code):
+    return f"{os.path.basename(code.co_filename)}:{code.co_qualname}".replace(";", ",")
+
+
+def _stack(frame, thread_name):
+    """
+    Pile d'un thread, de la racine (nom du thread) au cadre en cours.
+    """
+    names = []
+    while frame is not None:
+        names.append(_frame_name(frame.f_code))
+        frame = frame.f_back
+    # ThreadPoolExecutor-3_1 et ThreadPoolExecutor-5_0 font le même travail
+    names.append(re.sub(r"\d+", "N", thread_name).replace(";", ","))
+    return tuple(reversed(names))
+
+
+class Sampler(threading.Thread):
+    """
+    Échantillonne la pile de tous les threads du processus jusqu'à `stop`.
+    """
+
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        super().__init__(name="profiling-sampler", daemon=True)
+        self.interval = interval
+        self.stacks = collections.Counter()
+        self._finished = threading.Event()
+
+    def run(self):
+        own = threading.get_ident()
+        while not self._finished.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident != own:
+                    self.stacks[_stack(frame, names.get(ident, "unknown"))] += 1
+
+    def stop(self):
+        self._finished.set()
+        self.join()
+        return self.stacks
+
+
+def _top_functions(stacks):
+    """
+    Échantillons où chaque fonction est en cours d'exécution (self) ou dans la pile (total).
+    """
+    own = collections.Counter()
+    total = collections.Counter()
+    for stack, count in stacks.items():
+        own[stack[-1]] += count
+        for name in set(stack[1:]):
+            total[name] += count
+    return own, total
+
+
+def _write(label, duration, stacks, peak, allocations):
+    os.makedirs(DIRECTORY, exist_ok=True)
+    path = os.path.join(DIRECTORY, label)
+    with open(path + ".collapsed", "w", encoding="utf-8") as collapsed:
+        for stack, count in stacks.most_common():
+            collapsed.write(f"{';'.join(stack)} {count}\n")
+
+    samples = sum(stacks.values())
+    own, total = _top_functions(stacks)
+    with open(path + ".txt", "w", encoding="utf-8") as summary:
+        summary.write(f"{label}: {duration:.2f} s, {samples} samples every {SAMPLE_INTERVAL * 1000:g} ms "
+                      f"(all threads), memory peak {peak / 1e6:.1f} MB\n\n")
+        summary.write(f"Top {TOP} functions by samples (self / total, % of the samples)\n")
+        for name, count in total.most_common(TOP):
+            summary.write(f"{100 * own[name] / samples:6.1f}% {100 * count / samples:6.1f}%  {name}\n")
+        summary.write(f"\nTop {TOP} allocation sites (memory still allocated at the end of the stage)\n")
+        for stat in allocations[:TOP]:
+            frame = stat.traceback[0]
+            summary.write(f"{stat.size / 1e3:10.1f} kB {stat.count:8d} blocks  "
+                          f"{frame.filename}:{frame.lineno}\n")
+    return path
+
+
+@contextmanager
+def profile(label):
+    """
+    Profile le bloc (CPU et mémoire, tous threads confondus) et écrit ses fichiers dans DIRECTORY.
+
+    parameters :
+        - label (str): nom de l'étape (SITE_KEY du site, "save"...), préfixe des fichiers
+    """
+    if not ENABLED:
+        yield
+        return
+    # Un seul profil à la fois : tracemalloc et l'échantillonnage couvrent tout le processus
+    if not _lock.acquire(blocking=False):
+        raise RuntimeError(f"Impossible de profiler {label} : un autre profil est en cours")
+    try:
+        # Seules les allocations faites pendant l'étape sont suivies
+        tracemalloc.start(TRACE_FRAMES)
+        sampler = Sampler()
+        start = time.perf_counter()
+        sampler.start()
+        try:
+            yield
+        finally:
+            stacks = sampler.stop()
+            duration = time.perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1]
+            after = tracemalloc.take_snapshot()
+            tracemalloc.stop()
+            # Sans les allocations du profilage lui-même
+            filters = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__)]
+            allocations = after.filter_traces(filters).statistics("lineno")
+            path = _write(label, duration, stacks, peak, allocations)
+            print(f"Profil de {label} écrit dans {path}.collapsed et {path}.txt")
+    finally:
+        _lock.release()
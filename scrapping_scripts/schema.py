@@ -0,0 +1,155 @@
+"""
+Schéma commun des produits des six sites.
+
+Les scrapers renvoient des colonnes différentes et des valeurs en texte libre
+("12 000 FCFA", "35 annonces", "Non disponible"...). `normalize` est appliqué une
+seule fois, sur le DataFrame de toute l'exécution, à la fin de Crawler.scrap :
+prix entiers et devise, compteurs numériques, catégories, vraies valeurs manquantes.
+Toutes les conversions sont vectorisées (méthodes .str de pandas), sans boucle par ligne.
+"""
+import pandas as pd
+
+# Valeurs utilisées par les scrapers pour un champ absent
+MISSING_MARKERS = ["Non disponible", "Non Disponible", "Non spécifié", "Inconnu", "NA", "N/A", ""]
+
+# Colonnes canoniques, dans l'ordre de sortie, et leur type
+COLUMNS = {
+    "Site": "category",
+    "Titre": "string",
+    "Prix_normal": "Int64",
+    "Prix_barré": "Int64",
+    "Devise": "category",
+    "Réduction_proposée": "Int64",
+    "Description": "string",
+    "Localisation_bien": "string",
+    "Lien_produit": "string",
+    "Liens_images": "object",
+    "Catégorie": "category",
+    "Caractéristiques": "object",
+    "Voiture_caracteristiques": "object",
+    "État": "category",
+    "Disponibilité": "category",
+    "Évaluation (étoiles)": "Float64",
+    "Nombre_avis": "Int64",
+    "Vues": "Int64",
+    "Code_produit": "string",
+    "Etiquette": "category",
+    "Livraison": "string",
+    "Fournisseur_nom": "string",
+    "Fournisseur_emplacement": "string",
+    "Fournisseur_nb_annonces": "Int64",
+    "Fournisseur_presence": "string",
+    "Fournisseur_date_publication": "string",
+    "Fournisseur_profil": "string",
+    "Fournisseur_numeros_tel": "object",
+    "Scrap date": "string",
+}
+# Colonnes numériques et la façon de les lire
+PRICE_COLUMNS = ["Prix_normal", "Prix_barré"]
+COUNT_COLUMNS = ["Réduction_proposée", "Nombre_avis", "Vues", "Fournisseur_nb_annonces"]
+DECIMAL_COLUMNS = ["Évaluation (étoiles)"]
+# Colonnes contenant des listes (non comparables aux marqueurs de valeur manquante)
+LIST_COLUMNS = [column for column, dtype in COLUMNS.items() if dtype == "object"]
+
+# Devise détectée dans le texte du prix -> code ISO 4217
+CURRENCIES = {
+    r"F\s?CFA|CFA|XOF": "XOF",
+    r"€|EUR": "EUR",
+    r"\$|USD": "USD",
+}
+# Devise quand le prix n'en mentionne aucune (tous les sites sont béninois)
+DEFAULT_CURRENCY = "XOF"
+
+
+def _as_text(series):
+    text = series.astype("string").str.strip()
+    return text.mask(text.isin(MISSING_MARKERS))
+
+
+def parse_amount(series):
+    """
+    "12 000 FCFA", "12.000 F CFA", "12000,00 CFA" -> 12000 (Int64, <NA> si absent).
+    """
+    text = _as_text(series)
+    # Retirer les centimes, puis tous les séparateurs de milliers et la devise
+    digits = text.str.replace(r"(\d)[.,]\d{1,2}(?!\d)", r"\1", regex=True).str.replace(r"\D", "", regex=True)
+    return pd.to_numeric(digits.mask(digits == ""), errors="coerce").astype("Int64")
+
+
+def parse_count(series):
+    """
+    "35 annonces", "1 234 vues", "-20%", "12.0" -> 35, 1234, 20, 12 (premier nombre du texte).
+    """
+    number = _as_text(series).str.extract(r"(\d[\d\s]*)(?:[.,]\d+)?", expand=False)
+    digits = number.str.replace(r"\D", "", regex=True)
+    return pd.to_numeric(digits.mask(digits == ""), errors="coerce").astype("Int64")
+
+
+def parse_decimal(series):
+    """
+    "4,5", "4.5 / 5" -> 4.5 (Float64).
+    """
+    number = _as_text(series).str.extract(r"(\d+(?:[.,]\d+)?)", expand=False).str.replace(",", ".", regex=False)
+    return pd.to_numeric(number, errors="coerce").astype("Float64")
+
+
+def parse_currency(series):
+    """
+    Code de la devise du prix, <NA> si le prix est absent.
+    """
+    text = _as_text(series)
+    currency = pd.Series(pd.NA, index=series.index, dtype="string")
+    for pattern, code in CURRENCIES.items():
+        currency = currency.mask(currency.isna() & text.str.contains(pattern, regex=True, na=False), code)
+    return currency.mask(currency.isna() & text.notna(), DEFAULT_CURRENCY)
+
+
+def normalize(df, site_of):
+    """
+    Applique le schéma commun aux produits d'une exécution.
+
+    parameters :
+        - df (DataFrame): produits de tous les sites, colonnes telles que renvoyées par les scrapers
+        - site_of (callable): SITE_KEY du site d'une URL produit
+    return :
+        - df (DataFrame) : colonnes de COLUMNS (dans cet ordre) puis les colonnes inconnues
+    """
+    df = df.copy()
+    # carisowo nomme sa colonne d'images "Lien_images"
+    if "Lien_images" in df.columns:
+        if "Liens_images" in df.columns:
+            df["Liens_images"] = df["Liens_images"].where(df["Liens_images"].notna(), df["Lien_images"])
+        else:
+            df["Liens_images"] = df["Lien_images"]
+        df = df.drop(columns="Lien_images")
+
+    # Site déduit de l'hôte de l'URL : site_of n'est appelé qu'une fois par hôte
+    hosts = df["Lien_produit"].astype("string").str.extract(r"^(?:\w+://)?([^/]+)", expand=False).fillna("")
+    codes, unique_hosts = pd.factorize(hosts)
+    df["Site"] = pd.Series(unique_hosts).map(site_of).to_numpy()[codes] if len(codes) else []
+    if "Prix_normal" in df.columns:
+        df["Devise"] = parse_currency(df["Prix_normal"])
+
+    for column in df.columns:
+        if column in PRICE_COLUMNS:
+            df[column] = parse_amount(df[column])
+        elif column in COUNT_COLUMNS:
+            df[column] = parse_count(df[column])
+        elif column in DECIMAL_COLUMNS:
+            df[column] = parse_decimal(df[column])
+        elif column in LIST_COLUMNS:
+            # Listes conservées telles quelles, seuls les marqueurs de valeur absente deviennent None
+            df[column] = df[column].map(lambda value: None if isinstance(value, str) and value in MISSING_MARKERS else value)
+        elif column != "Devise" and column != "Site":
+            df[column] = _as_text(df[column])
+
+    # Les colonnes qu'aucun site n'a renvoyées sont ajoutées vides, avec leur type
+    for column, dtype in COLUMNS.items():
+        if column not in df.columns:
+            df[column] = pd.Series(pd.NA if dtype != "object" else None, index=df.index, dtype=dtype)
+        elif dtype == "category":
+            df[column] = df[column].astype("category")
+        elif dtype == "string":
+            df[column] = df[column].astype("string")
+    unknown = [column for column in df.columns if column not in COLUMNS]
+    return df[list(COLUMNS) + unknown]
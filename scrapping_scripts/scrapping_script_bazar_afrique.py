@@ -1,22 +1,33 @@
-from bs4 import BeautifulSoup
-import requests
+from scrapping_scripts import extraction, fingerprints, html_parsers, http_cache, http_session, journal, pipeline, sink, url_store
+from scrapping_scripts.extraction import Field
 import pandas as pd
-import numpy as np
-import json
-import os
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor
+
+# Clé du site dans les URLs (sert aussi de clé dans l'index des URLs déjà vues)
+SITE_KEY = "bazarafrique"
+# Une seule page de produits par catégorie
+MAX_PAGES = 1
+# Seules ces balises sont construites lors du parsing des pages de liste
+LISTING_ONLY = "div.position-relative.overflow-hidden.card-img-top.post-box-horizontal-image-container"
 
 def get_categories(base_url):
     """
     Récupère toutes les catégories et leurs URLs depuis la page des catégories.
     """
     url = f"{base_url}/search"
-    response = requests.get(url)
-    if response.status_code != 200:
+    categories = http_cache.cached_parse(
+        url, "categories", lambda content: parse_categories(html_parsers.make_soup(content, SITE_KEY, stage="categories"), base_url)
+    )
+    if categories is None:
         print(f"Erreur lors de l'accès à la page des catégories : {url}")
         return []
+    return categories
+
 
-    soup = BeautifulSoup(response.content, "html.parser")
+def parse_categories(soup, base_url):
+    """
+    Extrait les catégories (nom et URL) de la page des catégories.
+    """
     categories = []
     categories_list = soup.select("ul.accordion-body-list.fs-sm li a")
     # Récupérer toutes les catégories
@@ -35,72 +46,70 @@ def scrape_product_details(product_url, category_name):
     """
     Récupère les détails d'un produit en visitant sa page.
     """
-    response = requests.get(product_url)
+    response = http_session.fetch(product_url)
     if response.status_code != 200:
         print(f"Erreur lors de l'accès au produit : {product_url}")
         return None
 
-    soup = BeautifulSoup(response.content, "html.parser")
-
+    soup = html_parsers.make_soup(response.content, SITE_KEY)
+    product = parse_product_details(soup, product_url, category_name)
+    return fingerprints.tag(product, soup, CONTENT_REGION)
+
+
+# Champs de la page produit (sélecteurs compilés une seule fois, à l'import)
+PRODUCT_FIELDS = extraction.Spec({
+    # Titre du produit
+    "Titre": Field("div.border-bottom.pt-2.pb-4.py-lg-4 h1.h3.mb-2.break-long-words"),
+    # Prix
+    "Prix_normal": Field("div.border-bottom.pt-2.pb-4.py-lg-4 h2.h4.fw-normal"),
+    # Lieu
+    "Localisation_bien": Field("div.border-bottom.pt-2.pb-4.py-lg-4 p.mb-2.pb-1.fs-sm.text-muted"),
+    # Détails du produit
+    "Description": Field("p.line-breaks.break-long-words.mb-0", post=lambda description: description.replace("\n", " ")),
+    # Date de publication
+    "Fournisseur_date_publication": Field("li.mb-0.me-3.pe-3.border-end.text-muted span"),
+    # Nom du vendeur
+    "Fournisseur_nom": Field("div.ps-3.flex-grow-1 h5"),
+    # Temps de présence
+    "Fournisseur_presence": Field("div.ps-3.flex-grow-1 div.small.opacity-70.text-muted"),
+    # Nombre d'annonces
+    "Fournisseur_nb_annonces": Field("div.ps-3.flex-grow-1 div.small.text-primary"),
+    # Lien du profil du vendeur
+    "Fournisseur_profil": Field(
+        "a.d-flex.align-items-center.border-bottom.pb-4.text-decoration-none."
+        "mb-3.w-100.text-muted.link-chevron-right.mt-4.d-flex.d-lg-none",
+        attr="href",
+    ),
+    # Liens vers l'image
+    "Liens_images": Field("div.gallery-item.rounded.rounded-md-3 img", attr="src", many=True),
+})
+# Région utile des pages produit, pour leur empreinte (voir fingerprints.py) :
+# tous les champs sauf la date relative (« il y a 2 jours ») et ceux du vendeur qui changent
+# sans que le produit change
+CONTENT_REGION = PRODUCT_FIELDS.selector(
+    exclude=("Fournisseur_date_publication", "Fournisseur_presence", "Fournisseur_nb_annonces")
+)
+
+def parse_product_details(soup, product_url, category_name):
+    """
+    Extrait les détails d'un produit à partir de sa page déjà téléchargée.
+    """
     try:
-        # Titre du produit
-        title = soup.select_one(
-            "div.border-bottom.pt-2.pb-4.py-lg-4 h1.h3.mb-2.break-long-words"
-        )
-        title = title.get_text(strip=True) if title else "Non disponible"
-
-        # Prix
-        price = soup.select_one("div.border-bottom.pt-2.pb-4.py-lg-4 h2.h4.fw-normal")
-        price = price.get_text(strip=True) if price else "Non disponible"
-
-        # Lieu
-        location = soup.select_one("div.border-bottom.pt-2.pb-4.py-lg-4 p.mb-2.pb-1.fs-sm.text-muted")
-        location = location.get_text(strip=True) if location else "Non disponible"
-
-        # Détails du produit
-        description = soup.select_one("p.line-breaks.break-long-words.mb-0")
-        description = description.get_text(strip=True).replace("\n", " ") if description else "Non disponible"
-
-        # Date de publication
-        publish = soup.select_one("li.mb-0.me-3.pe-3.border-end.text-muted span")
-        publish = publish.get_text(strip=True) if publish else "Non disponible"
-
-        # Nom du vendeur
-        vendor_name = soup.select_one("div.ps-3.flex-grow-1 h5")
-        vendor_name = vendor_name.get_text(strip=True) if vendor_name else "Non disponible"
-
-        # Temps de présence
-        vendor_presence = soup.select_one("div.ps-3.flex-grow-1 div.small.opacity-70.text-muted")
-        vendor_presence = vendor_presence.get_text(strip=True) if vendor_presence else "Non disponible"
-
-        # Nombre d'annonces
-        vendor_anounces = soup.select_one("div.ps-3.flex-grow-1 div.small.text-primary")
-        vendor_anounces = vendor_anounces.get_text(strip=True) if vendor_anounces else "Non disponible"
-
-        # Lien du profil du vendeur
-        vendor_profil_el = soup.select_one(
-            "a.d-flex.align-items-center.border-bottom.pb-4.text-decoration-none."
-            "mb-3.w-100.text-muted.link-chevron-right.mt-4.d-flex.d-lg-none"
-        )
-        vendor_profil = vendor_profil_el["href"] if vendor_profil_el else "Non disponible"
-
-        # Liens vers l'image
-        raw_images = soup.select("div.gallery-item.rounded.rounded-md-3 img")
-        image_urls = [slide["src"] for slide in raw_images if slide.get("src")]
+        fields = PRODUCT_FIELDS.extract(soup)
 
         return {
-            "Titre": title,
-            "Prix_normal": price,
-            "Description": description,
-            "Localisation_bien": location,
+            "Titre": fields["Titre"],
+            "Prix_normal": fields["Prix_normal"],
+            "Description": fields["Description"],
+            "Localisation_bien": fields["Localisation_bien"],
             "Lien_produit": product_url,
-            "Liens_images": image_urls,
+            "Liens_images": fields["Liens_images"],
             "Catégorie": category_name,
-            "Fournisseur_nom": vendor_name,
-            "Fournisseur_nb_annonces": vendor_anounces,
-            "Fournisseur_presence": vendor_presence,
-            "Fournisseur_date_publication": publish,
-            "Fournisseur_profil": vendor_profil,
+            "Fournisseur_nom": fields["Fournisseur_nom"],
+            "Fournisseur_nb_annonces": fields["Fournisseur_nb_annonces"],
+            "Fournisseur_presence": fields["Fournisseur_presence"],
+            "Fournisseur_date_publication": fields["Fournisseur_date_publication"],
+            "Fournisseur_profil": fields["Fournisseur_profil"],
         }
 
     except AttributeError as e:
@@ -108,103 +117,117 @@ def scrape_product_details(product_url, category_name):
         return None
 
 
+def category_page_url(category, page):
+    """
+    URL de la page des produits d'une catégorie (une seule page par catégorie).
+    """
+    return category["URL"]
+
+
+def parse_listing_page(soup, category, base_url):
+    """
+    Extrait, pour chaque produit de la page, les arguments de `scrape_product_details`.
+    """
+    all_product_tags = soup.select("div.position-relative.overflow-hidden.card-img-top.post-box-horizontal-image-container a")
+    # Un même produit peut apparaître plusieurs fois sur la page
+    links = dict.fromkeys(f"{base_url}{tag['href']}" for tag in all_product_tags)
+    return [[link, category["Nom"]] for link in links]
+
+
 def scrape_products_from_category(category, base_url):
     """
     Récupère les détails de tous les produits d'une catégorie donnée en visitant leur page respective.
     """
     category_name = category["Nom"]
-    category_url = category["URL"]
-    all_products = []
+    site_journal = journal.get_journal(SITE_KEY)
+    if site_journal.category_done(category_name):
+        # Catégorie terminée par une exécution interrompue : ses produits sont dans le journal
+        print(f"La catégorie {category_name} a déjà été scrappée. Elle sera donc ignorée.")
+        return [] if sink.is_open() else site_journal.products(category_name)
+
+    category_url = category_page_url(category, 1)
 
     print(f"Scraping page : {category_url}")
-    response = requests.get(category_url)
+    response = http_cache.fetch(category_url, "listing")
     if response.status_code != 200:
         print(f"Erreur lors de l'accès à la page de la catégorie '{category_name}' : {category_url}")
+        # Catégorie non validée dans le journal : la reprise la reparcourra
+        return []
+    elif response.not_modified and response.parsed is not None:
+        # Page inchangée depuis sa dernière validation : tous ses produits sont déjà connus
+        print(f"Aucun nouveau produit à scraper pour la catégorie : {category_name}")
+        return []
 
-    soup = BeautifulSoup(response.content, "html.parser")
+    soup = html_parsers.make_soup(response.content, SITE_KEY, only=LISTING_ONLY, stage="listing")
 
-    # Sélectionner tous les liens produits (ici, un set() de balises <a>)
-    all_product_tags = soup.select("div.position-relative.overflow-hidden.card-img-top.post-box-horizontal-image-container a")
-    if not all_product_tags:
+    # Sélectionner tous les liens produits
+    product_args = parse_listing_page(soup, category, base_url)
+    if not product_args:
         print(f"Aucune page produit trouvée pour la catégorie : {category_name}")
         return []
 
-    # Lire tous les liens déjà connus dans urls_file.txt (pour filtrer)
-    with open("./files/urls_file.txt", "r", encoding="utf-8") as urls_file:
-        previous_links = set(line.strip() for line in urls_file if "bazarafrique" in line)
-
-    # Construction des URL complètes pour la page actuelle
-    current_links = set(f"{base_url}{tag['href']}" for tag in all_product_tags)
+    # Index des liens déjà connus (chargé une seule fois par exécution)
+    seen_urls = url_store.get_store(SITE_KEY)
 
-    # Filtrage : prendre les liens qui ne sont pas déjà connus
-    new_links = current_links.difference(previous_links)
-    if not new_links:
+    # Filtrage : prendre les liens qui ne sont ni connus ni en cours de scraping dans une autre catégorie
+    claimed = set(seen_urls.claim_many(args[0] for args in product_args))
+    new_args = [args for args in product_args if args[0] in claimed]
+    if not new_args:
+        http_cache.get_cache().store_parsed(category_url, len(product_args))
         print(f"Aucun nouveau produit à scraper pour la catégorie : {category_name}")
         return []
 
-    print(f"{len(new_links)} nouveau(x) lien(s) détecté(s) pour la catégorie {category_name}")
+    print(f"{len(new_args)} nouveau(x) lien(s) détecté(s) pour la catégorie {category_name}")
+
+    failed = []
+
+    def scrape(position):
+        args = new_args[position]
+        # Une page produit en erreur ne doit pas faire perdre les autres produits de la page
+        try:
+            product = scrape_product_details(*args)
+        except Exception as e:
+            print(f"Erreur lors du scraping du produit {args[0]} : {e!r}")
+            failed.append(args[0])
+            return None
+        if product:
+            # Enregistré aussitôt : une reprise ne le re-télécharge pas
+            pipeline.record_product(SITE_KEY, category_name, 1, position, args, product, track=True)
+        return product
 
     # Paralléliser le scraping des produits
-    with ThreadPoolExecutor(max_workers=5) as executor:
-        futures = [executor.submit(scrape_product_details, link, category_name) for link in new_links]
-        for future in as_completed(futures):
-            product_details = future.result()
-            if product_details:
-                all_products.append(product_details)
+    with ThreadPoolExecutor(max_workers=http_session.POOL_SIZE) as executor:
+        products = list(executor.map(scrape, range(len(new_args))))
 
-    # Mettre à jour le fichier urls_file.txt avec les nouveaux liens
-    with open("./files/urls_file.txt", "a", encoding="utf-8") as urls_file:
-        for link in new_links:
-            urls_file.write(link + "\n")
+    # Valider la page dans le journal (produits, puis liens marqués comme vus) et la catégorie
+    pipeline.commit_page(SITE_KEY, category_name, 1, new_args, products, category_url, len(product_args), failed,
+                         track=True)
+    site_journal.commit_category(category_name)
 
-    return all_products
+    return [] if sink.is_open() else site_journal.products(category_name)
 
 
 def main_bazar_afrique(base_url):
     """
     Scrape tous les produits de toutes les catégories et les associe aux catégories.
     """
-    # Créer le dossier de sortie s'il n'existe pas
-    output_dir = "Produits_bazar_afrique"
-    if not os.path.exists(output_dir):
-        os.makedirs(output_dir)
-
     categories = get_categories(base_url)
     if not categories:
         print("Aucune catégorie trouvée.")
         return pd.DataFrame()
 
-    # Parcourir chaque catégorie
-    for category in categories:
+    # Scraper une catégorie (plusieurs catégories sont traitées en même temps)
+    def scrape_category(category):
         print(f"Scraping produits de la catégorie : {category['Nom']}")
-        category_file = os.path.join(output_dir, f"{category['Nom']}.jsonl")
-
-        # Vérifier si le fichier de la catégorie existe déjà
-        if os.path.isfile(category_file):
-            print(f"La catégorie {category['Nom']} a déjà été scrappée. Elle sera donc ignorée.")
-            continue
-
-        # Sinon, scrap et sauvegarde
         products = scrape_products_from_category(category, base_url)
         print(f"Nombre de produits scrapés : {len(products)} pour la catégorie {category['Nom']}")
+        return products
 
-        if products:
-            with open(category_file, "w", encoding="utf-8") as f:
-                for product in products:
-                    json_line = json.dumps(product, ensure_ascii=False)
-                    f.write(json_line + "\n")
-        # Delete the intermediaries files 
-        if os.path.exists(output_dir):
-                os.removedirs(output_dir)
-    # Une fois toutes les catégories traitées, on relit tous les fichiers JSONL
+    # Résultats dans l'ordre des catégories
     data = []
-    for category in categories:
-        category_file = os.path.join(output_dir, f"{category['Nom']}.jsonl")
-        if os.path.isfile(category_file):
-            with open(category_file, "r", encoding="utf-8") as f:
-                for line in f:
-                    data.append(json.loads(line))
+    for products in pipeline.crawl_categories(categories, scrape_category):
+        data.extend(products)
 
     # Crée et retourne un DataFrame (qu’on peut ensuite sauvegarder en CSV si besoin)
     df = pd.DataFrame(data)
-    return df
\ No newline at end of file
+    return df
@@ -1,12 +1,21 @@
 # version 1.4
 
-from bs4 import BeautifulSoup
-import requests
+from scrapping_scripts import extraction, fingerprints, html_parsers, http_cache, http_session, pipeline
+from scrapping_scripts.extraction import Field
 import pandas as pd
-import numpy as np
-import json
-import os
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import sys
+
+# Clé du site dans les URLs (sert aussi de clé dans l'index des URLs déjà vues)
+SITE_KEY = "coinafrique"
+# Nombre maximum de pages parcourues par catégorie
+MAX_PAGES = 999
+# Seules ces balises sont construites lors du parsing des pages de liste
+LISTING_ONLY = "a.card-image.ad__card-image.waves-block.waves-light"
+# En mode superficiel, les cartes entières (lien, prix, titre, localisation) sont construites
+CARD_ONLY = "div.card.ad__card"
+# Paramètres de tri ajoutés aux pages de liste (voir pipeline.listing_url) : vide, le tri
+# par défaut du site liste déjà les annonces les plus récentes en premier
+SORT_PARAMS = {}
 
 def get_categories(base_url:str):
     """
@@ -17,12 +26,19 @@ def get_categories(base_url:str):
     return :
         - categories (dict) : dictionnaire contenant les categories.
     """
-    response = requests.get(base_url)
-    if response.status_code != 200:
+    categories = http_cache.cached_parse(
+        base_url, "categories", lambda content: parse_categories(html_parsers.make_soup(content, SITE_KEY, stage="categories"), base_url)
+    )
+    if categories is None:
         print(f"Erreur lors de l'accès à la page des catégories : {base_url}")
         return []
+    return categories
 
-    soup = BeautifulSoup(response.content, "html.parser")
+
+def parse_categories(soup, base_url):
+    """
+    Extrait les catégories (nom et URL) de la page des catégories.
+    """
     categories = []
 
     categories_list = soup.select("li.category.gtm-category-bar.center a")
@@ -43,174 +59,163 @@ def scrape_product_details(product_url, category_name):
     """
     Récupère les détails d'un produit en visitant sa page.
     """
-    response = requests.get(product_url)
+    response = http_session.fetch(product_url)
     if response.status_code != 200:
         print(f"Erreur lors de l'accès au produit : {product_url}")
         return None
 
-    soup = BeautifulSoup(response.content, "html.parser")
+    soup = html_parsers.make_soup(response.content, SITE_KEY)
+    product = parse_product_details(soup, product_url, category_name)
+    return fingerprints.tag(product, soup, CONTENT_REGION)
 
+def _characteristic(charac):
+    """
+    (nom, valeur) d'une caractéristique, None s'il manque l'un des deux.
+    """
+    name = charac.select_one("span.label") or charac.select_one("span:not(.qt)")
+    value = charac.select_one("span.qt")
+    if name and value:
+        return (name.get_text(strip=True), value.get_text(strip=True))
+    return None
+
+
+def _slide_images(styles):
+    """
+    URLs des images à partir du style (background-image) des slides, sans les miniatures.
+    """
+    return [
+        style.split("url(")[1].split(")")[0].strip("'\"")
+        for style in styles if "background-image" in style and "thumb" not in style
+    ]
+
+
+# Champs de la page produit (sélecteurs compilés une seule fois, à l'import)
+PRODUCT_FIELDS = extraction.Spec({
+    # Titre du produit
+    "Titre": Field("div.ad__info__box.ad__info__box-priceAndTitle h1.title.title-ad.hide-on-large-and-down"),
+    # Prix
+    "Prix_normal": Field("div.ad__info__box.ad__info__box-priceAndTitle p.price"),
+    # Lieu
+    "Localisation_bien": Field("p.extras span.valign-wrapper:nth-of-type(2) span"),
+    # Description
+    "Description": Field(
+        "div.ad__info__box.ad__info__box-descriptions p:nth-of-type(2)",
+        post=lambda description: description.replace("*", "").replace("\n", " "),
+    ),
+    # Nom du vendeur
+    "Fournisseur_nom": Field("div.profile-card__content p.username a"),
+    # Localisation du vendeur
+    "Fournisseur_emplacement": Field("div.profile-card__content p.physical-address span.physical-address__name"),
+    # Nombre d'annonces du vendeur
+    "Fournisseur_nb_annonces": Field("div.profile-card__content p.nb-ads"),
+    # Temps de présence du vendeur
+    "Fournisseur_presence": Field(
+        "div.profile-card__content p.member-since span", post=lambda presence: presence.split("\xa0")[-1].strip()
+    ),
+    # Caractéristiques du produit
+    "Caractéristiques": Field(
+        "div.details-characteristics ul li", many=True, raw=True,
+        # Sans doublons, dans l'ordre de la page
+        post=lambda characs: [detail for detail in dict.fromkeys(map(_characteristic, characs)) if detail],
+    ),
+    # Images
+    "Liens_images": Field("div.swiper-slide", attr="style", many=True, post=_slide_images),
+})
+# Région utile des pages produit, pour leur empreinte (voir fingerprints.py) :
+# tous les champs sauf ceux du vendeur qui changent sans que le produit change
+CONTENT_REGION = PRODUCT_FIELDS.selector(exclude=("Fournisseur_nb_annonces", "Fournisseur_presence"))
+
+def parse_product_details(soup, product_url, category_name):
+    """
+    Extrait les détails d'un produit à partir de sa page déjà téléchargée.
+    """
     try:
-        # Titre du produit
-        title = soup.select_one("div.ad__info__box.ad__info__box-priceAndTitle h1.title.title-ad.hide-on-large-and-down")
-        title = title.get_text(strip=True) if title else "Non disponible"
-
-        # Prix
-        price = soup.select_one("div.ad__info__box.ad__info__box-priceAndTitle p.price")
-        price = price.get_text(strip=True) if price else "Non disponible"
-
-        # Lieu
-        location = soup.select_one("p.extras span.valign-wrapper:nth-of-type(2) span")
-        location = location.get_text(strip=True) if location else "Non disponible"
-
-        # Description
-        description = soup.select_one("div.ad__info__box.ad__info__box-descriptions p:nth-of-type(2)")
-        description = description.get_text(strip=True).replace("*", "").replace("\n", " ") if description else "Non disponible"
-
-        # Nom du vendeur
-        vendor_name = soup.select_one("div.profile-card__content p.username a")
-        vendor_name = vendor_name.get_text(strip=True) if vendor_name else "Non disponible"
-
-        # Localisation du vendeur
-        vendor_location = soup.select_one("div.profile-card__content p.physical-address span.physical-address__name")
-        vendor_location = vendor_location.get_text(strip=True) if vendor_location else "Non disponible"
-
-        # Nombre d'annonces du vendeur
-        vendor_anounces = soup.select_one("div.profile-card__content p.nb-ads")
-        vendor_anounces = vendor_anounces.get_text(strip=True) if vendor_anounces else "Non disponible"
-
-        # Temps de présence du vendeur
-        vendor_presence_raw = soup.select_one("div.profile-card__content p.member-since span")
-        vendor_presence_raw = vendor_presence_raw.get_text(strip=True) if vendor_presence_raw else "Non disponible"
-        vendor_presence = vendor_presence_raw.split("\xa0")[-1].strip() if vendor_presence_raw != "Non disponible" else "Non disponible"
-
-        # Caractéristiques du produit
-        characteristics = soup.select("div.details-characteristics ul li")
-        details = []
-        for charac in characteristics:
-            name = charac.select_one("span.label") or charac.select_one("span:not(.qt)")
-            value = charac.select_one("span.qt")
-            if name and value:
-                details.append((name.get_text(strip=True), value.get_text(strip=True)))
-        details = list(set(details))
-
-        # Images
-        slides = soup.select("div.swiper-slide")
-        image_urls = [
-            slide.get("style", "").split("url(")[1].split(")")[0].strip("'\"")
-            for slide in slides if "background-image" in slide.get("style", "") and "thumb" not in slide.get("style", "")
-        ]
+        fields = PRODUCT_FIELDS.extract(soup)
 
         return {
-            "Titre": title,
-            "Prix_normal": price,
-            "Description": description,
-            "Localisation_bien": location,
+            "Titre": fields["Titre"],
+            "Prix_normal": fields["Prix_normal"],
+            "Description": fields["Description"],
+            "Localisation_bien": fields["Localisation_bien"],
             "Lien_produit": product_url,
-            "Liens_images": image_urls,
+            "Liens_images": fields["Liens_images"],
             "Catégorie": category_name,
-            "Caractéristiques": details,
-            "Fournisseur_nom": vendor_name,
-            "Fournisseur_emplacement": vendor_location,
-            "Fournisseur_nb_annonces": vendor_anounces,
-            "Fournisseur_presence": vendor_presence
+            "Caractéristiques": fields["Caractéristiques"],
+            "Fournisseur_nom": fields["Fournisseur_nom"],
+            "Fournisseur_emplacement": fields["Fournisseur_emplacement"],
+            "Fournisseur_nb_annonces": fields["Fournisseur_nb_annonces"],
+            "Fournisseur_presence": fields["Fournisseur_presence"]
         }
 
     except AttributeError as e:
         print(f"Erreur lors de l'extraction des détails du produit {product_url} : {e}")
         return None
 
+def category_page_url(category, page):
+    """
+    URL de la page `page` de la liste des annonces d'une catégorie.
+    """
+    if page == 1:
+        return category["URL"]
+    return f"{category['URL']}?page={page}"
+
+def parse_listing_page(soup, category, base_url):
+    """
+    Extrait, pour chaque annonce de la page, les arguments de `scrape_product_details`.
+    """
+    product_links = soup.select("a.card-image.ad__card-image.waves-block.waves-light")
+    return [[f"{base_url}{link['href']}", category["Nom"]] for link in product_links]
+
+# Champs d'une carte de la page de liste (mode superficiel)
+CARD_FIELDS = extraction.Spec({
+    "Lien_produit": Field("a.card-image.ad__card-image.waves-block.waves-light", attr="href", required=True),
+    "Prix_normal": Field("p.ad__card-price"),
+    "Titre": Field("p.ad__card-description a"),
+    "Localisation_bien": Field("p.ad__card-location span"),
+})
+
+def parse_cards(soup, category, base_url):
+    """
+    Mode superficiel : produit lu sur chaque carte (prix, titre, localisation), avec les
+    arguments de `scrape_product_details` pour un passage approfondi.
+    """
+    cards = []
+    for card in soup.select("div.card.ad__card"):
+        try:
+            fields = CARD_FIELDS.extract(card)
+        except AttributeError as e:
+            print(f"Erreur lors de l'extraction d'une carte produit : {e}")
+            continue
+        product_url = f"{base_url}{fields['Lien_produit']}"
+        card = {**fields, "Lien_produit": product_url, "Catégorie": category["Nom"]}
+        cards.append(([product_url, category["Nom"]], card))
+    return cards
+
 def scrape_products_from_category(category, base_url):
     """
     Récupère les détails de tous les produits d'une catégorie donnée en itérant sur les pages.
     S'arrête lorsque une page n'a plus de produits.
     """
-    category_name = category["Nom"]
-    category_url = category["URL"]
-    all_products = []
-
-    for page in range(1, 1000):  # Ajustez la limite si nécessaire
-        if page == 1:
-            url = category_url
-        else:
-            url = f"{category_url}?page={page}"
-        print(f"Scraping page : {url}")
-        response = requests.get(url)
-
-        if response.status_code != 200:
-            print(f"Erreur lors de l'accès à la page {page} de la catégorie '{category_name}' : {url}")
-            break
-
-        soup = BeautifulSoup(response.content, "html.parser")
-
-        # Vérifier si la page est vide
-        product_links = soup.select("a.card-image.ad__card-image.waves-block.waves-light")
-
-        if not product_links:
-            print(f"Aucun produit trouvé sur la page {page}. Fin du scraping pour cette catégorie.")
-            break
-        
-        # Paralléliser le scrap des produits de cette page
-        product_urls = [f"{base_url}{link['href']}" for link in product_links]
-
-        # Filter the links that are not in the urls_file
-        with open ("./files/urls_file.txt", "r", encoding="utf-8") as urls_file:
-            previous_links = list(set([line.strip() for line in urls_file.readlines() if "coinafrique" in line]))
-        product_urls = [product_url for product_url in product_urls if product_url not in previous_links]
-        
-        # On lance plusieurs threads pour récupérer les détails des produits
-        with ThreadPoolExecutor(max_workers=5) as executor:
-            futures = [executor.submit(scrape_product_details, p_url, category_name) for p_url in product_urls]
-            for future in as_completed(futures):
-                product_details = future.result()
-                if product_details:
-                    all_products.append(product_details)
-        
-        # Mise à jour du fichier urls_file.txt pour les nouveaux liens scrappés
-        with open("./files/urls_file.txt", "a", encoding="utf-8") as uf:
-            for link in product_urls:
-                uf.write(link + "\n")
-    return all_products
+    # Les pages de liste alimentent en continu un pool de workers (voir pipeline.py)
+    return pipeline.crawl_category(sys.modules[__name__], category, base_url)
 
 def main_coin_afrique(base_url):
-    output_dir = "Produits_coin_afrique"
-    if not os.path.exists(output_dir):
-        os.makedirs(output_dir)
-
     categories = get_categories(base_url)
     if not categories:
         print("Aucune catégorie trouvée.")
-        return
+        return pd.DataFrame()
 
+    def scrape_category(category):
+        # Une catégorie déjà terminée par une exécution interrompue est relue depuis le journal
+        print(f"Scraping produits de la catégorie : {category['Nom']}")
+        products = scrape_products_from_category(category, base_url)
+        print(f"Nombre de produits scrapés pour la catégorie {category['Nom']} : {len(products)}")
+        return products
 
-    for category in categories:
-        category_file = f"Produits_coin_afrique/{category['Nom']}.jsonl"
-        if os.path.exists(category_file):
-            print(f"La catégorie '{category['Nom']}' a déjà été scrappée. Elle sera donc ignorée.")
-            continue
-        else:
-            print(f"Scraping produits de la catégorie : {category['Nom']}")
-            products = scrape_products_from_category(category, base_url)
-            print(f"Nombre de produits scrapés pour la catégorie {category['Nom']} : {len(products)}")
-
-            # Sauvegarde en JSONL
-            with open(category_file, "w", encoding="utf-8") as f:
-                for product in products:
-                    json_line = json.dumps(product, ensure_ascii=False)
-                    f.write(json_line + "\n")
-
-    if os.path.exists(output_dir):
-        os.removedirs(output_dir)
-    # Une fois toutes les catégories traitées, fusionner tous les fichiers JSONL en un seul DataFrame
+    # Plusieurs catégories sont scrappées en même temps, résultats dans l'ordre des catégories
     data = []
-    category_files = [f for f in os.listdir("Produits_coin_afrique") if f.endswith(".jsonl")]
-
-    for cf in category_files:
-        file_path = os.path.join("Produits_coin_afrique/", cf)
-        with open(file_path, "r", encoding="utf-8") as f:
-            for line in f:
-                record = json.loads(line.strip())
-                data.append(record)
+    for products in pipeline.crawl_categories(categories, scrape_category):
+        data.extend(products)
 
     df = pd.DataFrame(data)
-    return df
\ No newline at end of file
+    return df
@@ -1,22 +1,38 @@
-from bs4 import BeautifulSoup
-import requests
-import numpy as np
+from scrapping_scripts import extraction, fingerprints, html_parsers, http_cache, http_session, pipeline
+from scrapping_scripts.extraction import Field
 import pandas as pd
-import os
-import json
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import sys
+
+# Clé du site dans les URLs (sert aussi de clé dans l'index des URLs déjà vues)
+SITE_KEY = "iliko"
+# Nombre maximum de pages parcourues par catégorie
+MAX_PAGES = 299
+# Seules ces balises sont construites lors du parsing des pages de liste
+LISTING_ONLY = "div.single-product-details"
+# Arrêter la pagination dès qu'une page ne contient aucun nouveau produit (voir pipeline.KNOWN_PAGES)
+KNOWN_PAGES = 1
+# Paramètres de tri ajoutés aux pages de liste (voir pipeline.listing_url) : vide, le tri
+# par défaut du site liste déjà les produits les plus récentes en premier
+SORT_PARAMS = {}
 
 def get_categories(base_url):
     """
     Récupère toutes les catégories et leurs URLs depuis la page des catégories.
     """
     url = f"{base_url}/categories"
-    response = requests.get(url)
-    if response.status_code != 200:
+    categories = http_cache.cached_parse(
+        url, "categories", lambda content: parse_categories(html_parsers.make_soup(content, SITE_KEY, stage="categories"), base_url)
+    )
+    if categories is None:
         print(f"Erreur lors de l'accès à la page des catégories : {url}")
         return []
-    
-    soup = BeautifulSoup(response.content, "html.parser")
+    return categories
+
+
+def parse_categories(soup, base_url):
+    """
+    Extrait les catégories (nom et URL) de la page des catégories.
+    """
     categories = []
 
     # Récupérer toutes les catégories
@@ -37,129 +53,83 @@ def scrape_product_details(product_url, category_name, base_url):
     """
     Récupère les détails d'un produit en visitant sa page.
     """
-    response = requests.get(product_url)
+    response = http_session.fetch(product_url)
     if response.status_code != 200:
         print(f"Erreur lors de l'accès au produit : {product_url}")
         return None
 
-    soup = BeautifulSoup(response.content, "html.parser")
-
+    soup = html_parsers.make_soup(response.content, SITE_KEY)
+    product = parse_product_details(soup, product_url, category_name, base_url)
+    return fingerprints.tag(product, soup, CONTENT_REGION)
+
+
+# Champs de la page produit (sélecteurs compilés une seule fois, à l'import)
+PRODUCT_FIELDS = extraction.Spec({
+    # Titre du produit
+    "Titre": Field("div.details span", required=True),
+    # Prix normal et prix barré
+    "Prix_normal": Field("div.details span.h3.font-weight-normal.text-accent"),
+    "Prix_barré": Field("div.details strike", default=None),
+    # État du bien
+    "État": Field("span.gtm_ads_content_quality", default="Non spécifié"),
+    # Nombre d'étoiles
+    "Évaluation (étoiles)": Field("span.d-inline-block.align-middle.mt-1.mr-md-2.mr-sm-0.pr-2"),
+    # Nombre d'avis
+    "Nombre_avis": Field("span.font-for-tab.d-inline-block", post=lambda reviews: reviews.replace("Avis", "").strip()),
+    # Fournisseur
+    "Fournisseur_profil": Field("div.ml-3 > span[style*='font-weight: 700']"),
+    # Lien vers l'image
+    "Liens_images": Field("div.details img", attr="src"),
+})
+# Région utile des pages produit, pour leur empreinte (voir fingerprints.py)
+CONTENT_REGION = PRODUCT_FIELDS.selector()
+
+def parse_product_details(soup, product_url, category_name, base_url):
+    """
+    Extrait les détails d'un produit à partir de sa page déjà téléchargée.
+    """
     try:
-        # Titre du produit
-        title = soup.select_one("div.details span").get_text(strip=True)
-
-        # Prix normal et prix barré
-        price_normal_el = soup.select_one("div.details span.h3.font-weight-normal.text-accent")
-        price_normal = price_normal_el.get_text(strip=True) if price_normal_el else "Non disponible"
-
-        price_discounted_el = soup.select_one("div.details strike")
-        price_discounted = price_discounted_el.get_text(strip=True) if price_discounted_el else None
-
-        # État du bien
-        condition_el = soup.select_one("span.gtm_ads_content_quality")
-        condition = condition_el.get_text(strip=True) if condition_el else "Non spécifié"
-
-        # Nombre d'étoiles
-        star_el = soup.select_one("span.d-inline-block.align-middle.mt-1.mr-md-2.mr-sm-0.pr-2")
-        star_rating = star_el.get_text(strip=True) if star_el else "Non disponible"
-
-        # Nombre d'avis
-        reviews_el = soup.select_one("span.font-for-tab.d-inline-block")
-        reviews = reviews_el.get_text(strip=True).replace("Avis", "").strip() if reviews_el else "Non disponible"
-
-        # Fournisseur
-        vendor_el = soup.select_one("div.ml-3 > span[style*='font-weight: 700']")
-        vendor = vendor_el.get_text(strip=True) if vendor_el else "Non disponible"
-
-        # Lien vers l'image
-        image_el = soup.select_one("div.details img")
-        image_url = image_el["src"] if image_el else "Non disponible"
+        fields = PRODUCT_FIELDS.extract(soup)
 
         return {
-            "Titre": title,
-            "Prix_normal": price_normal,
+            "Titre": fields["Titre"],
+            "Prix_normal": fields["Prix_normal"],
             "Lien_produit": product_url,
-            "Prix_barré": price_discounted,
-            "État": condition,
-            "Évaluation (étoiles)": star_rating,
-            "Nombre_avis": reviews,
-            "Liens_images": image_url,
+            "Prix_barré": fields["Prix_barré"],
+            "État": fields["État"],
+            "Évaluation (étoiles)": fields["Évaluation (étoiles)"],
+            "Nombre_avis": fields["Nombre_avis"],
+            "Liens_images": fields["Liens_images"],
             "Catégorie": category_name,
-            "Fournisseur_profil": vendor
+            "Fournisseur_profil": fields["Fournisseur_profil"]
         }
     except AttributeError as e:
         print(f"Erreur lors de l'extraction des détails du produit {product_url} : {e}")
         return None
 
 
+def category_page_url(category, page):
+    """
+    URL de la page `page` de la liste des produits d'une catégorie.
+    """
+    return f"{category['URL']}&page={page}"
+
+
+def parse_listing_page(soup, category, base_url):
+    """
+    Extrait, pour chaque produit de la page, les arguments de `scrape_product_details`.
+    """
+    product_links = soup.select("div.single-product-details div.text-left a")
+    return [[link.get("href", ""), category["Nom"], base_url] for link in product_links]
+
+
 def scrape_products_from_category(category, base_url):
     """
     Récupère les détails de tous les produits d'une catégorie donnée en visitant leur page respective,
     en parallélisant le scraping des détails produits.
     """
-    category_name = category["Nom"]
-    category_url = category["URL"]
-    all_products = []
-
-    # S'assurer que le fichier urls_file.txt existe (pour éviter les erreurs si on l'utilise)
-    for page in range(1, 300):  # Ajustez la limite si nécessaire
-        url = f"{category_url}&page={page}"
-        print(f"Scraping page : {url}")
-        response = requests.get(url)
-
-        if response.status_code != 200:
-            print(f"Erreur lors de l'accès à la page {page} de la catégorie '{category_name}' : {url}")
-            break
-
-        soup = BeautifulSoup(response.content, "html.parser")
-
-        # Vérifier si la page est vide
-        product_links = soup.select("div.single-product-details div.text-left a")
-        if not product_links:
-            print(f"Aucun produit trouvé sur la page {page}. Fin du scraping pour cette catégorie.")
-            break
-        
-        # Filtrer les liens déjà scrappés
-        with open("./files/urls_file.txt", "r", encoding="utf-8") as urls_file:
-            previous_links = set(line.strip() for line in urls_file if "iliko" in line)
-
-        filtered_links = []
-        for link in product_links:
-            product_url = link.get("href", "")
-            # Vérifier si déjà dans previous_links
-            if product_url not in previous_links:
-                filtered_links.append(link)
-
-        # Si aucun nouveau lien n'est trouvé sur cette page, on peut sortir
-        if not filtered_links:
-            print(f"Aucun nouveau produit sur la page {page}. Fin du scraping pour cette catégorie.")
-            break
-
-        # Parallélisation du scraping des détails produits
-        new_products = []
-        with ThreadPoolExecutor(max_workers=5) as executor:
-            future_to_url = {
-                executor.submit(
-                    scrape_product_details,
-                    link["href"], 
-                    category_name, 
-                    base_url
-                ): link["href"] for link in filtered_links
-            }
-
-            for future in as_completed(future_to_url):
-                product_details = future.result()
-                if product_details:
-                    new_products.append(product_details)
-
-        # Mise à jour du fichier urls_file.txt pour les nouveaux liens scrappés
-        with open("./files/urls_file.txt", "a", encoding="utf-8") as uf:
-            for link in filtered_links:
-                uf.write(link["href"] + "\n")
-
-        all_products.extend(new_products)
-
-    return all_products
+    # Les pages de liste alimentent en continu un pool de workers (voir pipeline.py)
+    return pipeline.crawl_category(sys.modules[__name__], category, base_url)
 
 
 def main_iliko(base_url):
@@ -172,12 +142,13 @@ def main_iliko(base_url):
         print("Aucune catégorie trouvée.")
         return pd.DataFrame()  # Renvoie un DataFrame vide si aucune catégorie
 
-    all_products = []
-
-    # Parcourir chaque catégorie
-    for category in categories:
+    def scrape_category(category):
         print(f"Scraping produits de la catégorie : {category['Nom']}")
-        products = scrape_products_from_category(category, base_url)
+        return scrape_products_from_category(category, base_url)
+
+    # Parcourir plusieurs catégories en même temps, résultats dans l'ordre des catégories
+    all_products = []
+    for products in pipeline.crawl_categories(categories, scrape_category):
         all_products.extend(products)
 
     # Sauvegarder/convertir les données dans un DataFrame final
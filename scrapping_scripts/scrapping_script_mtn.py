@@ -1,49 +1,57 @@
-import os
-import json
-import requests
+from scrapping_scripts import extraction, html_parsers, http_cache, http_session, journal, pipeline, sink, url_store
+from scrapping_scripts.extraction import Field
 import pandas as pd
-import numpy as np
-from bs4 import BeautifulSoup
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor
+
+# Clé du site dans les URLs (sert aussi de clé dans l'index des URLs déjà vues)
+SITE_KEY = "mtn"
+# Une seule page : la page d'accueil liste tous les produits
+MAX_PAGES = 1
+# Seules ces balises sont construites lors du parsing des pages de liste
+LISTING_ONLY = "div.product-card-container.product-item-card.col-lg-3.col-6"
+# Toutes les informations sont sur les cartes produit, pas de page de détail à visiter
+DETAIL_PAGES = False
+
+# Champs d'une carte produit (sélecteurs compilés une seule fois, à l'import)
+PRODUCT_FIELDS = extraction.Spec({
+    # URL du produit
+    "Lien_produit": Field("a.product-card.shawdow-card.h-100", attr="href", required=True),
+    # Titre du produit
+    "Titre": Field("div.product-card-details h3", required=True),
+    # Disponibilité du produit
+    "Disponibilité": Field("div.alert.alert-danger.text-center.font-14.out-of-stock", default="NA"),
+    # Prix normal
+    "Prix_normal": Field("div.product-card-pricing span.woocommerce-Price-amount", required=True),
+    # Prix réduit (le prix normal s'il n'y en a pas)
+    "Prix_barré": Field("div.product-promo-price span.woocommerce-Price-amount", default=None),
+    # Taux de réduction
+    "Réduction_proposée": Field("div.product-promotion-percentage", default="0%"),
+    # Catégorie
+    "Catégorie": Field("div.product-card-header-cat span", required=True),
+    # Fournisseur
+    "Fournisseur_profil": Field("div.product-card-footer span:nth-of-type(2)", required=True),
+    # URL image
+    "Liens_images": Field("div.product-card-header-image img", attr="src", required=True),
+})
 
 def parse_single_product(product):
     """
     Extrait les informations d'un produit à partir de l'objet 'product' (balise HTML).
     """
     try:
-        # URL du produit
-        product_url = product.select_one("a.product-card.shawdow-card.h-100")["href"]
-        # Titre du produit
-        title = product.select_one("div.product-card-details h3").get_text(strip=True)
-        # Disponibilité du produit
-        availability = product.select_one("div.alert.alert-danger.text-center.font-14.out-of-stock")
-        availability_text = availability.get_text(strip=True) if availability else "NA"
-        # Prix normal
-        price_normal = product.select_one("div.product-card-pricing span.woocommerce-Price-amount").get_text(strip=True)
-        # Prix réduit
-        price_discounted = product.select_one("div.product-promo-price span.woocommerce-Price-amount")
-        price_discounted = price_discounted.get_text(strip=True) if price_discounted else price_normal
-        # Taux de réduction
-        discount = product.select_one("div.product-promotion-percentage")
-        discount = discount.get_text(strip=True) if discount else "0%"
-        # Catégorie
-        category = product.select_one("div.product-card-header-cat span").get_text(strip=True)
-        # Fournisseur
-        vendor = product.select_one("div.product-card-footer span:nth-of-type(2)").get_text(strip=True)
-        # URL image
-        image_url = product.select_one("div.product-card-header-image img")["src"]
+        fields = PRODUCT_FIELDS.extract(product)
 
         # Construire le dictionnaire des détails du produit
         product_details = {
-            "Titre": title,
-            "Prix_normal": price_normal,
-            "Prix_barré": price_discounted,
-            "Réduction_proposée": discount,
-            "Lien_produit": product_url,
-            "Liens_images": image_url,
-            "Catégorie": category,
-            "Disponibilité": availability_text,
-            "Fournisseur_profil": vendor,
+            "Titre": fields["Titre"],
+            "Prix_normal": fields["Prix_normal"],
+            "Prix_barré": fields["Prix_barré"] if fields["Prix_barré"] is not None else fields["Prix_normal"],
+            "Réduction_proposée": fields["Réduction_proposée"],
+            "Lien_produit": fields["Lien_produit"],
+            "Liens_images": fields["Liens_images"],
+            "Catégorie": fields["Catégorie"],
+            "Disponibilité": fields["Disponibilité"],
+            "Fournisseur_profil": fields["Fournisseur_profil"],
         }
         return product_details
 
@@ -55,59 +63,76 @@ def parse_single_product(product):
         return None
 
 
+def category_page_url(category, page):
+    """
+    Le site n'a pas de catégories : tous les produits sont sur la page d'accueil.
+    """
+    return category["URL"]
+
+
+def parse_listing_page(soup, category, base_url):
+    """
+    Retourne [lien, balise produit] pour chaque produit listé sur la page.
+    Les détails sont ensuite extraits de la balise par `parse_single_product`.
+    """
+    product_args = []
+    products = soup.select("div.product-card-container.product-item-card.col-lg-3.col-6:not(.highlighted-products)")
+    for product in products:
+        product_tag = product.select_one("a.product-card.shawdow-card.h-100")
+        if product_tag:
+            product_args.append([product_tag.get("href"), product])
+    return product_args
+
+
 def scrape_product_details(base_url):
     """
     Récupère les détails des produits listés sur la page de base (base_url).
     Parallélise le parsing des produits individuels.
     """
-    response = requests.get(base_url)
+    site_journal = journal.get_journal(SITE_KEY)
+    if site_journal.page_done(None, 1):
+        # Page validée par une exécution interrompue : ses produits sont dans le journal
+        print("Page déjà traitée, produits relus depuis le journal.")
+        return [] if sink.is_open() else site_journal.products()
+
+    response = http_cache.fetch(base_url, "listing")
     if response.status_code != 200:
         print(f"Erreur lors de l'accès à la page : {base_url}")
         return []
+    if response.not_modified and response.parsed is not None:
+        # Page inchangée depuis sa dernière validation : tous ses produits sont déjà connus
+        print("Page inchangée depuis le dernier passage, aucun nouveau produit.")
+        return []
 
-    soup = BeautifulSoup(response.content, "html.parser")
+    soup = html_parsers.make_soup(response.content, SITE_KEY, only=LISTING_ONLY, stage="listing")
 
     # Récupérer tous les produits
-    products = soup.select("div.product-card-container.product-item-card.col-lg-3.col-6:not(.highlighted-products)")
+    product_args = parse_listing_page(soup, {"Nom": None, "URL": base_url}, base_url)
 
-    if not products:
+    if not product_args:
         print("Aucun produit trouvé sur cette page.")
         return []
 
-    # Lire les anciens liens du fichier urls_file.txt
-    with open("./files/urls_file.txt", "r", encoding="utf-8") as urls_file:
-        previous_links = set(line.strip() for line in urls_file if "mtn" in line)
+    # Index des liens déjà scrappés
+    seen_urls = url_store.get_store(SITE_KEY)
 
     # Filtrer les produits dont le lien a déjà été scrappé
-    filtered_products = []
-    for product in products:
-        product_tag = product.select_one("a.product-card.shawdow-card.h-100")
-        if product_tag:
-            product_url = product_tag.get("href")
-            if product_url not in previous_links:
-                filtered_products.append(product)
+    claimed = set(seen_urls.claim_many(args[0] for args in product_args))
+    filtered_args = [args for args in product_args if args[0] in claimed]
 
-    if not filtered_products:
+    if not filtered_args:
+        http_cache.get_cache().store_parsed(base_url, len(product_args))
         print("Aucun nouveau produit à scraper sur cette page.")
         return []
 
-    all_products = []
-
     # Paralléliser le parsing de chaque produit
-    with ThreadPoolExecutor(max_workers=5) as executor:
-        futures = [executor.submit(parse_single_product, prod) for prod in filtered_products]
-        for future in as_completed(futures):
-            product_data = future.result()
-            if product_data:
-                all_products.append(product_data)
-
-    # Mettre à jour urls_file.txt pour ne pas re-scraper les mêmes produits
-    with open("./files/urls_file.txt", "a", encoding="utf-8") as uf:
-        for product in filtered_products:
-            url_ = product.select_one("a.product-card.shawdow-card.h-100")["href"]
-            uf.write(url_ + "\n")
-
-    return all_products
+    with ThreadPoolExecutor(max_workers=http_session.POOL_SIZE) as executor:
+        products = list(executor.map(parse_single_product, (product for _, product in filtered_args)))
+
+    # Valider la page dans le journal, puis mettre à jour l'index pour ne pas re-scraper les mêmes produits
+    pipeline.commit_page(SITE_KEY, None, 1, filtered_args, products, base_url, len(product_args))
+
+    return [] if sink.is_open() else site_journal.products()
 
 
 def main_mtn(base_url):
@@ -1,21 +1,36 @@
-import os
-import requests
+import sys
+from scrapping_scripts import extraction, fingerprints, html_parsers, http_cache, http_session, pipeline
+from scrapping_scripts.extraction import Field
 import pandas as pd
-from bs4 import BeautifulSoup
-import numpy as np
-from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# Clé du site dans les URLs (sert aussi de clé dans l'index des URLs déjà vues)
+SITE_KEY = "toutvendu"
+# Nombre maximum de pages parcourues par catégorie
+MAX_PAGES = 299
+# Seules ces balises sont construites lors du parsing des pages de liste
+LISTING_ONLY = "div.col-lg-2.col-md-3.col-xs-6"
+# Paramètres de tri ajoutés aux pages de liste (voir pipeline.listing_url) : vide, le tri
+# par défaut du site liste déjà les annonces les plus récentes en premier
+SORT_PARAMS = {}
 
 def get_categories(base_url):
     """
     Récupère toutes les catégories et leurs URLs depuis la page des catégories.
     """
-    url = f"{base_url}/parcategorie"
-    response = requests.get(base_url)
-    # if response.status_code != 200:
+    categories = http_cache.cached_parse(
+        base_url, "categories", lambda content: parse_categories(html_parsers.make_soup(content, SITE_KEY, stage="categories"), base_url)
+    )
+    # if categories is None:
     #     print(f"Erreur lors de l'accès à la page des catégories : {base_url}")
     #     return []
-    
-    soup = BeautifulSoup(response.content, "html.parser")
+    return categories or []
+
+
+def parse_categories(soup, base_url):
+    """
+    Extrait les catégories (nom et URL) de la page des catégories.
+    """
+    url = f"{base_url}/parcategorie"
     categories = []
 
     # Récupérer toutes les catégories
@@ -34,134 +49,112 @@ def scrape_product_details(product_url, category_name):
     """
     Récupère les détails d'un produit en visitant sa page.
     """
-    response = requests.get(product_url)
+    response = http_session.fetch(product_url)
     if response.status_code != 200:
         print(f"Erreur lors de l'accès au produit : {product_url}")
         return None
 
-    soup = BeautifulSoup(response.content, "html.parser")
-
+    soup = html_parsers.make_soup(response.content, SITE_KEY)
+    product = parse_product_details(soup, product_url, category_name)
+    return fingerprints.tag(product, soup, CONTENT_REGION)
+
+# Champs de la page produit (sélecteurs compilés une seule fois, à l'import)
+PRODUCT_FIELDS = extraction.Spec({
+    # Titre du produit
+    "Titre": Field("h4.product-name a", required=True),
+    # Prix normal (aucun prix barré mentionné dans votre HTML)
+    "Prix_normal": Field("b[style='color:blue']", required=True),
+    # Description du produit
+    "Description": Field("p.product-desc", required=True),
+    # Catégorie
+    "Catégorie": Field("ul.list-unstyled.product_info.mtb_20 li:nth-of-type(1) span a", required=True),
+    # Code Produit
+    "Code_produit": Field(
+        "ul.list-unstyled.product_info.mtb_20 li:nth-of-type(2) span", required=True,
+        post=lambda code: code.replace("#produit ", ""),
+    ),
+    # Étiquette (ex. : "Stock limité")
+    "Etiquette": Field("ul.product_info li:nth-of-type(3) span", required=True),
+    # Texte livraison
+    "Livraison": Field("div.tab-pane.active.pt_20", required=True),
+    # Image produit
+    "Liens_images": Field("a.thumbnails img", attr="src", default="Non Disponible"),
+})
+# Région utile des pages produit, pour leur empreinte (voir fingerprints.py)
+CONTENT_REGION = PRODUCT_FIELDS.selector()
+
+def parse_product_details(soup, product_url, category_name):
+    """
+    Extrait les détails d'un produit à partir de sa page déjà téléchargée.
+    """
     try:
-        # Titre du produit
-        title = soup.select_one("h4.product-name a").get_text(strip=True)
-
-        # Prix normal (aucun prix barré mentionné dans votre HTML)
-        price_normal = soup.select_one("b[style='color:blue']").get_text(strip=True)
-
-        # Description du produit
-        description = soup.select_one("p.product-desc").get_text(strip=True)
-
-        # Catégorie
-        category = soup.select_one("ul.list-unstyled.product_info.mtb_20 li:nth-of-type(1) span a").get_text(strip=True)
-
-        # Code Produit
-        product_code = (
-            soup.select_one("ul.list-unstyled.product_info.mtb_20 li:nth-of-type(2) span")
-            .get_text(strip=True)
-            .replace("#produit ", "")
-        )
-
-        # Étiquette (ex. : "Stock limité")
-        tag = soup.select_one("ul.product_info li:nth-of-type(3) span").get_text(strip=True)
-
-        # Texte livraison
-        shipping = soup.select_one("div.tab-pane.active.pt_20").get_text(strip=True)
-
-        # Image produit
-        image_el = soup.select_one("a.thumbnails img")
-        image_url = image_el["src"] if image_el else "Non Disponible"
+        fields = PRODUCT_FIELDS.extract(soup)
 
         return {
-            "Titre": title,
-            "Prix_normal": price_normal,
-            "Description": description,
-            "Code_produit": product_code,
-            "Etiquette": tag,
-            "Livraison": shipping,
+            "Titre": fields["Titre"],
+            "Prix_normal": fields["Prix_normal"],
+            "Description": fields["Description"],
+            "Code_produit": fields["Code_produit"],
+            "Etiquette": fields["Etiquette"],
+            "Livraison": fields["Livraison"],
             "Lien_produit": product_url,
-            "Liens_images": image_url,
-            "Catégorie": category,
+            "Liens_images": fields["Liens_images"],
+            "Catégorie": fields["Catégorie"],
         }
 
     except AttributeError as e:
         print(f"Erreur lors de l'extraction des détails du produit {product_url} : {e}")
         return None
 
+def category_page_url(category, page):
+    """
+    URL de la page `page` de la liste des produits d'une catégorie.
+    """
+    if page == 1:
+        return category["URL"]
+    return f"{category['URL']}/{page}"
+
+def parse_listing_page(soup, category, base_url):
+    """
+    Extrait, pour chaque produit de la page, les arguments de `scrape_product_details`.
+    """
+    product_args = []
+    for product in soup.select("div.col-lg-2.col-md-3.col-xs-6 div.single-product"):
+        link_el = product.select_one("a[href*='/details']")
+        if link_el:
+            product_args.append([f"{base_url}{link_el['href']}", category["Nom"]])
+    return product_args
+
+# Champs d'une carte de la page de liste (mode superficiel)
+CARD_FIELDS = extraction.Spec({
+    "Lien_produit": Field("a[href*='/details']", attr="href", required=True),
+    "Titre": Field("h4.product-name a"),
+    "Prix_normal": Field("b[style='color:blue']"),
+})
+
+def parse_cards(soup, category, base_url):
+    """
+    Mode superficiel : produit lu sur chaque carte (titre et prix), avec les arguments de
+    `scrape_product_details` pour un passage approfondi.
+    """
+    cards = []
+    for product in soup.select("div.col-lg-2.col-md-3.col-xs-6 div.single-product"):
+        try:
+            fields = CARD_FIELDS.extract(product)
+        except AttributeError:
+            continue
+        product_url = f"{base_url}{fields['Lien_produit']}"
+        card = {**fields, "Lien_produit": product_url, "Catégorie": category["Nom"]}
+        cards.append(([product_url, category["Nom"]], card))
+    return cards
+
 def scrape_products_from_category(category, base_url):
     """
     Récupère les détails de tous les produits d'une catégorie donnée en visitant leur page respective.
     Parallélise le scraping des détails produits.
     """
-    category_name = category["Nom"]
-    category_url = category["URL"]
-    all_products = []
-
-    # S'assurer que le fichier urls_file.txt existe pour éviter les erreurs
-    for page in range(1, 300):  # Ajustez la limite si nécessaire
-        if page == 1:
-            url = category_url
-        else:
-            url = f"{category_url}/{page}"
-        
-        print(f"Scraping page : {url}")
-        response = requests.get(url)
-
-        if response.status_code != 200:
-            print(f"Erreur lors de l'accès à la page {page} de la catégorie '{category_name}' : {url}")
-            break
-
-        soup = BeautifulSoup(response.content, "html.parser")
-
-        # Vérifier si la page est vide
-        products = soup.select("div.col-lg-2.col-md-3.col-xs-6 div.single-product")
-        if not products:
-            print(f"Aucun produit trouvé sur la page {page}. Fin du scraping pour cette catégorie.")
-            break
-
-        # Lecture des liens déjà scrappés
-        with open("./files/urls_file.txt", "r", encoding="utf-8") as urls_file:
-            previous_links = set(line.strip() for line in urls_file if "toutvendu" in line)
-
-        # Filtrer les produits déjà scrappés
-        filtered_products = []
-        for product in products:
-            link_el = product.select_one("a[href*='/details']")
-            if link_el:
-                full_url = f"{base_url}{link_el['href']}"
-                if full_url not in previous_links:
-                    filtered_products.append(product)
-
-        if not filtered_products:
-            print(f"Aucun nouveau produit sur la page {page} pour la catégorie '{category_name}'.")
-            # Vous pouvez `break` pour arrêter de scraper cette catégorie ou continuer à la page suivante
-            # break  # <-- Décommentez si vous souhaitez arrêter quand il n'y a plus de nouveaux produits
-
-        # Paralléliser l'appel à scrape_product_details pour chacun des produits
-        new_products = []
-        from concurrent.futures import ThreadPoolExecutor, as_completed
-        with ThreadPoolExecutor(max_workers=5) as executor:
-            futures = {}
-            for product in filtered_products:
-                link_el = product.select_one("a[href*='/details']")
-                product_url = f"{base_url}{link_el['href']}"
-                futures[executor.submit(scrape_product_details, product_url, category_name)] = product_url
-
-            for future in as_completed(futures):
-                product_url = futures[future]
-                result = future.result()
-                if result:
-                    new_products.append(result)
-
-        # Mise à jour du fichier urls_file.txt avec les nouveaux liens scrappés
-        with open("./files/urls_file.txt", "a", encoding="utf-8") as uf:
-            for product in filtered_products:
-                link_el = product.select_one("a[href*='/details']")
-                product_url = f"{base_url}{link_el['href']}"
-                uf.write(product_url + "\n")
-
-        all_products.extend(new_products)
-
-    return all_products
+    # Les pages de liste alimentent en continu un pool de workers (voir pipeline.py)
+    return pipeline.crawl_category(sys.modules[__name__], category, base_url)
 
 def main_tout_vendu(base_url):
     """
@@ -172,12 +165,13 @@ def main_tout_vendu(base_url):
         print("Aucune catégorie trouvée.")
         return pd.DataFrame()
 
-    all_products = []
-
-    # Parcourir chaque catégorie
-    for category in categories:
+    def scrape_category(category):
         print(f"Scraping produits de la catégorie : {category['Nom']}")
-        products = scrape_products_from_category(category, base_url)
+        return scrape_products_from_category(category, base_url)
+
+    # Parcourir plusieurs catégories en même temps, résultats dans l'ordre des catégories
+    all_products = []
+    for products in pipeline.crawl_categories(categories, scrape_category):
         all_products.extend(products)
 
     # Conversion finale en DataFrame
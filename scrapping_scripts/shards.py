@@ -0,0 +1,70 @@
+"""
+Crawl réparti sur plusieurs noeuds (`scrapping.py --shard i/N`).
+
+Chaque noeud parcourt toutes les pages de liste, mais ne scrape que les produits de
+son shard : une URL produit appartient au shard `hash(url) % N`, avec un hash stable
+(blake2b, identique sur toutes les machines, contrairement à `hash()`). Le filtre est
+appliqué à la réservation des liens (`url_store.UrlStore.claim_many`), pour tous les
+moteurs de crawl.
+
+Un noeud garde son état (journal, cache HTTP, frontière, copie de l'index des URLs) et
+ses sorties dans files/shards/<i>-of-<N>/ : produits scrappés, en DataFrames picklés qui
+gardent leurs types et leurs listes. `scrapping.py --merge-shards N` fusionne ensuite les
+sorties des N shards dans le jeu de données principal, sans doublons de Lien_produit, et
+leurs index dans l'index principal. `scrapping.py --local-shards N` lance les N shards en
+local, côte à côte, puis les fusionne.
+"""
+import hashlib
+import os
+
+SHARDS_DIR = "./files/shards"
+
+# Shard du processus courant : INDEX parmi COUNT (un seul shard : pas de répartition)
+INDEX = 0
+COUNT = 1
+
+
+def parse(value):
+    """
+    "i/N" -> (i, N).
+    """
+    index, _, count = value.partition("/")
+    try:
+        index, count = int(index), int(count)
+    except ValueError:
+        raise ValueError(f"shard invalide : {value!r} (attendu : i/N)")
+    if count < 1 or not 0 <= index < count:
+        raise ValueError(f"shard invalide : {value!r} (il faut 0 <= i < N)")
+    return index, count
+
+
+def configure(index, count):
+    """
+    Limite le processus (et les workers qu'il lance) aux URLs du shard `index` parmi `count`.
+    """
+    global INDEX, COUNT
+    INDEX, COUNT = index, count
+
+
+def directory(index=None, count=None):
+    """
+    Dossier de l'état et des sorties d'un shard (par défaut celui du processus).
+    """
+    if index is None:
+        index, count = INDEX, COUNT
+    return os.path.join(SHARDS_DIR, f"{index}-of-{count}")
+
+
+def shard_of(url, count):
+    """
+    Numéro du shard de `url` parmi `count` shards.
+    """
+    digest = hashlib.blake2b(url.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big") % count
+
+
+def owns(url):
+    """
+    Vrai si `url` appartient au shard du processus.
+    """
+    return COUNT == 1 or shard_of(url, COUNT) == INDEX
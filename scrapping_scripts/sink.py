@@ -0,0 +1,107 @@
+"""
+Écriture des produits au fil de l'eau, par lots.
+
+Sans sink, chaque scraper garde tous ses produits en mémoire jusqu'à la fin du site,
+puis Crawler.scrap concatène tous les sites avant d'écrire : la mémoire grandit avec
+le catalogue et un crash en cours de route perd tout. Quand un sink est ouvert
+(`start`), les produits d'une page de liste lui sont envoyés (`emit`) dès que la page est
+validée dans le journal, au lieu d'être gardés : ils sont mis en tampon et écrits dès que
+le lot atteint `batch_size` produits. La mémoire reste bornée par la taille d'un lot, et
+les produits d'un lot perdu dans un crash sont réécrits depuis le journal à la reprise.
+
+Le sink est propre au processus (un par worker avec --parallel-sites) et partagé par
+tous les threads et la boucle asyncio du processus.
+"""
+import threading
+
+# Nombre de produits écrits à la fois
+BATCH_SIZE = 200
+
+_lock = threading.Lock()
+_sink = None
+
+
+class ProductSink:
+    """
+    Tampon de produits vidé par lots dans `write_batch`.
+
+    parameters :
+        - write_batch (callable): fonction appelée avec une liste de produits (dict)
+        - batch_size (int): nombre de produits par lot
+    """
+
+    def __init__(self, write_batch, batch_size=BATCH_SIZE):
+        self.write_batch = write_batch
+        self.batch_size = batch_size
+        self.count = 0
+        self._buffer = []
+        # Un seul lot écrit à la fois, les autres threads continuent de remplir le tampon
+        self._buffer_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+
+    def write(self, product):
+        with self._buffer_lock:
+            self._buffer.append(product)
+            if len(self._buffer) < self.batch_size:
+                return
+            batch, self._buffer = self._buffer, []
+        self._write(batch)
+
+    def flush(self):
+        with self._buffer_lock:
+            batch, self._buffer = self._buffer, []
+        if batch:
+            self._write(batch)
+
+    def _write(self, batch):
+        with self._write_lock:
+            self.write_batch(batch)
+            self.count += len(batch)
+
+
+def start(write_batch, batch_size=BATCH_SIZE):
+    """
+    Ouvre le sink du processus : les produits envoyés à `emit` ne sont plus gardés en mémoire.
+    """
+    global _sink
+    with _lock:
+        _sink = ProductSink(write_batch, batch_size)
+        return _sink
+
+
+def close():
+    """
+    Écrit le dernier lot et ferme le sink du processus.
+
+    return :
+        - count (int) : nombre de produits écrits par le sink (0 s'il n'était pas ouvert)
+    """
+    global _sink
+    with _lock:
+        sink, _sink = _sink, None
+    if sink is None:
+        return 0
+    sink.flush()
+    return sink.count
+
+
+def is_open():
+    """
+    Vrai si un sink est ouvert dans le processus.
+    """
+    return _sink is not None
+
+
+def emit(product):
+    """
+    Envoie un produit au sink du processus.
+
+    return :
+        - bool : True si le produit a été pris par le sink, False si aucun sink n'est
+          ouvert (l'appelant garde alors le produit, comme avant)
+    """
+    sink = _sink
+    if sink is None:
+        return False
+    sink.write(product)
+    return True
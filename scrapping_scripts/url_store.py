@@ -0,0 +1,214 @@
+"""
+Index persistant des URLs déjà scrappées, par site.
+
+Remplace la relecture de files/urls_file.txt à chaque page de liste. Les URLs sont
+stockées dans une base SQLite (files/urls.sqlite), clé (site, url). L'index d'un site
+est chargé une seule fois par exécution dans un set (recherche en O(1)), et les
+nouveaux liens sont ajoutés par lots, un lot par page.
+
+Un lien trouvé sur une page de liste est d'abord seulement réservé (`claim_many`, en
+mémoire) : il n'est enregistré comme vu (`add_many`) qu'une fois son produit validé
+dans le journal (voir journal.py). Avec --shard, seuls les liens du shard du processus
+sont réservés (voir shards.py), dans une copie de l'index propre au shard (`import_index`).
+
+Les liens scrappés en mode superficiel (`--shallow`, produit lu sur sa carte) sont aussi
+gardés avec les arguments de leur page produit (table card_urls), jusqu'à ce qu'un
+passage approfondi (`--deep`) les complète.
+"""
+import json
+import os
+import sqlite3
+import threading
+import datetime as dt
+
+from scrapping_scripts import metrics, shards
+
+DB_PATH = "./files/urls.sqlite"
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def _connect(db_path):
+    conn = sqlite3.connect(db_path, timeout=60, check_same_thread=False)
+    # WAL : plusieurs processus (un par site) peuvent écrire dans la même base
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(
+        "CREATE TABLE IF NOT EXISTS seen_urls ("
+        " site TEXT NOT NULL,"
+        " url TEXT NOT NULL,"
+        " first_seen TEXT NOT NULL,"
+        " PRIMARY KEY (site, url)"
+        ") WITHOUT ROWID;"
+        "CREATE TABLE IF NOT EXISTS card_urls ("
+        " site TEXT NOT NULL,"
+        " url TEXT NOT NULL,"
+        " args TEXT NOT NULL,"
+        " PRIMARY KEY (site, url)"
+        ") WITHOUT ROWID;"
+    )
+    return conn
+
+
+class UrlStore:
+    """
+    URLs déjà vues pour un site. S'utilise comme un set : `url in store`.
+    """
+
+    def __init__(self, site_key, db_path=DB_PATH):
+        self.site_key = site_key
+        self._lock = threading.Lock()
+        self._conn = _connect(db_path)
+        rows = self._conn.execute("SELECT url FROM seen_urls WHERE site = ?", (site_key,))
+        self._seen = {row[0] for row in rows}
+        # Liens en cours de scraping dans cette exécution, pas encore enregistrés
+        self._claimed = set()
+
+    def __contains__(self, url):
+        return url in self._seen or url in self._claimed
+
+    def __len__(self):
+        return len(self._seen)
+
+    def claim_many(self, urls):
+        """
+        Réserve les liens ni vus ni déjà réservés, et les retourne : deux catégories
+        qui listent le même produit ne le scrappent qu'une fois. Les liens des autres
+        shards ne sont pas réservés.
+        """
+        urls = list(dict.fromkeys(urls))
+        with self._lock:
+            new_urls = [url for url in urls if url not in self]
+            hits = len(urls) - len(new_urls)
+            new_urls = [url for url in new_urls if shards.owns(url)]
+            self._claimed.update(new_urls)
+        metrics.inc("dedup_hits_total", hits, site=self.site_key)
+        return new_urls
+
+    def add_many(self, urls):
+        """
+        Enregistre un lot d'URLs en une seule transaction.
+        """
+        now = dt.datetime.now().isoformat(timespec="seconds")
+        with self._lock:
+            new_urls = [url for url in dict.fromkeys(urls) if url not in self._seen]
+            if not new_urls:
+                return
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO seen_urls (site, url, first_seen) VALUES (?, ?, ?)",
+                    [(self.site_key, url, now) for url in new_urls],
+                )
+            self._seen.update(new_urls)
+            self._claimed.difference_update(new_urls)
+
+    def add_cards(self, cards):
+        """
+        Garde les liens lus seulement sur leur carte, avec les arguments de leur page produit.
+
+        parameters :
+            - cards (iterable): (url, arguments de scrape_product_details)
+        """
+        rows = [(self.site_key, url, json.dumps(args, ensure_ascii=False)) for url, args in cards]
+        with self._lock, self._conn:
+            self._conn.executemany("INSERT OR REPLACE INTO card_urls (site, url, args) VALUES (?, ?, ?)", rows)
+
+    def cards(self, urls=None):
+        """
+        Liens lus seulement sur leur carte (tous, ou ceux de `urls`).
+
+        return :
+            - cards (dict) : {url: arguments de scrape_product_details}
+        """
+        with self._lock:
+            rows = self._conn.execute("SELECT url, args FROM card_urls WHERE site = ?", (self.site_key,)).fetchall()
+        if urls is not None:
+            urls = set(urls)
+            rows = [(url, args) for url, args in rows if url in urls]
+        return {url: json.loads(args) for url, args in rows}
+
+    def drop_cards(self, urls):
+        """
+        Les produits de ces liens ont été complétés par un passage approfondi.
+        """
+        with self._lock, self._conn:
+            self._conn.executemany("DELETE FROM card_urls WHERE site = ? AND url = ?",
+                                   [(self.site_key, url) for url in urls])
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def get_store(site_key):
+    """
+    Retourne l'index du site, chargé au premier appel puis partagé par tous les threads.
+    """
+    with _stores_lock:
+        if site_key not in _stores:
+            _stores[site_key] = UrlStore(site_key, DB_PATH)
+        return _stores[site_key]
+
+
+def close_all():
+    """
+    Ferme les index ouverts par le processus courant.
+    """
+    with _stores_lock:
+        for store in _stores.values():
+            store.close()
+        _stores.clear()
+
+
+def import_urls_file(path, site_keys, db_path=DB_PATH):
+    """
+    Importe un ancien urls_file.txt dans l'index (une URL par ligne, le site est
+    déduit de la clé présente dans l'URL). Retourne le nombre de lignes importées.
+    """
+    if not os.path.exists(path):
+        return 0
+    now = dt.datetime.now().isoformat(timespec="seconds")
+    rows = []
+    with open(path, "r", encoding="utf-8") as urls_file:
+        for line in urls_file:
+            url = line.strip()
+            for site_key in site_keys:
+                if site_key in url:
+                    rows.append((site_key, url, now))
+                    break
+    conn = _connect(db_path)
+    with conn:
+        conn.executemany("INSERT OR IGNORE INTO seen_urls (site, url, first_seen) VALUES (?, ?, ?)", rows)
+    conn.close()
+    return len(rows)
+
+
+def import_index(source, db_path=None):
+    """
+    Ajoute à l'index les liens vus et les cartes d'un autre index (copie de l'index
+    principal pour un shard, puis fusion de l'index du shard). Retourne le nombre de liens ajoutés.
+    """
+    db_path = db_path or DB_PATH
+    if not os.path.exists(source):
+        return 0
+    conn = _connect(db_path)
+    with conn:
+        conn.execute("ATTACH DATABASE ? AS source", (source,))
+        added = conn.execute(
+            "INSERT OR IGNORE INTO seen_urls SELECT site, url, first_seen FROM source.seen_urls"
+        ).rowcount
+        conn.execute("INSERT OR IGNORE INTO card_urls SELECT site, url, args FROM source.card_urls")
+    conn.execute("DETACH DATABASE source")
+    conn.close()
+    return added
+
+
+def reset(db_path=None):
+    """
+    Supprime l'index (utilisé par Crawler.reset).
+    """
+    db_path = db_path or DB_PATH
+    close_all()
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)